@@ -1,6 +1,7 @@
 import Fiche from "../models/Fiche.js";
 import LevelService from "../services/levelService.js";
 import StudySession from "../models/StudySession.js";
+import { aiServiceHeaders, callAiJob, deadlineHeader } from "../utils/aiJobs.js";
 
 export const getFilteredFiches = async (req, res) => {
     try{
@@ -118,18 +119,8 @@ export const generateFiche = async(req, res) => {
         
         console.log('📡 Calling FastAPI at:', FASTAPI_URL);
         
-        // Add timeout for FastAPI call
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 60000); // 60 second timeout
-        
-        const response = await fetch(FASTAPI_URL, {
-            method: "POST",
-            headers: {"Content-Type": "application/json"},
-            body: JSON.stringify({domain, difficulty, text}),
-            signal: controller.signal
-        });
-        
-        clearTimeout(timeoutId);
+        // Runs as an AI service job, so a timeout here does not lose the generation
+        const response = await callAiJob(FASTAPI_URL, {domain, difficulty, text}, 60000, aiServiceHeaders(req.userId)); // 60 second timeout
         
         console.log('📡 FastAPI Response:', {
             status: response.status,
@@ -140,6 +131,11 @@ export const generateFiche = async(req, res) => {
         if (!response.ok) {
             const errorText = await response.text();
             console.error('❌ FastAPI Error Response:', errorText);
+            // 429 when the AI service queue is full: tell the client when to retry
+            const retryAfter = response.headers.get("retry-after");
+            if (retryAfter) {
+                res.set("Retry-After", retryAfter);
+            }
             return res.status(response.status).json({ 
                 error: `FastAPI service error: ${response.statusText}`,
                 details: errorText
@@ -262,6 +258,7 @@ export const generateFiche = async(req, res) => {
     }
 }
 const FAST_API="http://127.0.0.1:8000/evaluate-fiche"
+const EVALUATION_TIMEOUT_MS = 60000;
 export const evaluateFiche = async(req, res) => {
     try {
         console.log('🚀 Starting fiche evaluation...');
@@ -274,8 +271,13 @@ export const evaluateFiche = async(req, res) => {
         console.log('🔄 Calling FastAPI backend...');
         const response = await fetch(FAST_API, {
             method: "POST",
-            headers: {"Content-Type": "application/json"},
-            body: JSON.stringify({fiche_content})
+            headers: {
+                "Content-Type": "application/json",
+                ...aiServiceHeaders(req.userId),
+                ...deadlineHeader(EVALUATION_TIMEOUT_MS)
+            },
+            body: JSON.stringify({fiche_content}),
+            signal: AbortSignal.timeout(EVALUATION_TIMEOUT_MS)
         });
         
         console.log('📡 FastAPI Response status:', response.status);
@@ -357,6 +359,12 @@ export const evaluateFiche = async(req, res) => {
             message: error.message,
             stack: error.stack?.split('\n').slice(0, 3).join('\n') // Limit stack trace
         });
+
+        if (error.name === 'TimeoutError') {
+            return res.status(408).json({
+                error: "Request timeout - FastAPI took too long to respond"
+            });
+        }
         
         res.status(500).json({
             error: error.message || "Error evaluating fiche",
@@ -2,6 +2,7 @@ import Quiz from "../models/Quiz.js"
 import Fiche from "../models/Fiche.js"
 import LevelService from "../services/levelService.js";
 import StudySession from "../models/StudySession.js";
+import { aiServiceHeaders, callAiJob } from "../utils/aiJobs.js";
 export const getQuiz=async(req,res)=>{
     const {ficheId,quizId}=req.params;
     try{
@@ -62,32 +63,25 @@ export const createQuiz = async (req, res) => {
         const fiche_content = fiche.content;
         
         
-        // Increased timeout to 2 minutes for quiz generation
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 120000); // 2 minutes timeout
-        
         try {
-            const response = await fetch(FASTAPI_URL, {
-                method: "POST",
-                headers: { 
-                    "Content-Type": "application/json"
-                },
-                body: JSON.stringify({ 
-                    fiche_id, 
-                    fiche_content, 
-                    fiche_title, 
-                    question_count, 
-                    difficulty 
-                }),
-                signal: controller.signal
-            });
-            
-            clearTimeout(timeoutId);
+            // Runs as an AI service job with a 2 minute wait; a retry picks up the same job
+            const response = await callAiJob(FASTAPI_URL, { 
+                fiche_id, 
+                fiche_content, 
+                fiche_title, 
+                question_count, 
+                difficulty 
+            }, 120000, aiServiceHeaders(userId));
             
             const data = await response.json();
             
             if (!response.ok) {
                 console.error("FastAPI Error:", data);
+                // 429 when the AI service queue is full: tell the client when to retry
+                const retryAfter = response.headers.get("retry-after");
+                if (retryAfter) {
+                    res.set("Retry-After", retryAfter);
+                }
                 return res.status(response.status).json({ 
                     message: data.error || data.detail || "Failed to generate quiz from AI service" 
                 });
@@ -157,8 +151,6 @@ export const createQuiz = async (req, res) => {
 
             
         } catch (fetchError) {
-            clearTimeout(timeoutId);
-            
             // Handle fetch-specific errors
             if (fetchError.name === 'AbortError') {
                 console.error("FastAPI request timed out after 2 minutes");
@@ -0,0 +1,71 @@
+const POLL_INTERVAL_MS = 1000;
+
+// Identify the user to the AI service, which shares its queue fairly between
+// users; requests a user is waiting on go ahead of batch work
+export const aiServiceHeaders = (userId, priority = "interactive") => ({
+    "X-User-Id": String(userId),
+    "X-Priority": priority
+});
+
+// Tells the AI service when we stop waiting, so it can abandon the
+// generation instead of finishing an answer nobody will read
+export const deadlineHeader = (timeoutMs) => ({
+    "X-Request-Deadline": String(Date.now() + timeoutMs)
+});
+
+const jsonResponse = (body, status = 200) =>
+    new Response(JSON.stringify(body), {
+        status,
+        headers: { "Content-Type": "application/json" }
+    });
+
+// Calls a long AI service endpoint in job mode: the POST returns a job ID at
+// once and the job is polled until its result is ready. If we time out, the
+// generation keeps running, and retrying the same payload joins the same job
+// instead of starting a new one. The deadline only bounds the submission:
+// jobs run to completion. If job mode is off the AI service answers directly
+// and gives up at the deadline. Resolves to a Response like fetch() does and
+// rejects with an AbortError after timeoutMs.
+export const callAiJob = async (url, body, timeoutMs, headers = {}) => {
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), timeoutMs);
+
+    try {
+        const response = await fetch(url, {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+                "Prefer": "respond-async",
+                ...deadlineHeader(timeoutMs),
+                ...headers
+            },
+            body: JSON.stringify(body),
+            signal: controller.signal
+        });
+
+        // Job mode is off on the AI service: it answered directly
+        if (response.status !== 202) {
+            return response;
+        }
+
+        const { status_url } = await response.json();
+        const statusUrl = new URL(status_url, url);
+
+        while (true) {
+            await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+            const poll = await fetch(statusUrl, { signal: controller.signal });
+            if (!poll.ok) {
+                return poll;
+            }
+            const job = await poll.json();
+            if (job.status === "done") {
+                return jsonResponse(job.result);
+            }
+            if (job.status === "failed") {
+                return jsonResponse({ error: job.error }, 502);
+            }
+        }
+    } finally {
+        clearTimeout(timeoutId);
+    }
+};
@@ -0,0 +1,269 @@
+"""
+Benchmark: quiz and evaluation prompts with and without extractive pre-summarization.
+
+Usage (from ai-services/):
+    python benchmarks/extractiveSummaryBench.py [--runs 3] [--output results.json]
+    python benchmarks/extractiveSummaryBench.py --host http://localhost:11434 [--model NAME]
+
+For long synthetic fiches (repeated paragraphs included) it builds the quiz
+and whole-fiche evaluation requests with EXTRACTIVE_SUMMARY_ENABLED off and
+on, and reports the CPU time of the summary, the estimated prompt tokens,
+the prompt tokens the server evaluated, the end-to-end latency, and for
+quizzes the share valid at the first attempt and of valid questions.
+
+Without --host the requests go to benchmarks/fakeOllama.py, run in this
+process, whose latency grows with the prompt (--prompt-token-latency) but
+whose quizzes are always valid: the validation rate is only meaningful
+against a real model.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+TOPICS = {
+    "Photosynthesis": [
+        "Photosynthesis converts light energy into chemical energy stored in glucose.",
+        "The light-dependent reactions take place in the thylakoid membranes.",
+        "Photosystem II splits water molecules and releases oxygen as a by-product.",
+        "ATP synthase uses the proton gradient to produce ATP.",
+        "NADPH carries the high-energy electrons to the Calvin cycle.",
+        "The Calvin cycle fixes carbon dioxide in the stroma of the chloroplast.",
+        "RuBisCO is the enzyme that attaches CO2 to ribulose bisphosphate.",
+        "C4 and CAM plants limit photorespiration in hot and dry climates.",
+    ],
+    "Cellular respiration": [
+        "Cellular respiration releases the energy stored in glucose as ATP.",
+        "Glycolysis splits glucose into two pyruvate molecules in the cytoplasm.",
+        "The Krebs cycle oxidizes acetyl-CoA in the mitochondrial matrix.",
+        "The electron transport chain pumps protons across the inner membrane.",
+        "Oxygen is the final electron acceptor and forms water.",
+        "Aerobic respiration yields about 30 to 32 ATP per glucose molecule.",
+        "Without oxygen, fermentation regenerates NAD+ so glycolysis can continue.",
+        "Lactic acid fermentation happens in muscle cells during intense effort.",
+    ],
+    "DNA replication": [
+        "DNA replication is semi-conservative: each new molecule keeps one parent strand.",
+        "Helicase unwinds the double helix at the replication fork.",
+        "Primase lays down short RNA primers for DNA polymerase.",
+        "DNA polymerase III extends new strands in the 5' to 3' direction.",
+        "The lagging strand is synthesized as Okazaki fragments.",
+        "DNA ligase joins the Okazaki fragments into a continuous strand.",
+        "Proofreading by DNA polymerase keeps the error rate around one in a billion.",
+        "Telomerase extends chromosome ends in germ cells and stem cells.",
+    ],
+    "Enzymes": [
+        "Enzymes are biological catalysts that lower the activation energy of reactions.",
+        "The substrate binds to the enzyme's active site.",
+        "The induced fit model describes how the active site adjusts to the substrate.",
+        "Temperature and pH change enzyme activity and can denature the protein.",
+        "Competitive inhibitors compete with the substrate for the active site.",
+        "Non-competitive inhibitors bind elsewhere and change the enzyme's shape.",
+        "Cofactors such as metal ions are required by many enzymes.",
+        "The Michaelis constant Km is the substrate concentration at half of Vmax.",
+    ],
+}
+
+EXPLANATIONS = [
+    "In other words, {fact_lower}",
+    "Students often forget that {fact_lower}",
+    "A typical exam question checks that {fact_lower}",
+    "To remember it, note that {fact_lower}",
+]
+
+
+def make_fiche(repeat):
+    """A long Markdown fiche: every fact, restated `repeat` times, plus copy-pasted reminders."""
+    parts = ["# Cell Biology Review"]
+    for topic, facts in TOPICS.items():
+        parts.append(f"## {topic}")
+        parts.append("\n".join(f"- **{fact.split()[0]}**: {fact}" for fact in facts[:3]))
+        for round_ in range(repeat):
+            template = EXPLANATIONS[round_ % len(EXPLANATIONS)]
+            parts.append(" ".join(
+                template.format(fact_lower=fact[0].lower() + fact[1:]) for fact in facts
+            ))
+            # The same reminder pasted after every explanation
+            parts.append(f"Remember: {facts[0]}")
+    return "\n\n".join(parts)
+
+
+FICHES = {"medium": make_fiche(4), "long": make_fiche(10), "very long": make_fiche(24)}
+
+
+def counter(snapshot, name):
+    return snapshot.get(name, 0)
+
+
+async def measure_quiz(content, use_summary, args):
+    from src.llm import extractiveSummary
+    from src.llm.stats import stats
+    from src.llm.textChunker import estimate_tokens
+    from src.Quiz.createQuiz import LlamaQuizGenerator
+
+    extractiveSummary.EXTRACTIVE_SUMMARY_ENABLED = use_summary
+    extractiveSummary.summarize.cache_clear()
+    started = time.perf_counter()
+    generator = LlamaQuizGenerator(args.questions, "medium", content, "Cell Biology Review", "bench")
+    summary_ms = (time.perf_counter() - started) * 1e3
+    prompt_tokens = estimate_tokens("".join(m["content"] for m in generator.get_messages()))
+
+    before = stats.snapshot()
+    started = time.perf_counter()
+    quiz = json.loads(await generator.generate_quiz(use_cache=False))
+    latency = time.perf_counter() - started
+    after = stats.snapshot()
+    attempts = sum(counter(after, f"quiz.{mode}.attempts") - counter(before, f"quiz.{mode}.attempts")
+                   for mode in ("schema", "prompt"))
+    valid = sum(1 for question in quiz.get("questions", []) if generator.validate_question(question)[0])
+    return {
+        "summary_ms": summary_ms,
+        "prompt_tokens": prompt_tokens,
+        "prompt_eval_count": counter(after, "llm.prompt_eval_count") - counter(before, "llm.prompt_eval_count"),
+        "latency_s": latency,
+        "first_attempt_valid": attempts == 1 and not generator.fell_back,
+        "valid_questions": min(valid, args.questions) / args.questions,
+    }
+
+
+async def measure_evaluation(content, use_summary):
+    from src.evaluation.evaluateFiche import LLamaEvaluateFiche
+    from src.llm import extractiveSummary
+    from src.llm.stats import stats
+    from src.llm.textChunker import estimate_tokens
+
+    extractiveSummary.EXTRACTIVE_SUMMARY_ENABLED = use_summary
+    extractiveSummary.summarize.cache_clear()
+    started = time.perf_counter()
+    evaluator = LLamaEvaluateFiche(content)
+    summary_ms = (time.perf_counter() - started) * 1e3
+    prompt_tokens = estimate_tokens("".join(m["content"] for m in evaluator.get_messages()))
+
+    before = stats.snapshot()
+    started = time.perf_counter()
+    evaluation = await evaluator.evaluateFiche(use_cache=False)
+    latency = time.perf_counter() - started
+    after = stats.snapshot()
+    return {
+        "summary_ms": summary_ms,
+        "prompt_tokens": prompt_tokens,
+        "prompt_eval_count": counter(after, "llm.prompt_eval_count") - counter(before, "llm.prompt_eval_count"),
+        "latency_s": latency,
+        "score": evaluation["qualityScore"]["score"],
+    }
+
+
+def summarize_rows(rows):
+    summary = {}
+    for field in rows[0]:
+        values = [float(row[field]) for row in rows]
+        summary[field] = statistics.mean(values)
+    return summary
+
+
+async def run(args):
+    from src.llm.ollamaClient import close_llm_client
+    from src.llm.textChunker import estimate_tokens
+
+    results = []
+    try:
+        for name, content in FICHES.items():
+            for kind in ("quiz", "evaluation"):
+                for use_summary in (False, True):
+                    rows = []
+                    for _ in range(args.runs):
+                        if kind == "quiz":
+                            rows.append(await measure_quiz(content, use_summary, args))
+                        else:
+                            rows.append(await measure_evaluation(content, use_summary))
+                    row = {
+                        "fiche": name,
+                        "fiche_tokens": estimate_tokens(content),
+                        "kind": kind,
+                        "summary": "on" if use_summary else "off",
+                        **summarize_rows(rows),
+                        "runs": rows,
+                    }
+                    results.append(row)
+                    print_row(row)
+    finally:
+        await close_llm_client()
+    return results
+
+
+HEADER = (f"{'fiche':11}{'tokens':>8} {'prompt':11}{'summary':>8}{'cpu ms':>9}{'prompt tok':>12}"
+          f"{'evaluated':>11}{'latency s':>11}{'1st valid':>11}{'valid q':>9}")
+
+
+def print_row(row):
+    first_valid = f"{row['first_attempt_valid'] * 100:.0f}%" if "first_attempt_valid" in row else "-"
+    valid = f"{row['valid_questions'] * 100:.0f}%" if "valid_questions" in row else "-"
+    print(f"{row['fiche']:11}{row['fiche_tokens']:>8} {row['kind']:11}{row['summary']:>8}{row['summary_ms']:>9.1f}"
+          f"{row['prompt_tokens']:>12.0f}{row['prompt_eval_count']:>11.0f}{row['latency_s']:>11.2f}"
+          f"{first_valid:>11}{valid:>9}", file=sys.__stdout__, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", help="Ollama server to measure; the fake server when omitted")
+    parser.add_argument("--model", help="model to use on --host (default: LLM_MODEL)")
+    parser.add_argument("--runs", type=int, default=3, help="requests per fiche, prompt and setting")
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--token-latency", type=float, default=0.002, help="fake server: seconds per generated token")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.001, help="fake server: seconds per prompt token")
+    parser.add_argument("--verbose", action="store_true", help="show the service's own output")
+    parser.add_argument("--output", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    fake = None
+    if args.host:
+        os.environ["OLLAMA_HOSTS"] = args.host
+    else:
+        from fakeOllama import FakeOllama
+
+        fake = FakeOllama(token_latency=args.token_latency, prompt_token_latency=args.prompt_token_latency)
+        os.environ["OLLAMA_HOSTS"] = fake.start()
+    if args.model:
+        os.environ["LLM_MODEL"] = args.model
+    # Configuration is read at import time; every request must reach the model
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+    os.environ["EVALUATION_INCREMENTAL"] = "false"
+    # Read the whole stream so the server's prompt_eval_count is recorded
+    os.environ["LLM_STOP_AT_JSON_END"] = "false"
+
+    try:
+        print(HEADER, flush=True)
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            results = asyncio.run(run(args))
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    from src.llm.config import MODEL_NAME, QUIZ_CONTENT_TOKENS, EVALUATION_CONTENT_TOKENS
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "config": {
+                    "host": args.host or "fake",
+                    "model": MODEL_NAME,
+                    "runs": args.runs,
+                    "questions": args.questions,
+                    "quiz_content_tokens": QUIZ_CONTENT_TOKENS,
+                    "evaluation_content_tokens": EVALUATION_CONTENT_TOKENS,
+                },
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Stand-in Ollama server for offline benchmarks; needs no GPU, model or network.
+
+Usage (from ai-services/):
+    python benchmarks/fakeOllama.py [--port 11434] [--token-latency 0.002]
+        [--malformed-rate 0.2] [--malformations fence,comment,trailing_comma,truncate]
+        [--prompt-token-latency 0.0005] [--prompt-cache-slots 4]
+
+It answers /api/chat (streaming or not), /api/embed, /api/tags and
+/api/version, plus /fake/counters with what it served. The reply is chosen from the prompt: a quiz with the
+requested number of questions, an evaluation (whole, per section or from
+an outline), the review of a fiche it just wrote, chunk notes or a fiche.
+Replies are paced at --token-latency seconds per token (4 characters) and
+prompts at --prompt-token-latency. Like Ollama's prompt cache, the server
+keeps the last --prompt-cache-slots conversations (prompt and reply) and
+only evaluates the part of a prompt past their longest common prefix.
+A --malformed-rate share of unconstrained JSON replies gets one of the
+--malformations; replies to schema (`format`) requests are always valid.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CHARS_PER_TOKEN = 4
+MALFORMATIONS = ("fence", "comment", "trailing_comma", "truncate")
+
+FICHE = {
+    "title": "Photosynthesis: how plants turn \"light\" into sugar",
+    "content": (
+        "# Photosynthesis\n\n## Key Concepts\n"
+        "- **Light reactions**: the thylakoids split water and produce ATP and NADPH\n"
+        "- **Calvin cycle**: the stroma fixes CO2 into sugars\n\n"
+        "## Detailed Explanation\n"
+        + "Chlorophyll absorbs red and blue light; it's the energy source of the whole process. " * 6
+        + "\n\n## Examples\n- Leaves in sunlight\n- Algae in a pond\n\n"
+        "## Summary\nLight energy becomes **chemical energy** stored in glucose."
+    ),
+    "classification": {
+        "domain": "biology",
+        "difficulty": "medium",
+        "topics": ["photosynthesis", "chlorophyll", "calvin cycle"],
+        "estimatedStudyTime": 25
+    }
+}
+
+EVALUATION = {
+    "title": "Photosynthesis",
+    "classification": {
+        "domain": "biology",
+        "difficulty": "medium",
+        "topics": ["photosynthesis", "energy"],
+        "estimatedStudyTime": 20
+    },
+    "qualityScore": {
+        "score": 78,
+        "criteria": {"clarity": 21, "coherence": 19, "completeness": 18, "structure": 20},
+        "feedback": "Clear structure; the \"Examples\" section could go deeper."
+    }
+}
+
+SECTION_EVALUATION = {
+    "criteria": {"clarity": 21, "coherence": 20, "completeness": 18, "structure": 20},
+    "feedback": "Clear and well organised; one more example would help."
+}
+
+NOTES = (
+    "- **Photosynthesis** stores light energy as glucose\n"
+    "- Light reactions: water is split, O2 released, ATP and NADPH produced\n"
+    "- Calvin cycle: CO2 fixed by RuBisCO into G3P\n"
+)
+
+
+def quiz(question_count, difficulty):
+    return {
+        "title": "MCQ - Photosynthesis",
+        "fiche": "bench",
+        "questions": [
+            {
+                "question": f"Question {i + 1}: which statement about the \"light reactions\" is correct?",
+                "options": [f"They make ATP ({i})", "They fix CO2", "They need no light", "They happen in the nucleus"],
+                "correctAnswer": f"They make ATP ({i})",
+                "explanation": "It's the thylakoid's job: light drives ATP synthesis.",
+                "difficulty": difficulty,
+                "points": 1
+            }
+            for i in range(question_count)
+        ],
+        "config": {
+            "timeLimit": 60,
+            "passingScore": 70,
+            "shuffleQuestions": True,
+            "showCorrectAnswers": True,
+            "allowRetries": True
+        }
+    }
+
+
+def embed(text, dimensions=64):
+    """Deterministic bag-of-words vector, so similar texts get similar embeddings."""
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dimensions] += 1.0
+    return vector
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, obj, status=200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, obj):
+        data = (json.dumps(obj) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self.send_json({"models": [{"name": self.config.model, "model": self.config.model}]})
+        elif self.path.startswith("/api/version"):
+            self.send_json({"version": "0.0.0-fake"})
+        elif self.path.startswith("/fake/counters"):
+            # Not part of the Ollama API: lets a harness read what was served
+            with self.config._lock:
+                self.send_json(dict(self.config.counters))
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.config.count("requests")
+        if self.path.startswith("/api/embed"):
+            inputs = body.get("input", "")
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.send_json({"model": body.get("model"), "embeddings": [embed(t) for t in inputs]})
+        elif self.path.startswith("/api/chat"):
+            try:
+                self.chat(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up on the call, e.g. the loser of a hedged request
+                self.config.count("client_disconnects")
+                self.close_connection = True
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def chat(self, body):
+        messages = body.get("messages", [])
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        content = self.config.reply(messages, constrained=bool(body.get("format")))
+        options = body.get("options") or {}
+        if options.get("num_predict"):
+            content = content[:int(options["num_predict"]) * CHARS_PER_TOKEN]
+
+        cached = self.config.cached_prefix(prompt, content)
+        prompt_tokens = (len(prompt) - cached) // CHARS_PER_TOKEN
+        eval_tokens = max(1, len(content) // CHARS_PER_TOKEN)
+        final = {
+            "model": body.get("model"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_tokens * self.config.prompt_token_latency * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_tokens * self.config.token_latency * 1e9),
+        }
+        time.sleep(prompt_tokens * self.config.prompt_token_latency)
+
+        if not body.get("stream", True):
+            time.sleep(eval_tokens * self.config.token_latency)
+            self.send_json({**final, "message": {"role": "assistant", "content": content}})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i in range(0, len(content), CHARS_PER_TOKEN):
+                time.sleep(self.config.token_latency)
+                self.send_chunk({
+                    "model": body.get("model"),
+                    "created_at": final["created_at"],
+                    "message": {"role": "assistant", "content": content[i:i + CHARS_PER_TOKEN]},
+                    "done": False
+                })
+            self.send_chunk({**final, "message": {"role": "assistant", "content": ""}})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            self.config.count("cancelled_streams")
+            self.close_connection = True
+
+
+class FakeOllama:
+    """Configuration and counters of a fake Ollama server, which it can run in a thread."""
+
+    def __init__(self, token_latency=0.002, prompt_token_latency=0.0, malformed_rate=0.0,
+                 malformations=MALFORMATIONS, seed=0, model="llama3.1:latest", prompt_cache_slots=0):
+        self.token_latency = token_latency
+        self.prompt_token_latency = prompt_token_latency
+        self.prompt_cache_slots = prompt_cache_slots
+        self._prompt_cache = []
+        self.malformed_rate = malformed_rate
+        self.malformations = tuple(malformations)
+        self.model = model
+        self.counters = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def cached_prefix(self, prompt, content):
+        """
+        Characters of prompt already in a cache slot. The slot that matched best
+        then holds this conversation, reply included, unless it matched less than
+        half of the prompt: the least recently used slot is taken instead.
+        """
+        if not self.prompt_cache_slots:
+            return 0
+        with self._lock:
+            matches = [len(os.path.commonprefix([prompt, entry])) for entry in self._prompt_cache]
+            best = max(range(len(matches)), key=matches.__getitem__, default=None)
+            cached = matches[best] if best is not None else 0
+            if best is not None and 2 * cached >= len(prompt):
+                del self._prompt_cache[best]
+            elif len(self._prompt_cache) >= self.prompt_cache_slots:
+                del self._prompt_cache[0]
+            self._prompt_cache.append(f"{prompt}\n{content}")
+        self.count("prompt_cached_tokens", cached // CHARS_PER_TOKEN)
+        return cached
+
+    def reply(self, messages, constrained=False):
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        # Instructions come first; the user's text may mention anything
+        instructions = messages[0].get("content", "")[:2000] if messages else ""
+        if messages and "FICHE REVIEW" in messages[-1].get("content", ""):
+            obj = {"qualityScore": EVALUATION["qualityScore"]}
+        elif "Multiple Choice Questions" in prompt:
+            match = re.search(r"with (\d+) questions of (\w+) difficulty", prompt)
+            question_count, difficulty = (int(match.group(1)), match.group(2)) if match else (5, "medium")
+            obj = quiz(question_count, difficulty)
+        elif re.search(r"PART \d+/\d+", prompt):
+            return NOTES
+        elif "SECTION TO EVALUATE" in prompt:
+            obj = SECTION_EVALUATION
+        elif "FICHE OUTLINE" in prompt:
+            obj = {"title": EVALUATION["title"], "classification": EVALUATION["classification"]}
+        elif "evaluat" in instructions.lower():
+            obj = EVALUATION
+        else:
+            obj = FICHE
+        text = json.dumps(obj, indent=2)
+        if constrained:
+            return text
+        with self._lock:
+            if self._random.random() >= self.malformed_rate or not self.malformations:
+                return text
+            kind = self._random.choice(self.malformations)
+            cut = self._random.uniform(0.5, 0.9)
+        self.count(f"malformed.{kind}")
+        return malform(text, kind, cut)
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve in a daemon thread; returns the base URL."""
+        handler = type("Handler", (FakeOllamaHandler,), {"config": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def serve_forever(self, host="127.0.0.1", port=11434):
+        handler = type("Handler", (FakeOllamaHandler,), {"config": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def malform(text, kind, cut=0.7):
+    """Damage a JSON reply the way models typically do."""
+    if kind == "fence":
+        return "Here is the JSON you asked for:\n```json\n" + text + "\n```\nLet me know if you need changes."
+    if kind == "comment":
+        first, _, rest = text.partition("\n")
+        return first + "\n  // generated from the provided text\n" + rest
+    if kind == "trailing_comma":
+        return re.sub(r'(\S)(\n\s*[}\]])', r"\1,\2", text, count=2)
+    if kind == "truncate":
+        return text[:int(len(text) * cut)]
+    raise ValueError(f"Unknown malformation: {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds per generated token")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0, help="seconds per prompt token")
+    parser.add_argument("--prompt-cache-slots", type=int, default=0, help="conversations kept in the prompt cache")
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--malformations", default=",".join(MALFORMATIONS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default="llama3.1:latest")
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        token_latency=args.token_latency,
+        prompt_token_latency=args.prompt_token_latency,
+        malformed_rate=args.malformed_rate,
+        malformations=[m for m in args.malformations.split(",") if m],
+        seed=args.seed,
+        model=args.model,
+        prompt_cache_slots=args.prompt_cache_slots
+    )
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Micro-benchmark: src.llm.jsonRepair against the cleaners it replaced.
+
+Usage (from ai-services/):
+    python benchmarks/jsonRepairBench.py [--corpus FILE] [--output results.json]
+
+For every corpus entry each cleaner is scored on whether its output parses,
+whether it equals the expected object (when the entry has one) and how long
+it takes. A scaling run then feeds growing malformed quizzes to show how the
+cost grows with response length.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from legacyCleaners import LegacyFicheCleaner, LegacyQuizCleaner
+from src.llm.jsonRepair import clean_json_response
+
+CLEANERS = {
+    "legacy_fiche": LegacyFicheCleaner().clean_json_response,
+    "legacy_quiz": LegacyQuizCleaner().clean_json_response,
+    "jsonRepair": clean_json_response,
+}
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def time_call(func, arg, min_time=0.05):
+    """Median seconds per call over enough repetitions to fill min_time."""
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while time.perf_counter() < deadline or len(samples) < 5:
+        start = time.perf_counter()
+        func(arg)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def score(func, case):
+    try:
+        parsed = json.loads(func(case["raw"]))
+    except (json.JSONDecodeError, TypeError):
+        return False, False
+    ok = isinstance(parsed, dict) and "error" not in parsed
+    exact = case.get("expected") is not None and parsed == case["expected"]
+    return ok, exact
+
+
+def malformed_quiz(question_count):
+    question = {
+        "question": "Which statement about the \"light reactions\" is correct?",
+        "options": ["They make ATP", "They fix CO2", "They need no light", "They happen in the nucleus"],
+        "correctAnswer": "They make ATP",
+        "explanation": "It's the thylakoid's job: light drives ATP synthesis.",
+        "difficulty": "medium",
+        "points": 1
+    }
+    body = json.dumps(
+        {"title": "MCQ - Scaling", "fiche": "bench", "questions": [question] * question_count},
+        indent=2
+    )
+    # Unescaped quotes and a trailing comma force every cleaner off its fast path
+    return "```json\n" + body.replace('\\"', '"').replace('"points": 1\n', '"points": 1,\n') + "\n```"
+
+
+def run(corpus_path):
+    corpus = load_corpus(corpus_path)
+    results = {"corpus": corpus_path, "cases": [], "summary": {}, "scaling": []}
+
+    for case in corpus:
+        row = {"name": case["name"], "kind": case["kind"]}
+        for name, func in CLEANERS.items():
+            ok, exact = score(func, case)
+            row[name] = {"parsed": ok, "exact": exact, "seconds": time_call(func, case["raw"])}
+        results["cases"].append(row)
+
+    with_expected = [c for c in corpus if c.get("expected") is not None]
+    for name in CLEANERS:
+        rows = [row[name] for row in results["cases"]]
+        results["summary"][name] = {
+            "parsed": sum(r["parsed"] for r in rows),
+            "exact": sum(r["exact"] for r in rows),
+            "cases": len(rows),
+            "cases_with_expected": len(with_expected),
+            "total_seconds": sum(r["seconds"] for r in rows),
+        }
+
+    for question_count in (10, 50, 200, 800):
+        raw = malformed_quiz(question_count)
+        row = {"questions": question_count, "chars": len(raw)}
+        for name, func in CLEANERS.items():
+            row[name] = time_call(func, raw, min_time=0.2)
+        results["scaling"].append(row)
+
+    return results
+
+
+def print_report(results):
+    names = list(CLEANERS)
+    print(f"{'case':42}" + "".join(f"{n:>22}" for n in names))
+    for row in results["cases"]:
+        cells = []
+        for n in names:
+            r = row[n]
+            flag = "exact" if r["exact"] else ("ok" if r["parsed"] else "FAIL")
+            cells.append(f"{flag:>6} {r['seconds'] * 1e6:>12.1f}us")
+        print(f"{row['name']:42}" + "".join(f"{c:>22}" for c in cells))
+    print()
+    for n, s in results["summary"].items():
+        print(f"{n:14} parsed {s['parsed']}/{s['cases']}  exact {s['exact']}/{s['cases_with_expected']}"
+              f"  total {s['total_seconds'] * 1e3:.2f} ms")
+    print()
+    print(f"{'questions':>10}{'chars':>10}" + "".join(f"{n:>16}" for n in names))
+    for row in results["scaling"]:
+        print(f"{row['questions']:>10}{row['chars']:>10}" + "".join(f"{row[n] * 1e3:>14.2f}ms" for n in names))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(HERE, "corpus", "malformed_outputs.jsonl"))
+    parser.add_argument("--output", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = run(args.corpus)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
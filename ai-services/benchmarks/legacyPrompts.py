@@ -0,0 +1,236 @@
+"""
+Prompt builders as they were before prompt slimming, kept only so that
+promptSizeBench.py can compare prompt sizes and prefix reuse against them.
+"""
+
+
+class LegacyFichePrompt:
+    def __init__(self, domain, difficulty, text):
+        self.domain = domain
+        self.difficulty = difficulty
+        self.text = text
+
+    def get_domain_instruction(self):
+
+        return """
+"mathematics": "Include formulas, step-by-step solutions, and mathematical notation. Provide worked examples and common mistakes to avoid.",
+"physics": "Include physical laws, formulas, units, and real-world applications. Explain concepts with analogies and practical examples.",
+"chemistry": "Include chemical equations, molecular structures, reaction mechanisms, and laboratory applications.",
+"biology": "Include biological processes, diagrams descriptions, classification systems, and physiological functions.",
+"history": "Include dates, key figures, cause-and-effect relationships, and historical context.",
+"geography": "Include locations, geographical features, climate patterns, and human-environment interactions.",
+"literature": "Include literary devices, themes, character analysis, and historical context.",
+"philosophy": "Include key arguments, logical reasoning, different perspectives, and critical thinking approaches.",
+"computer_science": "Include algorithms, code examples, technical concepts, and practical implementations.",
+"economics": "Include economic theories, graphs, real-world applications, and current examples.",
+"law": "Include legal principles, case studies, statutory references, and practical applications.",
+"medicine": "Include anatomical references, physiological processes, symptoms, and clinical applications.",
+"psychology": "Include psychological theories, research findings, practical applications, and case studies.",
+"sociology": "Include social theories, research methods, cultural contexts, and contemporary examples.",
+"art": "Include artistic techniques, historical periods, cultural significance, and visual analysis.",
+"music": "Include musical theory, historical context, technical aspects, and listening examples.",
+"other": "Provide clear explanations, practical examples, and structured learning content."
+"""
+
+    def get_difficulty_instruction(self):
+        return """
+"easy": "Use simple language, basic concepts, and plenty of examples. Focus on fundamental understanding.",
+"medium": "Use standard academic language, intermediate concepts, and balanced theory-practice approach.",
+"hard": "Use advanced terminology, complex concepts, and detailed analysis. Include challenging examples."
+"""
+
+    def generate_prompt(self):
+        domain_instructions = self.get_domain_instruction()
+        difficulty_instructions = self.get_difficulty_instruction()
+        return f"""
+You are an expert educational content creator. Create a comprehensive study fiche based on the user's request. 
+You MUST respond with a valid JSON object only, no additional text before or after.
+
+text used to genrate the fiche is {self.text}
+DOMAIN: {self.domain}
+DIFFICULTY: {self.difficulty} 
+DOMAIN GUIDELINES: {domain_instructions}
+DIFFICULTY GUIDELINES: {difficulty_instructions}
+
+Requirements:
+- Create educational content appropriate for {self.difficulty} level
+- Focus specifically on {self.domain} subject matter
+- Include practical examples and clear explanations
+- Structure content with headers, bullet points, and sections
+- Extract 3-5 relevant topic keywords
+- Estimate study time in minutes (5-120 minutes based on content length and difficulty)
+
+RESPOND WITH ONLY THIS JSON FORMAT:
+{{
+  "title": "Clear, descriptive title (max 200 characters)",
+  "content": "Generate a well-structured educational study sheet with Markdown headings, bullet points, bold text, emojis, and code/formulas where applicable. with:\\n# Main Title\\n\\n## Key Concepts\\n- Concept 1: explanation\\n- Concept 2: explanation\\n\\n## Detailed Explanation\\nDetailed content here...\\n\\n## Examples\\n- Example 1\\n- Example 2\\n\\n## Summary\\nKey takeaways... key words in bold",
+  "classification": {{
+    "domain": "{self.domain}",
+    "difficulty": "{self.difficulty}",
+    "topics": ["topic1", "topic2", "topic3"],
+    "estimatedStudyTime": 25
+  }}
+}}
+"""
+
+
+class LegacyEvaluationPrompt:
+    def __init__(self, fiche_content):
+        self.fiche_content = fiche_content
+
+    def generate_evaluation_prompt(self):
+        return f"""You are an expert educational content evaluator with expertise across multiple academic domains. Your task is to comprehensively assess a study fiche (learning card), generate appropriate metadata, provide detailed quality feedback.
+
+FICHE CONTENT TO EVALUATE:
+{self.fiche_content}
+
+EVALUATION TASK:
+1. Generate appropriate title, domain classification, difficulty level, and topic keywords for this content
+2. Analyze the fiche quality across multiple dimensions 
+3. Provide both quantitative scores and qualitative feedback
+
+CLASSIFICATION REQUIREMENTS:
+
+TITLE GENERATION:
+- Create a clear, descriptive title (max 200 characters)
+- Should accurately reflect the main subject matter
+- Use academic but accessible language
+
+DOMAIN CLASSIFICATION (select one):
+Choose from: mathematics, physics, chemistry, biology, history, geography, literature, philosophy, computer_science, economics, law, medicine, psychology, sociology, art, music, other
+
+DIFFICULTY ASSESSMENT:
+- "easy": Basic concepts, simple language, introductory level
+- "medium": Moderate complexity, some technical terms, intermediate understanding required  
+- "hard": Advanced concepts, specialized terminology, expert-level knowledge needed
+
+TOPIC KEYWORDS:
+- Extract 3-5 specific keywords that represent main subjects covered
+- Use precise, searchable terms
+- Prioritize concepts that students would search for
+
+SCORING CRITERIA (0-25 points each, total 100):
+
+1. CLARITY (0-25 points)
+   - Language appropriateness for target difficulty level
+   - Clear definitions and explanations
+   - Logical flow of information
+   - Absence of ambiguity or confusion
+
+2. COHERENCE (0-25 points)  
+   - Internal consistency of content
+   - Logical connections between concepts
+   - Unified theme and focus
+   - Smooth transitions between sections
+
+3. COMPLETENESS (0-25 points)
+   - Coverage of essential concepts for the topic
+   - Adequate depth for declared difficulty level
+   - Inclusion of relevant examples
+   - Balance between breadth and depth
+
+4. STRUCTURE (0-25 points)
+   - Effective use of headers and organization
+   - Proper formatting and readability
+   - Logical sequence of information
+   - Clear section divisions
+
+   
+SCORING GUIDELINES:
+- Content with no educational substance should score below 30
+- Single sentences or minimal content cannot exceed 40 points
+- Medium scores (50-70) should be reserved for content with clear educational value but some deficiencies
+
+
+CRITICAL INSTRUCTIONS:
+- Respond ONLY with valid JSON
+- Do NOT use markdown code blocks
+- Do NOT add any explanatory text before or after the JSON
+- Do NOT include comments in the JSON (no // or /* */ comments)
+- Use double quotes only, never single quotes
+- Ensure all string values are properly escaped
+- Keep feedback text concise and avoid line breaks within strings
+- Numbers should be bare integers/floats, not strings
+
+RESPONSE FORMAT (must match exactly):
+{{"title": "Generated title here", "classification": {{"domain": "selected_domain", "difficulty": "assessed_difficulty", "topics": ["topic1", "topic2", "topic3"], "estimatedStudyTime": 25}}, "qualityScore": {{"score": 85, "criteria": {{"clarity": 22, "coherence": 21, "completeness": 20, "structure": 22}}, "feedback": "Detailed feedback explaining strengths, weaknesses, and improvements made}}}}
+
+
+SPECIAL INSTRUCTIONS FOR MINIMAL CONTENT:
+- If content is extremely brief or vague, still provide a complete evaluation
+- For unclear domain, use "other"
+- For minimal content, focus feedback on what's missing
+- Always generate valid JSON regardless of content quality
+
+"""
+
+
+class LegacyQuizPrompt:
+    def __init__(self, question_count, difficulty, fiche_content, fiche_title, fiche_id):
+        self.question_count = question_count
+        self.difficulty = difficulty
+        self.fiche_content = fiche_content
+        self.fiche_title = fiche_title
+        self.fiche_id = fiche_id
+
+    def generate_prompt(self):
+        return f"""You are an expert pedagogue specialized in creating high-quality Multiple Choice Questions (MCQs).
+
+STRICT RULES FOR THE MCQs:
+1. Each question must have EXACTLY 4 options
+2. ONLY ONE correct answer per question (as a String)
+3. The 3 incorrect answers must be plausible but wrong
+4. Avoid negative or ambiguous phrasing
+5. Vary the position of the correct answer
+6. Explanations must be clear and educational
+7. STRICTLY follow the required JSON format
+
+STRATEGIES FOR GOOD DISTRACTORS:
+- Use common student mistakes
+- Include partially correct answers
+- Use related but incorrect terms
+- Avoid "All of the above" or "None of the above"
+
+IMPORTANT: The output format must be compatible with the provided Mongoose model.
+
+Based on the educational content, generate an MCQ quiz with {self.question_count} questions of {self.difficulty} difficulty level.
+
+=== EDUCATIONAL CONTENT ===
+title: {self.fiche_title}
+content: {self.fiche_content}
+===========================
+
+PARAMETERS:
+- Number of questions: {self.question_count}
+- Difficulty: {self.difficulty}
+- Exactly 4 options per question
+
+MANDATORY JSON FORMAT (Mongoose-compatible):
+{{
+  "title": "MCQ - {self.fiche_title}",
+  "fiche": "{self.fiche_id}",
+  "questions": [
+    {{
+      "question": "A clear question ending with a question mark?",
+      "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
+      "correctAnswer": "Exact correct option (String)",
+      "explanation": "Detailed explanation of the correct answer",
+      "difficulty": "{self.difficulty}",
+      "points": 1
+    }}
+  ],
+  "config": {{
+    "timeLimit": 60,
+    "passingScore": 70,
+    "shuffleQuestions": true,
+    "showCorrectAnswers": true,
+    "allowRetries": true
+  }}
+}}
+
+CRITICAL: Return ONLY the JSON object, nothing else. No explanatory text before or after.
+
+Difficulty Instructions:
+- EASY: Questions about definitions and basic concepts, simple vocabulary, one concept per question
+- MEDIUM: Application and comprehension questions, combine 2-3 concepts, requires reflection  
+- HARD: Advanced analysis and synthesis questions, complex scenarios, very plausible distractors"""
@@ -0,0 +1,307 @@
+"""
+Load benchmark of the request path against the fake Ollama server; runs offline.
+
+Usage (from ai-services/):
+    python benchmarks/loadBench.py [--concurrency 1,4,16] [--requests 32]
+        [--endpoints fiche,evaluation,quiz] [--token-latency 0.002]
+        [--malformed-rate 0.2] [--backends 1] [--output results.json] [--baseline old.json]
+
+benchmarks/fakeOllama.py runs in subprocesses, one per --backends, so
+its CPU use does not skew the measurements; together they form the
+OLLAMA_HOSTS pool. The FastAPI app runs in this process and is driven
+through httpx.ASGITransport. At each concurrency level, that many clients
+send requests back to back until --requests have completed. Every request
+is unique, and the response cache and question bank are off unless --cache
+is given.
+
+For each endpoint and level the report gives req/s, p50/p95/p99 latency,
+errors, LLM attempts and retries (from the /stats counters), and the CPU
+time spent in JSON cleaning and repair. --output writes the results as
+JSON. --baseline prints the change against an earlier --output file.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+SOURCE_TEXT = (
+    "Photosynthesis converts light energy into chemical energy. In the light reactions, "
+    "the thylakoid membranes use light to split water, release oxygen and produce ATP and NADPH. "
+    "The Calvin cycle then fixes CO2 into sugars in the stroma. "
+) * 8
+
+FICHE_CONTENT = (
+    "# Photosynthesis\n\n## Key Concepts\n- **Light reactions**: produce ATP and NADPH\n"
+    "- **Calvin cycle**: fixes CO2 into sugars\n\n## Summary\nLight energy becomes chemical energy.\n"
+)
+
+
+def fiche_request(i):
+    return "/generate-fiche", {"domain": "biology", "difficulty": "medium", "text": f"{SOURCE_TEXT}\n(request {i})"}
+
+
+def evaluation_request(i):
+    return "/evaluate-fiche", {"fiche_content": f"{FICHE_CONTENT}\n(request {i})"}
+
+
+def quiz_request(i):
+    return "/create-quiz", {
+        "question_count": 5,
+        "difficulty": "medium",
+        "fiche_content": FICHE_CONTENT,
+        "fiche_title": "Photosynthesis",
+        "fiche_id": f"bench-{i}"
+    }
+
+
+ENDPOINTS = {"fiche": fiche_request, "evaluation": evaluation_request, "quiz": quiz_request}
+
+
+class ParseTimer:
+    """Thread CPU time spent in the cleaning functions the generators call."""
+
+    def __init__(self):
+        self.ns = 0
+        self.calls = 0
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            start = time.thread_time_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.ns += time.thread_time_ns() - start
+                self.calls += 1
+        return timed
+
+    def install(self):
+        from src.creation import generateFiche
+        from src.evaluation import evaluateFiche
+        from src.Quiz import createQuiz
+
+        for module in (generateFiche, evaluateFiche, createQuiz):
+            module.clean_json_response = self.wrap(module.clean_json_response)
+        createQuiz.extract_array_objects = self.wrap(createQuiz.extract_array_objects)
+
+    def reset(self):
+        self.ns = 0
+        self.calls = 0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_ollama(args, seed):
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fakeOllama.py"),
+        "--port", str(port),
+        "--token-latency", str(args.token_latency),
+        "--malformed-rate", str(args.malformed_rate),
+        "--seed", str(seed)
+    ], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/api/version", timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("fake Ollama server did not start")
+
+
+def fake_counters(url):
+    with urllib.request.urlopen(f"{url}/fake/counters", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def counter_delta(before, after, prefix):
+    return sum(v - before.get(k, 0) for k, v in after.items() if k.startswith(prefix))
+
+
+async def run_level(client, name, concurrency, total, offset):
+    build = ENDPOINTS[name]
+    latencies = []
+    errors = 0
+    next_index = iter(range(offset, offset + total))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            path, payload = build(i)
+            start = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies.append(time.perf_counter() - start)
+            body = response.json() if response.status_code == 200 else {}
+            if response.status_code != 200 or "error" in body:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+
+async def run(args):
+    import httpx
+    from main import app
+    from src.llm.stats import stats
+
+    timer = ParseTimer()
+    timer.install()
+    results = []
+    offset = 0
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name in args.endpoints:
+                for concurrency in args.concurrency:
+                    before = stats.snapshot()
+                    timer.reset()
+                    elapsed, latencies, errors = await run_level(client, name, concurrency, args.requests, offset)
+                    offset += args.requests
+                    after = stats.snapshot()
+                    attempts = counter_delta(before, after, f"{name}.schema.attempts") + \
+                        counter_delta(before, after, f"{name}.prompt.attempts")
+                    row = {
+                        "endpoint": name,
+                        "concurrency": concurrency,
+                        "requests": len(latencies),
+                        "errors": errors,
+                        "seconds": elapsed,
+                        "rps": len(latencies) / elapsed,
+                        "p50_ms": percentile(latencies, 50) * 1e3,
+                        "p95_ms": percentile(latencies, 95) * 1e3,
+                        "p99_ms": percentile(latencies, 99) * 1e3,
+                        "mean_ms": statistics.mean(latencies) * 1e3,
+                        "llm_attempts": attempts,
+                        "retries": max(0, attempts - len(latencies)),
+                        "parse_calls": timer.calls,
+                        "parse_cpu_ms": timer.ns / 1e6,
+                        "parse_cpu_ms_per_request": timer.ns / 1e6 / max(1, len(latencies)),
+                    }
+                    results.append(row)
+                    print_row(row)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+HEADER = (f"{'endpoint':12}{'conc':>6}{'req':>6}{'err':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'retries':>9}{'parse ms/req':>14}")
+
+
+def print_row(row):
+    print(f"{row['endpoint']:12}{row['concurrency']:>6}{row['requests']:>6}{row['errors']:>5}{row['rps']:>9.2f}"
+          f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['retries']:>9}"
+          f"{row['parse_cpu_ms_per_request']:>14.3f}", file=sys.__stdout__, flush=True)
+
+
+def print_comparison(results, baseline):
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nChange against {baseline.get('revision') or 'baseline'}:")
+    print(f"{'endpoint':12}{'conc':>6}{'req/s':>12}{'p95':>12}{'p99':>12}{'parse':>12}")
+    for row in results:
+        old = previous.get((row["endpoint"], row["concurrency"]))
+        if old is None:
+            continue
+
+        def change(field):
+            return f"{(row[field] / old[field] - 1) * 100:+.1f}%" if old[field] else "n/a"
+
+        print(f"{row['endpoint']:12}{row['concurrency']:>6}{change('rps'):>12}{change('p95_ms'):>12}"
+              f"{change('p99_ms'):>12}{change('parse_cpu_ms_per_request'):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=32, help="requests per endpoint and level")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--malformed-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", type=int, default=1, help="number of fake Ollama servers in the pool")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache enabled")
+    parser.add_argument("--verbose", action="store_true", help="show the service's own output")
+    parser.add_argument("--output", help="write machine-readable results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare with")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.endpoints = [e for e in args.endpoints.split(",") if e]
+
+    servers = [start_fake_ollama(args, args.seed + i) for i in range(args.backends)]
+    # Configuration is read at import time, so it must be in place before main is imported
+    os.environ["OLLAMA_HOSTS"] = ",".join(url for _, url in servers)
+    if not args.cache:
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+        os.environ["QUESTION_BANK_DB"] = ""
+    # Job mode is not exercised; this also keeps the run from creating jobs.db
+    os.environ["JOB_WORKERS"] = "0"
+    try:
+        print(HEADER, flush=True)
+        # The generators log every response; keep the report readable unless asked
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            results = asyncio.run(run(args))
+        served = [fake_counters(url) for _, url in servers]
+    finally:
+        for process, _ in servers:
+            process.terminate()
+            process.wait()
+
+    from src.llm.config import LLM_MAX_CONCURRENCY
+    report = {
+        "revision": git_revision(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "token_latency": args.token_latency,
+            "malformed_rate": args.malformed_rate,
+            "seed": args.seed,
+            "cache": args.cache,
+            "backends": args.backends,
+            "llm_max_concurrency": LLM_MAX_CONCURRENCY,
+        },
+        "fake_ollama": served,
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(results, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
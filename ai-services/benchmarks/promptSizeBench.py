@@ -0,0 +1,182 @@
+"""
+Benchmark: prompt size and reusable prefix, before and after prompt slimming.
+
+Usage (from ai-services/):
+    python benchmarks/promptSizeBench.py [--output results.json]
+    python benchmarks/promptSizeBench.py --live [--host http://localhost:11434] [--model NAME]
+
+For a spread of domains and difficulties it builds the legacy prompts
+(benchmarks/legacyPrompts.py) and the current ones and reports, per
+generator, the estimated tokens of a request and how many of them form a
+prefix shared with the previous request. Ollama keeps the KV cache of the
+last prompt, so only the tokens after the shared prefix have to be
+evaluated again.
+
+--live sends the same request sequence to an Ollama host and reports the
+prompt_eval_count and prompt_eval_duration it measured.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from legacyPrompts import LegacyFichePrompt, LegacyEvaluationPrompt, LegacyQuizPrompt
+from src.creation.generateFiche import LlamaFicheGenerator
+from src.evaluation.evaluateFiche import LLamaEvaluateFiche
+from src.llm.config import MODEL_NAME
+from src.llm.textChunker import estimate_tokens
+from src.Quiz.createQuiz import LlamaQuizGenerator
+
+SOURCE_TEXT = (
+    "Photosynthesis converts light energy into chemical energy. In the light reactions, "
+    "the thylakoid membranes use light to split water, release oxygen and produce ATP and NADPH. "
+    "The Calvin cycle then fixes CO2 into sugars in the stroma. "
+) * 6
+
+FICHE_CONTENT = (
+    "# Photosynthesis\n\n## Key Concepts\n- **Light reactions**: produce ATP and NADPH\n"
+    "- **Calvin cycle**: fixes CO2 into sugars\n\n## Summary\nLight energy becomes chemical energy.\n"
+)
+
+REQUESTS = [
+    ("biology", "easy"),
+    ("physics", "medium"),
+    ("history", "hard"),
+    ("computer_science", "medium"),
+    ("biology", "hard"),
+    ("economics", "easy"),
+]
+
+
+def legacy_messages(kind, domain, difficulty):
+    if kind == "fiche":
+        prompt = LegacyFichePrompt(domain, difficulty, SOURCE_TEXT).generate_prompt()
+    elif kind == "evaluation":
+        prompt = LegacyEvaluationPrompt(f"[{domain}]\n{FICHE_CONTENT}").generate_evaluation_prompt()
+    else:
+        prompt = LegacyQuizPrompt(5, difficulty, FICHE_CONTENT, f"{domain} fiche", "bench").generate_prompt()
+    return [{"role": "user", "content": prompt}]
+
+
+def current_messages(kind, domain, difficulty):
+    if kind == "fiche":
+        return LlamaFicheGenerator(domain, difficulty, SOURCE_TEXT).get_messages()
+    if kind == "evaluation":
+        return LLamaEvaluateFiche(f"[{domain}]\n{FICHE_CONTENT}").get_messages()
+    return LlamaQuizGenerator(5, difficulty, FICHE_CONTENT, f"{domain} fiche", "bench").get_messages()
+
+
+BUILDERS = {"legacy": legacy_messages, "current": current_messages}
+
+
+def render(messages):
+    """Approximation of the text the model sees for a message list."""
+    return "".join(f"<{m['role']}>\n{m['content']}\n" for m in messages)
+
+
+def shared_prefix(a, b):
+    size = min(len(a), len(b))
+    i = 0
+    while i < size and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def measure(kind, builder):
+    rows = []
+    previous = ""
+    for domain, difficulty in REQUESTS:
+        text = render(builder(kind, domain, difficulty))
+        prefix = shared_prefix(previous, text)
+        rows.append({
+            "domain": domain,
+            "difficulty": difficulty,
+            "tokens": estimate_tokens(text),
+            "prefix_tokens": estimate_tokens(text[:prefix]),
+            "evaluated_tokens": estimate_tokens(text[prefix:]),
+        })
+        previous = text
+    return rows
+
+
+def run():
+    results = {"requests": REQUESTS, "generators": {}}
+    for kind in ("fiche", "evaluation", "quiz"):
+        per_version = {}
+        for version, builder in BUILDERS.items():
+            rows = measure(kind, builder)
+            per_version[version] = {
+                "rows": rows,
+                "mean_tokens": statistics.mean(r["tokens"] for r in rows),
+                # The first request always starts cold, so reuse is measured on the rest
+                "mean_evaluated_tokens": statistics.mean(r["evaluated_tokens"] for r in rows[1:]),
+            }
+        results["generators"][kind] = per_version
+    return results
+
+
+def run_live(host, model):
+    import ollama
+
+    client = ollama.Client(host=host)
+    live = {}
+    for kind in ("fiche", "evaluation", "quiz"):
+        for version, builder in BUILDERS.items():
+            counts, durations, latencies = [], [], []
+            for domain, difficulty in REQUESTS:
+                start = time.perf_counter()
+                result = client.chat(
+                    model=model,
+                    messages=builder(kind, domain, difficulty),
+                    options={"num_predict": 1}
+                )
+                latencies.append(time.perf_counter() - start)
+                counts.append(result.get("prompt_eval_count") or 0)
+                durations.append((result.get("prompt_eval_duration") or 0) / 1e6)
+            live[f"{kind}.{version}"] = {
+                "prompt_eval_count": counts,
+                "prompt_eval_ms": durations,
+                "mean_prompt_eval_ms": statistics.mean(durations[1:]),
+                "mean_latency_ms": statistics.mean(latencies[1:]) * 1e3,
+            }
+    return live
+
+
+def print_report(results):
+    print(f"{'generator':12}{'version':10}{'tokens/request':>16}{'evaluated/request':>20}")
+    for kind, per_version in results["generators"].items():
+        for version, summary in per_version.items():
+            print(f"{kind:12}{version:10}{summary['mean_tokens']:>16.0f}{summary['mean_evaluated_tokens']:>20.0f}")
+    if "live" in results:
+        print()
+        print(f"{'run':22}{'prompt_eval_count':>40}{'prompt eval ms':>16}{'latency ms':>12}")
+        for name, row in results["live"].items():
+            print(f"{name:22}{str(row['prompt_eval_count']):>40}"
+                  f"{row['mean_prompt_eval_ms']:>16.1f}{row['mean_latency_ms']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="also measure prompt evaluation on an Ollama host")
+    parser.add_argument("--host", default=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--output", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = run()
+    if args.live:
+        results["live"] = run_live(args.host, args.model)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
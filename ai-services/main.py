@@ -1,12 +1,144 @@
-from fastapi import FastAPI
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Match
 from src.creation.generateFiche import LlamaFicheGenerator
+from src.creation.generateEvaluatedFiche import LlamaEvaluatedFicheGenerator
 from pydantic import BaseModel
 import json
-from typing import Optional
+from typing import List, Optional
 from src.evaluation.evaluateFiche import LLamaEvaluateFiche
 import re
 from src.Quiz.createQuiz import LlamaQuizGenerator
-app=FastAPI()
+from src.Quiz.questionBank import get_question_bank
+from src.jobs.jobQueue import JobQueue
+from src.llm.admission import AdmissionController, OverloadedError
+from src.llm.config import QUESTION_BANK_DB, QUIZ_BATCH_CONCURRENCY
+from src.llm.deadline import RequestCancellation
+from src.llm.metrics import metrics, begin_request, server_timing
+from src.llm.ollamaClient import close_llm_client, get_llm_client
+from src.llm.resilience import retry_policy, LLMError, CLOSED, HALF_OPEN
+from src.llm.responseCache import get_response_cache
+from src.llm.scheduler import ANONYMOUS_TENANT, current_priority, current_tenant, set_request_context
+from src.llm.semanticCache import save_semantic_caches, semantic_cache_info
+from src.llm.singleFlight import single_flight
+from src.llm.stats import stats
+from src.llm.structuredLog import configure_logging, get_logger, set_request_id, shutdown_logging
+
+logger = get_logger("api")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    get_llm_client().start()
+    job_queue.start()
+    yield
+    await job_queue.close()
+    await asyncio.to_thread(save_semantic_caches)
+    await close_llm_client()
+    shutdown_logging()
+
+app=FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    Tag the request with an ID for the logs and time it by stage; streamed
+    responses report the time to their headers.
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    set_request_id(request_id)
+    set_request_context(request.headers.get("x-user-id"), request.headers.get("x-priority"))
+    endpoint = route_label(request)
+    timings = begin_request(endpoint)
+    start = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - start
+    metrics.observe(
+        "ai_services_request_duration_seconds", total,
+        help="Time until the response headers are sent",
+        endpoint=endpoint, status=response.status_code
+    )
+    response.headers["Server-Timing"] = server_timing(timings, total)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+# Added last, so it wraps everything: stops work nobody is waiting for any more
+app.add_middleware(RequestCancellation)
+
+
+admission = AdmissionController(lambda: get_llm_client().scheduler.max_concurrency)
+
+
+def overloaded_response(error: OverloadedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(error)},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, error: OverloadedError):
+    return overloaded_response(error)
+
+
+def route_label(request: Request) -> str:
+    """The matched route's path template, so /jobs/{job_id} is one metrics label."""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def cache_entries():
+    cache = get_response_cache()
+    return len(cache.memory) if cache is not None else 0
+
+
+metrics.gauge("ai_services_llm_queue_depth", lambda: get_llm_client().scheduler.queue_depth,
+              help="LLM calls waiting for a slot")
+metrics.gauge("ai_services_llm_active", lambda: get_llm_client().scheduler.active,
+              help="LLM calls running")
+metrics.gauge("ai_services_llm_max_concurrency", lambda: get_llm_client().scheduler.max_concurrency,
+              help="LLM call slots")
+metrics.gauge("ai_services_llm_queue_depth_by_priority",
+              lambda: {(("priority", p),): n for p, n in get_llm_client().scheduler.depth_by_priority().items()},
+              help="LLM calls waiting for a slot per priority class")
+metrics.gauge("ai_services_admitted_requests", lambda: admission.in_flight,
+              help="Generation requests admitted and not finished")
+metrics.gauge("ai_services_cache_entries", cache_entries,
+              help="Responses held in the in-memory cache")
+metrics.gauge("ai_services_semantic_cache_entries",
+              lambda: {(("cache", name),): info["entries"] for name, info in semantic_cache_info().items()},
+              help="Entries in the semantic (near-duplicate) caches")
+metrics.gauge("ai_services_llm_backend_state",
+              lambda: {
+                  (("backend", b.url),): {CLOSED: 0, HALF_OPEN: 1}.get(b.breaker.state, 2)
+                  for b in get_llm_client().pool.backends
+              },
+              help="Ollama backend circuit: 0 closed, 1 half-open, 2 open (ejected)")
+metrics.gauge("ai_services_llm_backend_outstanding",
+              lambda: {(("backend", b.url),): b.outstanding for b in get_llm_client().pool.backends},
+              help="LLM calls in flight per Ollama backend")
+metrics.gauge("ai_services_llm_backends_healthy", lambda: get_llm_client().pool.healthy_count(),
+              help="Ollama backends currently in rotation")
+metrics.gauge("ai_services_retry_budget_tokens", lambda: retry_policy.budget.available,
+              help="Retries currently allowed by the shared retry budget")
+metrics.gauge("ai_services_llm_hedge_delay_seconds",
+              lambda: {
+                  (("endpoint", endpoint),): delay
+                  for endpoint in get_llm_client().hedging.latencies.endpoints()
+                  if (delay := get_llm_client().hedging.delay(endpoint)) is not None
+              },
+              help="Time after which an LLM call is hedged to another backend")
 
 class FicheRequest(BaseModel):
     domain: str
@@ -24,29 +156,190 @@ class QuizCreation(BaseModel):
     fiche_id:str
 
 
+def job_handler(model, respond):
+    """Adapt an endpoint's response function to the job queue's (payload, use_cache) handlers."""
+    async def handler(payload: dict, use_cache: bool):
+        return await respond(model(**payload), use_cache)
+    return handler
+
+
+def cache_allowed(cache_control: Optional[str]) -> bool:
+    """Clients can bypass the response cache with `Cache-Control: no-cache`."""
+    return not (cache_control and "no-cache" in cache_control.lower())
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    A stream holding an admission slot. The slot is taken when the response
+    starts and released when it ends, whether it finished, failed or the
+    client went away before the first chunk; a full queue gets the 429 instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The endpoint's priority, e.g. "batch" for /create-quiz/batch
+        self.priority = current_priority()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            admitted_at = admission.acquire(self.priority)
+        except OverloadedError as error:
+            await overloaded_response(error)(scope, receive, send)
+            return
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(admitted_at)
+
+
+def stream_events(events, accept: Optional[str], admitted=False):
+    """
+    Encode generator events as SSE when asked for, NDJSON otherwise. An
+    `admitted` stream runs under an admission slot, like a synchronous request.
+    """
+    sse = bool(accept and "text/event-stream" in accept)
+
+    async def body():
+        async for event in events:
+            if sse:
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            else:
+                yield json.dumps(event) + "\n"
+
+    response_class = AdmittedStreamingResponse if admitted else StreamingResponse
+    return response_class(
+        body(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def respond_async(prefer: Optional[str]) -> bool:
+    """`Prefer: respond-async` asks for a job instead of waiting (RFC 7240); ignored when job mode is off."""
+    return bool(prefer and "respond-async" in prefer.lower()) and job_queue.enabled
+
+
+async def submit_job(kind: str, req: BaseModel, use_cache: bool):
+    job_id, created = await job_queue.submit(kind, req.model_dump(), use_cache, current_tenant(), current_priority())
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events",
+            "deduplicated": not created
+        },
+        headers={"Location": f"/jobs/{job_id}", "Preference-Applied": "respond-async"}
+    )
+
+
+async def fiche_response(req: FicheRequest, use_cache: bool) -> dict:
+    generator=LlamaFicheGenerator(
+        domain=req.domain,
+        difficulty=req.difficulty,
+        text=req.text
+    )
+
+    fiche_json=await single_flight.do(
+        ("fiche", use_cache, generator.cache_key()),
+        lambda: generator.generate_fiche(use_cache=use_cache),
+        name="fiche"
+    )
+    return {"fiche": fiche_json}
+
+
 @app.post("/generate-fiche")
-def generate_fiche_endpoint(req:FicheRequest):
+async def generate_fiche_endpoint(
+    req:FicheRequest,
+    cache_control: Optional[str] = Header(default=None),
+    prefer: Optional[str] = Header(default=None)
+):
+    use_cache = cache_allowed(cache_control)
+    if respond_async(prefer):
+        return await submit_job("fiche", req, use_cache)
+    with admission.admit():
+        return await fiche_response(req, use_cache)
+
+
+@app.post("/generate-fiche/stream")
+async def generate_fiche_stream_endpoint(
+    req: FicheRequest,
+    accept: Optional[str] = Header(default=None),
+    cache_control: Optional[str] = Header(default=None)
+):
     generator=LlamaFicheGenerator(
         domain=req.domain,
         difficulty=req.difficulty,
         text=req.text
     )
+    return stream_events(generator.stream_fiche(use_cache=cache_allowed(cache_control)), accept, admitted=True)
+
 
-    fiche_json=generator.generate_fiche()
+async def evaluated_fiche_response(req: FicheRequest, use_cache: bool) -> dict:
+    generator = LlamaEvaluatedFicheGenerator(
+        domain=req.domain,
+        difficulty=req.difficulty,
+        text=req.text
+    )
+    fiche_json = await single_flight.do(
+        ("evaluated_fiche", use_cache, generator.cache_key()),
+        lambda: generator.generate_fiche(use_cache=use_cache),
+        name="evaluated_fiche"
+    )
     return {"fiche": fiche_json}
 
 
+@app.post("/generate-evaluated-fiche")
+async def generate_evaluated_fiche_endpoint(
+    req: FicheRequest,
+    cache_control: Optional[str] = Header(default=None),
+    prefer: Optional[str] = Header(default=None)
+):
+    use_cache = cache_allowed(cache_control)
+    if respond_async(prefer):
+        return await submit_job("evaluated_fiche", req, use_cache)
+    with admission.admit():
+        return await evaluated_fiche_response(req, use_cache)
+
+
+@app.post("/generate-evaluated-fiche/stream")
+async def generate_evaluated_fiche_stream_endpoint(
+    req: FicheRequest,
+    accept: Optional[str] = Header(default=None),
+    cache_control: Optional[str] = Header(default=None)
+):
+    generator = LlamaEvaluatedFicheGenerator(
+        domain=req.domain,
+        difficulty=req.difficulty,
+        text=req.text
+    )
+    return stream_events(generator.stream_fiche(use_cache=cache_allowed(cache_control)), accept, admitted=True)
+
+
+async def evaluation_response(req: FicheEvaluate, use_cache: bool) -> dict:
+    # Long fiches are summarized on the CPU first: keep that off the event loop
+    evaluator = await asyncio.to_thread(LLamaEvaluateFiche, req.fiche_content)
+    return await single_flight.do(
+        ("evaluation", use_cache, evaluator.cache_key()),
+        lambda: evaluator.evaluateFiche(use_cache=use_cache),
+        name="evaluation"
+    )
+
 
 @app.post("/evaluate-fiche")
-def evaluate_fiche_endpoint(req: FicheEvaluate):
-    evaluator = LLamaEvaluateFiche(fiche_content=req.fiche_content)
-    fiche_json = evaluator.evaluateFiche()
-    
-    return  fiche_json
+async def evaluate_fiche_endpoint(
+    req: FicheEvaluate,
+    cache_control: Optional[str] = Header(default=None),
+    prefer: Optional[str] = Header(default=None)
+):
+    use_cache = cache_allowed(cache_control)
+    if respond_async(prefer):
+        return await submit_job("evaluation", req, use_cache)
+    with admission.admit():
+        return await evaluation_response(req, use_cache)
 
-@app.post("/create-quiz")
-def create_quiz_endpoint(req: QuizCreation):
-    QuizGenerator = LlamaQuizGenerator(
+def make_quiz_generator(req: QuizCreation) -> LlamaQuizGenerator:
+    return LlamaQuizGenerator(
         question_count=req.question_count,
         difficulty=req.difficulty,
         fiche_content=req.fiche_content,
@@ -54,11 +347,171 @@ def create_quiz_endpoint(req: QuizCreation):
         fiche_id=req.fiche_id
     )
 
+
+async def run_quiz(QuizGenerator: LlamaQuizGenerator, use_cache: bool):
+    bank = get_question_bank() if use_cache else None
+    if bank is not None:
+        # Drawn per user, so neither shared with other callers nor cached
+        tenant = current_tenant()
+        quiz_json_str = await QuizGenerator.generate_banked_quiz(bank, None if tenant == ANONYMOUS_TENANT else tenant)
+        return json.loads(quiz_json_str)
+
+    async def generate():
+        quiz_json_str = await QuizGenerator.generate_quiz(use_cache=use_cache)
+        return quiz_json_str, QuizGenerator.fell_back
+
+    # A caller that joined another's generation learns from it whether it fell back
+    quiz_json_str, QuizGenerator.fell_back = await single_flight.do(
+        ("quiz", use_cache, QuizGenerator.cache_key()),
+        generate,
+        name="quiz"
+    )
+    return json.loads(quiz_json_str)
+
+
+async def quiz_response(req: QuizCreation, use_cache: bool) -> dict:
+    QuizGenerator = await asyncio.to_thread(make_quiz_generator, req)
+
     try:
-        quiz_json_str = QuizGenerator.generate_quiz()
-        quiz_json = json.loads(quiz_json_str)
+        quiz_json = await run_quiz(QuizGenerator, use_cache)
     except json.JSONDecodeError:
         return {"error": "Failed to decode JSON"}
 
     return {"Quiz": quiz_json}
 
+
+@app.post("/create-quiz")
+async def create_quiz_endpoint(
+    req: QuizCreation,
+    cache_control: Optional[str] = Header(default=None),
+    prefer: Optional[str] = Header(default=None)
+):
+    use_cache = cache_allowed(cache_control)
+    if respond_async(prefer):
+        return await submit_job("quiz", req, use_cache)
+    with admission.admit():
+        return await quiz_response(req, use_cache)
+
+
+def group_quiz_items(items: List[QuizCreation]) -> dict:
+    """Generators of a batch by cache key, with the indices of the items each one answers."""
+    groups = {}
+    for index, item in enumerate(items):
+        QuizGenerator = make_quiz_generator(item)
+        groups.setdefault(QuizGenerator.cache_key(), (QuizGenerator, []))[1].append(index)
+    return groups
+
+
+async def quiz_batch_events(items: List[QuizCreation], use_cache: bool):
+    """
+    Generate the quizzes of a batch and yield one event per item as soon as it is ready.
+
+    Identical items are generated once. At most QUIZ_BATCH_CONCURRENCY quizzes
+    (by default, the LLM slots across the healthy backends) are in flight, so
+    a large batch does not fill the LLM queue ahead of interactive requests.
+    """
+    groups = await asyncio.to_thread(group_quiz_items, items)
+    stats.incr("quiz_batch.items", len(items))
+    stats.incr("quiz_batch.deduplicated", len(items) - len(groups))
+
+    semaphore = asyncio.Semaphore(QUIZ_BATCH_CONCURRENCY or get_llm_client().scheduler.max_concurrency)
+
+    async def run_group(QuizGenerator):
+        async with semaphore:
+            quiz = await run_quiz(QuizGenerator, use_cache)
+        if QuizGenerator.fell_back:
+            # The placeholder quiz is no answer to the item: report it as failed
+            raise LLMError("Quiz generation failed")
+        return quiz
+
+    pending = {
+        asyncio.create_task(run_group(QuizGenerator)): indices
+        for QuizGenerator, indices in groups.values()
+    }
+    failed = 0
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                indices = pending.pop(task)
+                error = task.exception()
+                if error is not None:
+                    logger.warning("Batch quiz failed", extra={"items": indices, "error": str(error)})
+                    failed += len(indices)
+                for index in indices:
+                    event = {"event": "quiz", "index": index, "fiche_id": items[index].fiche_id}
+                    if error is None:
+                        event["Quiz"] = task.result()
+                    else:
+                        event["event"] = "error"
+                        event["error"] = "Failed to decode JSON" if isinstance(error, json.JSONDecodeError) else str(error)
+                    yield event
+    finally:
+        # Client went away: stop the quizzes nobody will read
+        for task in pending:
+            task.cancel()
+
+    stats.incr("quiz_batch.failed", failed)
+    yield {"event": "done", "count": len(items), "failed": failed}
+
+
+@app.post("/create-quiz/batch")
+async def create_quiz_batch_endpoint(
+    items: List[QuizCreation],
+    accept: Optional[str] = Header(default=None),
+    cache_control: Optional[str] = Header(default=None),
+    x_user_id: Optional[str] = Header(default=None),
+    x_priority: Optional[str] = Header(default=None)
+):
+    # Batches queue behind interactive work unless the client says otherwise
+    set_request_context(x_user_id, x_priority or "batch")
+    return stream_events(quiz_batch_events(items, cache_allowed(cache_control)), accept, admitted=True)
+
+
+job_queue = JobQueue({
+    "fiche": ("/generate-fiche", job_handler(FicheRequest, fiche_response)),
+    "evaluated_fiche": ("/generate-evaluated-fiche", job_handler(FicheRequest, evaluated_fiche_response)),
+    "evaluation": ("/evaluate-fiche", job_handler(FicheEvaluate, evaluation_response)),
+    "quiz": ("/create-quiz", job_handler(QuizCreation, quiz_response))
+}, per_user_kinds=("quiz",) if QUESTION_BANK_DB else ())
+
+metrics.gauge("ai_services_jobs",
+              lambda: {(("status", status),): count for status, count in job_queue.store.counts().items()},
+              help="Jobs in the job store by status")
+
+
+@app.get("/jobs/{job_id}")
+async def job_endpoint(job_id: str):
+    if not job_queue.enabled:
+        raise HTTPException(status_code=404, detail="Job mode is disabled")
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str, accept: Optional[str] = Header(default=None)):
+    if not job_queue.enabled:
+        raise HTTPException(status_code=404, detail="Job mode is disabled")
+    return stream_events(job_queue.watch(job_id), accept)
+
+
+@app.get("/stats")
+async def stats_endpoint():
+    cache = get_response_cache()
+    return {
+        "counters": stats.snapshot(),
+        "cache": cache.info() if cache is not None else None,
+        "semantic_cache": semantic_cache_info(),
+        "backends": get_llm_client().pool.info(),
+        "jobs": await job_queue.counts() if job_queue.enabled else None
+    }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(
+        metrics.render(stats.snapshot()),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -1,19 +1,33 @@
-import ollama
+import asyncio
 import json
+import logging
 import re
-import time
-from typing import Union, Dict, Any
+from typing import Dict, Any
 
-class LlamaQuizGenerator:
-    def __init__(self, question_count, difficulty, fiche_content, fiche_title, fiche_id):
-        self.question_count = question_count
-        self.difficulty = difficulty
-        self.fiche_content = fiche_content
-        self.fiche_title = fiche_title
-        self.fiche_id = fiche_id
+from src.llm.config import MODEL_NAME, GENERATION_OPTIONS, LLM_SCHEMA_MODE, QUIZ_PARTIAL_ACCEPTANCE, QUIZ_CONTENT_TOKENS
+from src.Quiz.questionBank import content_hash, question_key
+from src.llm.extractiveSummary import condense
+from src.llm.jsonRepair import clean_json_response, extract_array_objects
+from src.llm.metrics import timed
+from src.llm.ollamaClient import get_llm_client
+from src.llm.resilience import ParseError, TransportError, ValidationError, describe_error, retry_policy
+from src.llm.responseCache import get_response_cache, make_cache_key
+from src.llm.schemas import quiz_schema, record_attempt, record_response
+from src.llm.singleFlight import single_flight
+from src.llm.stats import stats
+from src.llm.structuredLog import get_logger, log_payload
+from src.llm.tokenBudget import quiz_num_predict
+
+logger = get_logger("quiz")
+
+DIFFICULTY_GUIDELINES = {
+    "easy": "Questions about definitions and basic concepts, simple vocabulary, one concept per question",
+    "medium": "Application and comprehension questions, combine 2-3 concepts, requires reflection",
+    "hard": "Advanced analysis and synthesis questions, complex scenarios, very plausible distractors"
+}
 
-    def generate_prompt(self):
-        return f"""You are an expert pedagogue specialized in creating high-quality Multiple Choice Questions (MCQs).
+# Identical for every request, so Ollama can reuse the KV cache for this prefix
+SYSTEM_PROMPT = """You are an expert pedagogue specialized in creating high-quality Multiple Choice Questions (MCQs).
 
 STRICT RULES FOR THE MCQs:
 1. Each question must have EXACTLY 4 options
@@ -31,157 +45,105 @@ STRATEGIES FOR GOOD DISTRACTORS:
 - Avoid "All of the above" or "None of the above"
 
 IMPORTANT: The output format must be compatible with the provided Mongoose model.
-
-Based on the educational content, generate an MCQ quiz with {self.question_count} questions of {self.difficulty} difficulty level.
-
-=== EDUCATIONAL CONTENT ===
-title: {self.fiche_title}
-content: {self.fiche_content}
-===========================
-
-PARAMETERS:
-- Number of questions: {self.question_count}
-- Difficulty: {self.difficulty}
-- Exactly 4 options per question
+Use the title, fiche id, number of questions and difficulty given in the request's PARAMETERS.
 
 MANDATORY JSON FORMAT (Mongoose-compatible):
-{{
-  "title": "MCQ - {self.fiche_title}",
-  "fiche": "{self.fiche_id}",
+{
+  "title": "MCQ - <fiche title>",
+  "fiche": "<fiche id>",
   "questions": [
-    {{
+    {
       "question": "A clear question ending with a question mark?",
       "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
       "correctAnswer": "Exact correct option (String)",
       "explanation": "Detailed explanation of the correct answer",
-      "difficulty": "{self.difficulty}",
+      "difficulty": "<difficulty>",
       "points": 1
-    }}
+    }
   ],
-  "config": {{
+  "config": {
     "timeLimit": 60,
     "passingScore": 70,
     "shuffleQuestions": true,
     "showCorrectAnswers": true,
     "allowRetries": true
-  }}
-}}
+  }
+}
 
-CRITICAL: Return ONLY the JSON object, nothing else. No explanatory text before or after.
+CRITICAL: Return ONLY the JSON object, nothing else. No explanatory text before or after."""
+
+# Settings of quizzes assembled from the question bank, as in the format above
+QUIZ_CONFIG = {
+    "timeLimit": 60,
+    "passingScore": 70,
+    "shuffleQuestions": True,
+    "showCorrectAnswers": True,
+    "allowRetries": True
+}
+# Most recent bank questions listed in a shortfall prompt so they are not repeated
+QUESTION_BANK_AVOID_LIMIT = 40
 
-Difficulty Instructions:
-- EASY: Questions about definitions and basic concepts, simple vocabulary, one concept per question
-- MEDIUM: Application and comprehension questions, combine 2-3 concepts, requires reflection  
-- HARD: Advanced analysis and synthesis questions, complex scenarios, very plausible distractors"""
 
-    def clean_json_response(self, response: Union[str, dict]) -> str:
+class LlamaQuizGenerator:
+    def __init__(self, question_count, difficulty, fiche_content, fiche_title, fiche_id):
+        self.question_count = question_count
+        self.difficulty = difficulty
+        self.fiche_content = fiche_content
+        # Long fiches are reduced to their key sentences for the prompt
+        self.prompt_content = condense(fiche_content, QUIZ_CONTENT_TOKENS, "quiz")
+        self.fiche_title = fiche_title
+        self.fiche_id = fiche_id
+        self.options = dict(GENERATION_OPTIONS)
+        self.options["num_predict"] = quiz_num_predict(question_count)
+        # Set when generation gave up and returned the placeholder quiz
+        self.fell_back = False
+        # JSON schema enforced at decode time in schema mode
+        self.format = quiz_schema(question_count, difficulty) if LLM_SCHEMA_MODE else None
+
+    def get_difficulty_instruction(self):
+        """Guideline for the requested difficulty only."""
+        return DIFFICULTY_GUIDELINES.get(self.difficulty.strip().lower(), DIFFICULTY_GUIDELINES["medium"])
+
+    def generate_prompt(self, question_count=None, existing_questions=None):
         """
-        Clean and validate JSON response from AI model.
-        More conservative approach to avoid corrupting valid JSON.
+        Per-request part of the prompt; the static instructions live in SYSTEM_PROMPT.
+        Follow-up prompts ask only for the missing questions.
         """
-        # Handle non-string types first
-        if isinstance(response, dict):
-            return json.dumps(response)
-        if not isinstance(response, str):
-            response = str(response)
-        
-        print(f"📊 Original response length: {len(response)}")
-        print(f"📋 First 200 chars: {response[:200]}")
-        
-        # Step 1: Remove markdown code block indicators
-        response = re.sub(r"```(?:json)?\s*", "", response, flags=re.IGNORECASE)
-        response = re.sub(r"```\s*$", "", response)
-        
-        # Step 2: Extract JSON content between first { and last }
-        start_idx = response.find("{")
-        if start_idx == -1:
-            print("⚠️ WARNING: No opening brace found in response")
-            return '{"error": "No JSON found", "questions": []}'
-        
-        end_idx = response.rfind("}")
-        if end_idx == -1:
-            print("⚠️ WARNING: No closing brace found in response")
-            return '{"error": "Invalid JSON structure", "questions": []}'
-        
-        response = response[start_idx:end_idx + 1]
-        print(f"✂️ After brace extraction: {response[:200]}")
-        
-        # Step 3: Remove comments (but be careful)
-        response = re.sub(r'^\s*//.*$', '', response, flags=re.MULTILINE)
-        response = re.sub(r'/\*.*?\*/', '', response, flags=re.DOTALL)
-        
-        # Step 4: Clean up basic formatting issues
-        response = response.strip()
-        response = re.sub(r',\s*([}\]])', r'\1', response)
-        
-        print(f"🧹 After initial cleaning: {response[:300]}")
-        
-        # Step 5: Try to parse - if it works, we're done!
-        try:
-            parsed = json.loads(response)
-            print("✅ JSON is valid after initial cleaning")
-            return response
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON still invalid: {e}")
-            print(f"🔍 Error around position {e.pos}: '{response[max(0, e.pos-20):e.pos+20]}'")
-        
-        # Step 6: More aggressive fixes only if needed
-        return self.apply_targeted_fixes(response)
+        question_count = question_count or self.question_count
+        avoid_section = ""
+        if existing_questions:
+            listed = "\n".join(f"- {q['question']}" for q in existing_questions)
+            avoid_section = f"""
+=== QUESTIONS ALREADY IN THE QUIZ ===
+Do NOT repeat or rephrase any of these; cover other parts of the content:
+{listed}
+=====================================
+"""
+        return f"""Based on the educational content, generate an MCQ quiz with {question_count} questions of {self.difficulty} difficulty level.
 
-    def apply_targeted_fixes(self, response: str) -> str:
-        """Apply specific fixes based on common JSON issues."""
-        original = response
-        
-        # Fix 1: Handle unescaped quotes in string values
-        try:
-            response = self.fix_unescaped_quotes(response)
-            json.loads(response)
-            print("✅ Fixed with quote escaping")
-            return response
-        except json.JSONDecodeError:
-            print("❌ Quote escaping didn't help")
-        
-        # Fix 2: Try structural repairs
-        try:
-            response = self.fix_json_structure(original)
-            json.loads(response)
-            print("✅ Fixed with structural repair")
-            return response
-        except json.JSONDecodeError:
-            print("❌ Structural repair didn't help")
-        
-        # Fix 3: Last resort - extract what we can
-        try:
-            extracted = self.extract_partial_json(original)
-            if extracted and extracted.get("questions"):
-                print("✅ Partial extraction successful")
-                return json.dumps(extracted)
-        except Exception as e:
-            print(f"❌ Partial extraction failed: {e}")
-        
-        # Complete failure
-        print("🚨 All targeted fixes failed")
-        return self.create_error_json("All JSON repair attempts failed")
+PARAMETERS:
+- Number of questions: {question_count}
+- Difficulty: {self.difficulty}
+- Difficulty instructions: {self.get_difficulty_instruction()}
+- Quiz "title": "MCQ - {self.fiche_title}"
+- Quiz "fiche": "{self.fiche_id}"
+- Exactly 4 options per question
+{avoid_section}
+=== EDUCATIONAL CONTENT ===
+title: {self.fiche_title}
+content: {self.prompt_content}
+===========================
+"""
 
-    def fix_unescaped_quotes(self, text: str) -> str:
-        """Fix unescaped quotes within JSON string values."""
-        def escape_quotes_in_match(match):
-            key_part = match.group(1)
-            value_part = match.group(2)
-            escaped_value = value_part.replace('\\"', '___TEMP___').replace('"', '\\"').replace('___TEMP___', '\\"')
-            return f'{key_part}"{escaped_value}"'
-        
-        pattern = r'("[\w\s\-_]+"\s*:\s*")(.*?)("(?=\s*[,}\]]))'
-        return re.sub(pattern, escape_quotes_in_match, text, flags=re.DOTALL)
+    def get_messages(self, question_count=None, existing_questions=None):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": self.generate_prompt(question_count, existing_questions)}
+        ]
 
-    def fix_json_structure(self, text: str) -> str:
-        """Fix common JSON structural issues."""
-        text = re.sub(r'}\s*{', '}, {', text)
-        text = re.sub(r']\s*\[', '], [', text)
-        text = re.sub(r'\s*:\s*', ': ', text)
-        text = re.sub(r'\s*,\s*', ', ', text)
-        text = re.sub(r'(?<!["\w])(\w+)(?=\s*:)', r'"\1"', text)
-        return text
+    def cache_key(self):
+        """Key identifying this request's prompt, model and options."""
+        return make_cache_key(MODEL_NAME, self.get_messages(), self.options, self.format)
 
     def extract_partial_json(self, text: str) -> Dict[str, Any]:
         """Last resort: try to extract a valid quiz structure from corrupted JSON."""
@@ -201,51 +163,35 @@ Difficulty Instructions:
         if fiche_match:
             result["fiche"] = fiche_match.group(1)
         
-        # Try to extract questions
-        questions_section = re.search(r'"questions"\s*:\s*\[(.*)\]', text, re.DOTALL)
-        if questions_section:
-            questions_text = questions_section.group(1)
-            question_matches = re.findall(r'{[^{}]*"question"[^{}]*}', questions_text)
-            
-            for q_match in question_matches:
-                try:
-                    question_obj = json.loads(q_match)
-                    result["questions"].append(question_obj)
-                except:
-                    continue
+        # Repair each question object on its own
+        for question_text in extract_array_objects(text, "questions"):
+            try:
+                question_obj = json.loads(clean_json_response(question_text))
+            except json.JSONDecodeError:
+                continue
+            if isinstance(question_obj, dict) and "question" in question_obj:
+                result["questions"].append(question_obj)
         
         return result if result["questions"] else None
 
-    def simple_json_cleaner(self, response: Union[str, dict]) -> str:
-        """Simplified version that focuses on the most common issues."""
-        if isinstance(response, dict):
-            return json.dumps(response)
-        if not isinstance(response, str):
-            response = str(response)
-        
-        # Remove markdown
-        response = re.sub(r"```(?:json)?\s*", "", response, flags=re.IGNORECASE)
-        response = re.sub(r"```", "", response)
+    def validate_question(self, question):
+        """Check a single question; returns (is_valid, reason)."""
+        if not isinstance(question, dict):
+            return False, "is not an object"
         
-        # Extract JSON
-        start = response.find("{")
-        end = response.rfind("}")
-        if start == -1 or end == -1:
-            return '{"error": "No valid JSON structure found", "questions": []}'
+        required_q_fields = ["question", "options", "correctAnswer"]
+        for field in required_q_fields:
+            if field not in question:
+                return False, f"missing field: {field}"
         
-        response = response[start:end + 1]
-        response = re.sub(r',\s*([}\]])', r'\1', response)
+        if not isinstance(question["options"], list) or len(question["options"]) < 2:
+            return False, "has invalid options"
         
-        try:
-            json.loads(response)
-            return response
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON error: {e}")
-            return json.dumps({
-                "error": "Invalid JSON from AI",
-                "questions": [],
-                "debug_info": str(e)
-            })
+        return True, "Valid question"
+
+    def question_key(self, question) -> str:
+        """Normalized question text used to spot duplicates."""
+        return question_key(question)
 
     def validate_quiz_structure(self, quiz_data: dict) -> bool:
         """Validate that the quiz has the expected structure."""
@@ -253,33 +199,24 @@ Difficulty Instructions:
         
         for field in required_fields:
             if field not in quiz_data:
-                print(f"❌ Missing required field: {field}")
+                logger.info("Quiz missing required field", extra={"field": field})
                 return False
         
         if not isinstance(quiz_data["questions"], list):
-            print("❌ Questions is not an array")
+            logger.info("Quiz questions is not an array")
             return False
         
         if len(quiz_data["questions"]) == 0:
-            print("❌ No questions found")
+            logger.info("Quiz has no questions")
             return False
         
         for i, question in enumerate(quiz_data["questions"]):
-            if not isinstance(question, dict):
-                print(f"❌ Question {i} is not an object")
-                return False
-            
-            required_q_fields = ["question", "options", "correctAnswer"]
-            for field in required_q_fields:
-                if field not in question:
-                    print(f"❌ Question {i} missing field: {field}")
-                    return False
-            
-            if not isinstance(question["options"], list) or len(question["options"]) < 2:
-                print(f"❌ Question {i} has invalid options")
+            is_valid, reason = self.validate_question(question)
+            if not is_valid:
+                logger.info("Invalid quiz question", extra={"question": i, "reason": reason})
                 return False
         
-        print("✅ Quiz structure validation passed")
+        logger.debug("Quiz structure validation passed")
         return True
 
     def log_structure_issues(self, quiz_data):
@@ -300,19 +237,12 @@ Difficulty Instructions:
             issues.append("'questions' array is empty")
         
         if issues:
-            print(f"🔍 Structure issues found: {', '.join(issues)}")
-
-    def create_error_json(self, error_message: str) -> str:
-        """Create a valid error JSON response."""
-        return json.dumps({
-            "error": error_message,
-            "title": "MCQ - Generation Failed",
-            "fiche": "error",
-            "questions": []
-        })
+            logger.info("Quiz structure issues found", extra={"issues": issues})
 
     def create_fallback_quiz(self) -> str:
         """Create a minimal working quiz as ultimate fallback."""
+        stats.incr("quiz.fallbacks")
+        self.fell_back = True
         fallback = {
             "title": "MCQ - Sample Quiz (Generation Failed)",
             "fiche": "fallback",
@@ -332,80 +262,235 @@ Difficulty Instructions:
         }
         return json.dumps(fallback)
 
-    def generate_quiz(self, max_retries=3):
+    def accept_questions(self, questions, accepted, seen_keys) -> int:
+        """Add the valid, not yet seen questions to accepted; returns how many were added."""
+        if not isinstance(questions, list):
+            return 0
+        
+        added = 0
+        for i, question in enumerate(questions):
+            if len(accepted) >= self.question_count:
+                break
+            is_valid, reason = self.validate_question(question)
+            if not is_valid:
+                logger.info("Dropping question", extra={"question": i, "reason": reason})
+                stats.incr("quiz.rejected_questions")
+                continue
+            key = self.question_key(question)
+            if key in seen_keys:
+                logger.info("Dropping duplicate question", extra={"question": i})
+                stats.incr("quiz.duplicate_questions")
+                continue
+            seen_keys.add(key)
+            accepted.append(question)
+            added += 1
+        
+        stats.incr("quiz.accepted_questions", added)
+        return added
+
+    def assemble_quiz(self, quiz_base, questions) -> str:
+        """Rebuild the quiz JSON around the accepted questions."""
+        quiz = dict(quiz_base or {})
+        quiz.setdefault("title", f"MCQ - {self.fiche_title}")
+        quiz.setdefault("fiche", self.fiche_id)
+        quiz["questions"] = questions[:self.question_count]
+        return json.dumps(quiz)
+
+    async def generate_quiz(self, max_retries=3, use_cache=True, existing_questions=None):
         """
         Generate quiz with improved error handling and JSON cleaning.
+
+        In partial-acceptance mode every valid question survives a rejected
+        attempt, and the next attempt only asks for the missing ones. The model
+        is asked not to repeat existing_questions, and repeats are dropped.
         """
-        prompt = self.generate_prompt()
-        
+        existing_questions = existing_questions or []
+        with timed("prompt"):
+            messages = self.get_messages(existing_questions=existing_questions)
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(MODEL_NAME, messages, self.options, self.format)
+            with timed("cache"):
+                cached = await cache.get(key)
+            if cached is not None:
+                return cached
+        
+        accepted = []
+        seen_keys = {self.question_key(question) for question in existing_questions}
+        quiz_base = None
+        
+        retry_policy.on_request()
+        last_error = None
         for attempt in range(max_retries):
-            print(f"\nQuiz generation attempt {attempt + 1}/{max_retries}")
+            if attempt > 0 and not await retry_policy.before_retry("quiz", attempt, last_error):
+                break
+            logger.debug("Quiz generation attempt", extra={"attempt": attempt + 1, "max_retries": max_retries})
+            record_attempt("quiz", self.format is not None)
+            
+            missing = self.question_count - len(accepted)
+            if accepted:
+                # Follow-up request: only the missing questions, with the accepted ones as context
+                logger.info("Requesting missing questions", extra={"missing": missing, "kept": len(accepted)})
+                stats.incr("quiz.followup_requests")
+                attempt_messages = self.get_messages(question_count=missing,
+                                                     existing_questions=existing_questions + accepted)
+                attempt_format = quiz_schema(missing, self.difficulty) if self.format is not None else None
+                attempt_options = {**self.options, "num_predict": quiz_num_predict(missing)}
+            else:
+                attempt_messages = messages
+                attempt_format = self.format
+                attempt_options = self.options
             
             try:
-                # Add a small delay between retries to avoid overwhelming the API
-                if attempt > 0:
-                    print("Waiting 2 seconds before retry...")
-                    time.sleep(2)
-                
-                result = ollama.chat(
-                    model="llama3.1:latest",
-                    messages=[{"role": "user", "content": prompt}],
-                    options={
-                        "temperature": 0.1,
-                        "top_p": 0.8,
-                        "repeat_penalty": 1.1,
-                        "num_predict": 2000
-                    }
+                result = await get_llm_client().chat(
+                    model=MODEL_NAME,
+                    messages=attempt_messages,
+                    options=attempt_options,
+                    format=attempt_format,
+                    stop_at_json_end=True
                 )
                 
                 raw_response = result["message"]["content"]
-                print(f"Raw response from Ollama (first 200 chars): {raw_response[:200]}")
+                record_response("quiz", raw_response, self.format is not None)
+                log_payload(logger, logging.DEBUG, "Raw response", raw_response, attempt=attempt + 1)
                 
                 # Check if response is suspiciously short (might indicate API issue)
                 if len(raw_response.strip()) < 50:
-                    print(f"⚠️  Response too short ({len(raw_response)} chars), skipping")
+                    log_payload(logger, logging.WARNING, "Response too short, skipping", raw_response,
+                                attempt=attempt + 1)
+                    last_error = ValidationError(f"response too short ({len(raw_response)} chars)")
                     continue
                 
-                # Try the improved cleaning function
-                cleaned_response = self.clean_json_response(raw_response)
-                
-                # Validate the cleaned response
+                # Clean the response, salvaging individual questions if that is not enough
+                with timed("clean"):
+                    cleaned_response = clean_json_response(raw_response)
                 try:
-                    parsed_json = json.loads(cleaned_response)
-                    
-                    # Additional validation - ensure it has the expected structure
-                    if self.validate_quiz_structure(parsed_json):
-                        print("✅ Valid quiz JSON obtained, returning")
-                        return cleaned_response
-                    else:
-                        print("❌ JSON valid but quiz structure invalid")
-                        # Log what was wrong for debugging
-                        self.log_structure_issues(parsed_json)
-                        continue
-                        
+                    with timed("parse"):
+                        parsed_json = json.loads(cleaned_response)
                 except json.JSONDecodeError as e:
-                    print(f"❌ Attempt {attempt+1} failed to parse JSON: {e}")
+                    log_payload(logger, logging.WARNING, "JSON decode error", cleaned_response,
+                                attempt=attempt + 1, error=str(e))
+                    with timed("salvage"):
+                        parsed_json = self.extract_partial_json(raw_response)
+                    if parsed_json is None:
+                        last_error = ParseError(str(e))
+                        continue
+                    logger.info("Partial extraction successful", extra={"attempt": attempt + 1})
+                    cleaned_response = json.dumps(parsed_json)
+                
+                if not isinstance(parsed_json, dict):
+                    self.log_structure_issues(parsed_json)
+                    last_error = ValidationError("root is not an object")
+                    continue
+                
+                if QUIZ_PARTIAL_ACCEPTANCE:
+                    if quiz_base is None:
+                        quiz_base = parsed_json
+                    added = self.accept_questions(parsed_json.get("questions"), accepted, seen_keys)
+                    if len(accepted) >= self.question_count:
+                        logger.debug("Valid quiz JSON obtained", extra={"attempt": attempt + 1})
+                        quiz_json = self.assemble_quiz(quiz_base, accepted)
+                        if cache is not None:
+                            await cache.set(key, quiz_json)
+                        return quiz_json
+                    logger.info("Not enough valid questions yet",
+                                extra={"accepted": len(accepted), "requested": self.question_count, "added": added})
+                    self.log_structure_issues(parsed_json)
+                    last_error = ValidationError(f"only {len(accepted)}/{self.question_count} valid questions")
+                    continue
+                
+                # Additional validation - ensure it has the expected structure
+                if self.validate_quiz_structure(parsed_json):
+                    logger.debug("Valid quiz JSON obtained", extra={"attempt": attempt + 1})
+                    if cache is not None:
+                        await cache.set(key, cleaned_response)
+                    return cleaned_response
+                else:
+                    logger.info("JSON valid but quiz structure invalid", extra={"attempt": attempt + 1})
+                    # Log what was wrong for debugging
+                    self.log_structure_issues(parsed_json)
+                    last_error = ValidationError("invalid quiz structure")
+                    continue
                     
-                    # If the improved cleaner fails, try the simple backup
-                    if attempt == max_retries - 1:  # Last attempt
-                        print("Trying simple backup cleaner...")
-                        backup_response = self.simple_json_cleaner(raw_response)
-                        try:
-                            parsed_backup = json.loads(backup_response)
-                            if self.validate_quiz_structure(parsed_backup):
-                                print("✅ Backup cleaner succeeded")
-                                return backup_response
-                            else:
-                                print("❌ Backup cleaner produced invalid structure")
-                        except json.JSONDecodeError as backup_error:
-                            print(f"❌ Backup cleaner also failed: {backup_error}")
+            except TransportError as e:
+                logger.warning("Ollama API call failed", extra={"attempt": attempt + 1, "error": str(e)})
+                last_error = e
                     
             except Exception as e:
-                print(f"❌ Ollama API call failed on attempt {attempt+1}: {e}")
-                if attempt < max_retries - 1:
-                    print("Retrying...")
-                    continue
+                logger.warning("Unexpected error", extra={"attempt": attempt + 1, "error": str(e)})
+                last_error = e
+        
+        if accepted:
+            # Better a shorter quiz than the placeholder; not cached so the next request tries again
+            logger.warning("Returning partial quiz", extra={"accepted": len(accepted), "requested": self.question_count})
+            stats.incr("quiz.partial_results")
+            return self.assemble_quiz(quiz_base, accepted)
         
         # If all retries fail, return a minimal structure
-        print("🚨 All attempts failed, returning fallback quiz")
-        return self.create_fallback_quiz()
\ No newline at end of file
+        logger.error("All attempts failed, returning fallback quiz", extra={"error": describe_error(last_error)})
+        return self.create_fallback_quiz()
+
+    async def fill_bank(self, bank, difficulty, digest, count):
+        """Generate `count` questions unlike the banked ones and bank them; returns the (id, question) pairs added."""
+        known = await asyncio.to_thread(
+            bank.known_questions, self.fiche_id, difficulty, digest, QUESTION_BANK_AVOID_LIMIT
+        )
+        # Long fiches are summarized on the CPU first: keep that off the event loop
+        generator = await asyncio.to_thread(
+            LlamaQuizGenerator, count, self.difficulty, self.fiche_content, self.fiche_title, self.fiche_id
+        )
+        # The bank is this quiz's cache: a cached answer would hold questions it already has
+        quiz_json = await generator.generate_quiz(use_cache=False, existing_questions=known)
+        if generator.fell_back:
+            return []
+        questions = [q for q in json.loads(quiz_json).get("questions", [])
+                     if self.validate_question(q)[0]][:count]
+        return await asyncio.to_thread(bank.add, self.fiche_id, difficulty, digest, questions)
+
+    async def generate_banked_quiz(self, bank, user=None):
+        """
+        Draw the quiz from the question bank: questions `user` was not served
+        recently, generating (and banking) only the shortfall. When nothing new
+        can be had, the questions the user saw longest ago fill the quiz.
+        Anonymous requests (user None) are not tracked. Returns quiz JSON like
+        generate_quiz.
+        """
+        difficulty = self.difficulty.strip().lower()
+        digest = content_hash(self.fiche_content)
+        with timed("question_bank"):
+            drawn = await asyncio.to_thread(
+                bank.sample, self.fiche_id, difficulty, digest, self.question_count, user
+            )
+        stats.incr("question_bank.quizzes")
+
+        missing = self.question_count - len(drawn)
+        if missing:
+            logger.info("Question bank shortfall", extra={"fiche_id": self.fiche_id, "missing": missing})
+            # Concurrent requests for the fiche (a double click) share one generation;
+            # keyed by the shortfall too, so no request joins a smaller fill and comes up short
+            added = await single_flight.do(
+                ("question_bank", self.fiche_id, difficulty, digest, missing),
+                lambda: self.fill_bank(bank, difficulty, digest, missing),
+                name="question_bank"
+            )
+            drawn_ids = {question_id for question_id, _ in drawn}
+            drawn += [pair for pair in added if pair[0] not in drawn_ids][:missing]
+        else:
+            stats.incr("question_bank.served_without_llm")
+
+        if len(drawn) < self.question_count and user is not None:
+            drawn += await asyncio.to_thread(
+                bank.least_recently_seen, self.fiche_id, difficulty, digest,
+                self.question_count - len(drawn), user, [question_id for question_id, _ in drawn]
+            )
+        if not drawn:
+            return self.create_fallback_quiz()
+        if user is not None:
+            await asyncio.to_thread(bank.mark_seen, user, [question_id for question_id, _ in drawn])
+        stats.incr("question_bank.served_questions", len(drawn))
+        return json.dumps({
+            "title": f"MCQ - {self.fiche_title}",
+            "fiche": self.fiche_id,
+            "questions": [question for _, question in drawn],
+            "config": dict(QUIZ_CONFIG)
+        })
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from src.llm.config import QUESTION_BANK_DB, QUESTION_BANK_SEEN_SECONDS
+from src.llm.stats import stats
+
+
+def content_hash(fiche_content: str) -> str:
+    return hashlib.sha256(fiche_content.encode("utf-8")).hexdigest()
+
+
+def question_key(question) -> str:
+    """Normalized question text used to spot duplicates."""
+    words = re.findall(r"\w+", str(question.get("question", "")).lower())
+    return " ".join(words)
+
+
+class QuestionBank:
+    """
+    Validated quiz questions per fiche and difficulty, tied to the hash of the
+    fiche content they were written from; a fiche's questions are dropped once
+    its content changes. Also records which questions each user was served, so
+    a user's next quizzes can avoid them for `seen_seconds`.
+
+    Every method blocks on SQLite, so async code calls them through
+    asyncio.to_thread. Several uvicorn workers can share the file.
+    """
+
+    def __init__(self, path: str, seen_seconds=QUESTION_BANK_SEEN_SECONDS):
+        self.path = path
+        self.seen_seconds = seen_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "id INTEGER PRIMARY KEY, fiche_id TEXT NOT NULL, difficulty TEXT NOT NULL, "
+                "content_hash TEXT NOT NULL, question_key TEXT NOT NULL, question TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "UNIQUE (fiche_id, difficulty, content_hash, question_key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen ("
+                "user TEXT NOT NULL, question_id INTEGER NOT NULL, seen_at REAL NOT NULL, "
+                "PRIMARY KEY (user, question_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS seen_question ON seen (question_id)")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def sample(self, fiche_id: str, difficulty: str, digest: str, count: int, user=None):
+        """
+        Up to `count` random questions of the fiche that `user` was not served
+        recently, as (id, question) pairs. Questions written from another
+        version of the fiche are deleted first.
+        """
+        with self.connect() as conn:
+            conn.execute(
+                "DELETE FROM seen WHERE question_id IN ("
+                "SELECT id FROM questions WHERE fiche_id = ? AND content_hash != ?)",
+                (fiche_id, digest)
+            )
+            invalidated = conn.execute(
+                "DELETE FROM questions WHERE fiche_id = ? AND content_hash != ?", (fiche_id, digest)
+            ).rowcount
+            if invalidated:
+                stats.incr("question_bank.invalidated", invalidated)
+            rows = conn.execute(
+                "SELECT id, question FROM questions "
+                "WHERE fiche_id = ? AND difficulty = ? AND content_hash = ? AND id NOT IN ("
+                "SELECT question_id FROM seen WHERE user = ? AND seen_at > ?) "
+                "ORDER BY RANDOM() LIMIT ?",
+                (fiche_id, difficulty, digest, user, time.time() - self.seen_seconds, count)
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def least_recently_seen(self, fiche_id: str, difficulty: str, digest: str, count: int, user, exclude=()):
+        """Questions the user has seen, oldest first; fills a quiz when nothing new can be had."""
+        exclude = list(exclude)
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT q.id, q.question FROM questions q LEFT JOIN seen s ON s.question_id = q.id AND s.user = ? "
+                "WHERE q.fiche_id = ? AND q.difficulty = ? AND q.content_hash = ? "
+                f"AND q.id NOT IN ({','.join('?' * len(exclude))}) "
+                "ORDER BY COALESCE(s.seen_at, 0) LIMIT ?",
+                (user, fiche_id, difficulty, digest, *exclude, count)
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def known_questions(self, fiche_id: str, difficulty: str, digest: str, limit: int):
+        """The most recent questions of the fiche, to keep new ones from repeating them."""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT question FROM questions WHERE fiche_id = ? AND difficulty = ? AND content_hash = ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (fiche_id, difficulty, digest, limit)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def add(self, fiche_id: str, difficulty: str, digest: str, questions):
+        """Store new questions; returns the (id, question) pairs stored, duplicates excluded."""
+        added = []
+        now = time.time()
+        with self.connect() as conn:
+            for question in questions:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO questions "
+                    "(fiche_id, difficulty, content_hash, question_key, question, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (fiche_id, difficulty, digest, question_key(question), json.dumps(question), now)
+                )
+                if cursor.rowcount:
+                    added.append((cursor.lastrowid, question))
+        stats.incr("question_bank.added", len(added))
+        return added
+
+    def mark_seen(self, user, question_ids):
+        """Record that user was served these questions, forgetting their views older than the window."""
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("DELETE FROM seen WHERE user = ? AND seen_at < ?", (user, now - self.seen_seconds))
+            conn.executemany(
+                "INSERT OR REPLACE INTO seen (user, question_id, seen_at) VALUES (?, ?, ?)",
+                [(user, question_id, now) for question_id in question_ids]
+            )
+
+
+_question_bank = None
+
+
+def get_question_bank():
+    """Return the process-wide question bank, or None when QUESTION_BANK_DB is empty."""
+    global _question_bank
+    if not QUESTION_BANK_DB:
+        return None
+    if _question_bank is None:
+        _question_bank = QuestionBank(QUESTION_BANK_DB)
+    return _question_bank
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import uuid
+
+from src.creation.generateFiche import LlamaFicheGenerator
+from src.evaluation.evaluateFiche import LLamaEvaluateFiche
+from src.llm.config import MODEL_NAME, GENERATION_OPTIONS, LLM_SCHEMA_MODE
+from src.llm.jsonRepair import clean_json_response
+from src.llm.metrics import timed
+from src.llm.ollamaClient import get_llm_client
+from src.llm.resilience import ParseError, ValidationError, describe_error, retry_policy
+from src.llm.responseCache import get_response_cache, make_cache_key
+from src.llm.schemas import fiche_review_schema, record_attempt, record_response
+from src.llm.stats import stats
+from src.llm.structuredLog import get_logger, log_payload
+from src.llm.tokenBudget import fiche_review_num_predict
+
+logger = get_logger("evaluated_fiche")
+
+# Follow-up turn after the generated fiche; static, so the whole conversation
+# before it is a prefix Ollama has just evaluated
+REVIEW_PROMPT = """FICHE REVIEW:
+Now act as an impartial expert educational content evaluator and assess the study fiche you just wrote (the "content" of your answer). Be critical: judge the fiche as written, not what it was meant to be.
+
+SCORING CRITERIA (0-25 points each, total 100):
+1. CLARITY: language appropriate for the difficulty, clear definitions and explanations, logical flow, no ambiguity
+2. COHERENCE: internal consistency, logical connections between concepts, unified focus, smooth transitions
+3. COMPLETENESS: coverage of the essential concepts of the source text, adequate depth for the difficulty, relevant examples
+4. STRUCTURE: effective headers and organization, formatting and readability, clear section divisions
+
+SCORING GUIDELINES:
+- Content with no educational substance should score below 30
+- Medium scores (50-70) are for content with clear educational value but some deficiencies
+- score is the sum of the four criteria
+
+Respond ONLY with valid JSON, without markdown code blocks or comments, in this format:
+{"qualityScore": {"score": 85, "criteria": {"clarity": 22, "coherence": 21, "completeness": 20, "structure": 22}, "feedback": "Strengths, weaknesses and how to improve, in one paragraph"}}
+"""
+
+
+class LlamaEvaluatedFicheGenerator:
+    """
+    Generate a fiche and score it in one conversation. The review is a
+    follow-up turn after the generated fiche, sent to the backend that wrote
+    it, so Ollama reuses the KV cache of the whole exchange and only has to
+    evaluate the review instructions. The classification comes with the
+    fiche; the review adds its qualityScore. When the review fails, the fiche
+    is evaluated on its own by LLamaEvaluateFiche.
+    """
+
+    def __init__(self, domain, difficulty, text):
+        self.generator = LlamaFicheGenerator(domain=domain, difficulty=difficulty, text=text)
+        # Keeps both turns on one backend
+        self.generator.affinity = uuid.uuid4().hex
+        self.options = dict(GENERATION_OPTIONS)
+        self.options["num_predict"] = fiche_review_num_predict()
+        # JSON schema enforced at decode time in schema mode
+        self.format = fiche_review_schema() if LLM_SCHEMA_MODE else None
+
+    def cache_key(self):
+        """Key identifying this request's prompts, model and options."""
+        return make_cache_key(MODEL_NAME, [self.generator.cache_key(), REVIEW_PROMPT], self.options, self.format)
+
+    def review_cache_key(self, fiche):
+        return make_cache_key(MODEL_NAME, [self.generator.cache_key(), fiche, REVIEW_PROMPT], self.options, self.format)
+
+    def get_review_messages(self, fiche):
+        """The generation turn as the model saw and wrote it, then the review request."""
+        generation_messages = self.generator.generation_messages or self.generator.get_messages()
+        reply = self.generator.raw_response or json.dumps(fiche, ensure_ascii=False)
+        return [
+            *generation_messages,
+            {"role": "assistant", "content": reply},
+            {"role": "user", "content": REVIEW_PROMPT}
+        ]
+
+    @staticmethod
+    def validate_review(parsed_json):
+        """Error message for an invalid review, None when it is valid."""
+        quality_score = parsed_json.get("qualityScore") if isinstance(parsed_json, dict) else None
+        if not isinstance(quality_score, dict):
+            return "Missing required key: qualityScore"
+        if "score" not in quality_score:
+            return "Missing qualityScore key: score"
+        return LLamaEvaluateFiche.validate_section(quality_score)
+
+    async def review(self, fiche, use_cache=True, max_retries=2):
+        """qualityScore of the fiche just generated."""
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            key = self.review_cache_key(fiche)
+            with timed("cache"):
+                cached = await cache.get(key)
+            if cached is not None:
+                return cached
+        messages = self.get_review_messages(fiche)
+
+        last_error = None
+        for attempt in range(max_retries):
+            if attempt > 0 and not await retry_policy.before_retry("fiche_review", attempt, last_error):
+                break
+            record_attempt("fiche_review", self.format is not None)
+            try:
+                result = await get_llm_client().chat(
+                    model=MODEL_NAME,
+                    messages=messages,
+                    options=self.options,
+                    format=self.format,
+                    stop_at_json_end=True,
+                    affinity=self.generator.affinity
+                )
+                raw_response = result["message"]["content"]
+                record_response("fiche_review", raw_response, self.format is not None)
+                log_payload(logger, logging.DEBUG, "Raw response", raw_response, attempt=attempt + 1)
+                with timed("clean"):
+                    cleaned_response = clean_json_response(raw_response)
+                with timed("parse"):
+                    parsed_json = json.loads(cleaned_response)
+                validation_message = self.validate_review(parsed_json)
+                if validation_message:
+                    logger.warning("Structure validation failed",
+                                   extra={"attempt": attempt + 1, "error": validation_message})
+                    last_error = ValidationError(validation_message)
+                    continue
+                quality_score = parsed_json["qualityScore"]
+                if cache is not None:
+                    await cache.set(key, quality_score)
+                return quality_score
+            except json.JSONDecodeError as e:
+                last_error = ParseError(str(e))
+            except Exception as e:
+                logger.warning("Unexpected error", extra={"attempt": attempt + 1, "error": str(e)})
+                last_error = e
+
+        logger.warning("Fiche review failed, evaluating the fiche on its own",
+                       extra={"error": describe_error(last_error)})
+        stats.incr("fiche_review.fallbacks")
+        # Long fiches are summarized on the CPU first: keep that off the event loop
+        evaluator = await asyncio.to_thread(LLamaEvaluateFiche, fiche["content"])
+        evaluation = await evaluator.evaluateFiche(use_cache=use_cache)
+        return evaluation["qualityScore"]
+
+    async def generate_fiche(self, use_cache=True):
+        """The generated fiche with its qualityScore."""
+        fiche = await self.generator.generate_fiche(use_cache=use_cache)
+        if "content" not in fiche:
+            # Generation failed: its fallback response already carries a zero score
+            return fiche
+        return {**fiche, "qualityScore": await self.review(fiche, use_cache)}
+
+    async def stream_fiche(self, use_cache=True):
+        """
+        Stream the fiche like LlamaFicheGenerator.stream_fiche, then yield
+        {"event": "qualityScore"} once it is reviewed, and finally
+        {"event": "done"} with the complete fiche and its qualityScore.
+        """
+        fiche = None
+        async for event in self.generator.stream_fiche(use_cache=use_cache):
+            if event["event"] == "done":
+                fiche = event["fiche"]
+            else:
+                yield event
+        if "content" in fiche:
+            quality_score = await self.review(fiche, use_cache)
+            yield {"event": "qualityScore", "data": quality_score}
+            fiche = {**fiche, "qualityScore": quality_score}
+        yield {"event": "done", "fiche": fiche}
@@ -1,126 +1,224 @@
-import ollama 
+import asyncio
 import json
-import re
+import logging
+import time
 
-class LlamaFicheGenerator:
-    def __init__(self, domain, difficulty, text):
-        self.domain = domain
-        self.difficulty = difficulty
-        self.text=text
+from src.llm.config import (
+    MODEL_NAME,
+    GENERATION_OPTIONS,
+    LLM_SCHEMA_MODE,
+    LLM_STOP_AT_JSON_END,
+    FICHE_LONG_TEXT_TOKENS,
+    FICHE_CHUNK_TOKENS
+)
+from src.llm.jsonRepair import clean_json_response
+from src.llm.metrics import record_stage, timed
+from src.llm.ollamaClient import get_llm_client
+from src.llm.resilience import ParseError, TransportError, ValidationError, describe_error, retry_policy
+from src.llm.responseCache import get_response_cache, make_cache_key
+from src.llm.schemas import fiche_schema, record_attempt, record_response
+from src.llm.stats import stats
+from src.llm.streamingJson import IncrementalObjectParser
+from src.llm.structuredLog import get_logger, log_payload
+from src.llm.tokenBudget import (
+    CHUNK_SUMMARY_TOKENS,
+    chunk_text_tokens,
+    fiche_num_predict,
+    fiche_text_tokens,
+    retry_num_predict,
+    truncated
+)
+from src.llm.textChunker import CHARS_PER_TOKEN, estimate_tokens, split_into_chunks
 
+logger = get_logger("fiche")
 
 
-    def clean_json_response(self, response) -> str:
-        """Clean the model response to extract valid JSON."""
-        
-        # Handle non-string types first
-        if isinstance(response, dict):
-            return json.dumps(response)
-        if not isinstance(response, str):
-            response = str(response)
-
-        # Remove markdown code block indicators like ```json or ```
-        response = re.sub(r"```json\s*", "", response, flags=re.IGNORECASE)
-        response = re.sub(r"```", "", response)
-
-        # Remove any text before the first {
-        start_idx = response.find("{")
-        if start_idx != -1:
-            response = response[start_idx:]
-
-        # Remove any text after the last }
-        end_idx = response.rfind("}")
-        if end_idx != -1:
-            response = response[:end_idx + 1]
-
-        # CRITICAL: Remove JSON comments (// style comments)
-        # Remove single-line comments
-        response = re.sub(r'//.*?(?=\n|$)', '', response)
-        # Remove multi-line comments
-        response = re.sub(r'/\*.*?\*/', '', response, flags=re.DOTALL)
-
-        # Clean up common formatting issues
-        response = response.strip()
-
-        # Remove trailing commas before closing braces/brackets
-        response = re.sub(r',\s*}', '}', response)
-        response = re.sub(r',\s*]', ']', response)
-        
-        # Fix common JSON issues
-        # Replace single quotes with double quotes (but be careful with apostrophes)
-        response = re.sub(r"(?<!\w)'(\w)", r'"\1', response)  # 'word -> "word
-        response = re.sub(r"(\w)'(?!\w)", r'\1"', response)   # word' -> word"
-        
-        return response
-
-
-    
-  
+def prompt_tokens(messages) -> int:
+    return estimate_tokens("".join(message["content"] for message in messages))
 
-    def get_domain_instruction(self):
+DOMAIN_GUIDELINES = {
+    "mathematics": "Include formulas, step-by-step solutions, and mathematical notation. Provide worked examples and common mistakes to avoid.",
+    "physics": "Include physical laws, formulas, units, and real-world applications. Explain concepts with analogies and practical examples.",
+    "chemistry": "Include chemical equations, molecular structures, reaction mechanisms, and laboratory applications.",
+    "biology": "Include biological processes, diagrams descriptions, classification systems, and physiological functions.",
+    "history": "Include dates, key figures, cause-and-effect relationships, and historical context.",
+    "geography": "Include locations, geographical features, climate patterns, and human-environment interactions.",
+    "literature": "Include literary devices, themes, character analysis, and historical context.",
+    "philosophy": "Include key arguments, logical reasoning, different perspectives, and critical thinking approaches.",
+    "computer_science": "Include algorithms, code examples, technical concepts, and practical implementations.",
+    "economics": "Include economic theories, graphs, real-world applications, and current examples.",
+    "law": "Include legal principles, case studies, statutory references, and practical applications.",
+    "medicine": "Include anatomical references, physiological processes, symptoms, and clinical applications.",
+    "psychology": "Include psychological theories, research findings, practical applications, and case studies.",
+    "sociology": "Include social theories, research methods, cultural contexts, and contemporary examples.",
+    "art": "Include artistic techniques, historical periods, cultural significance, and visual analysis.",
+    "music": "Include musical theory, historical context, technical aspects, and listening examples.",
+    "other": "Provide clear explanations, practical examples, and structured learning content."
+}
 
-        return """
-"mathematics": "Include formulas, step-by-step solutions, and mathematical notation. Provide worked examples and common mistakes to avoid.",
-"physics": "Include physical laws, formulas, units, and real-world applications. Explain concepts with analogies and practical examples.",
-"chemistry": "Include chemical equations, molecular structures, reaction mechanisms, and laboratory applications.",
-"biology": "Include biological processes, diagrams descriptions, classification systems, and physiological functions.",
-"history": "Include dates, key figures, cause-and-effect relationships, and historical context.",
-"geography": "Include locations, geographical features, climate patterns, and human-environment interactions.",
-"literature": "Include literary devices, themes, character analysis, and historical context.",
-"philosophy": "Include key arguments, logical reasoning, different perspectives, and critical thinking approaches.",
-"computer_science": "Include algorithms, code examples, technical concepts, and practical implementations.",
-"economics": "Include economic theories, graphs, real-world applications, and current examples.",
-"law": "Include legal principles, case studies, statutory references, and practical applications.",
-"medicine": "Include anatomical references, physiological processes, symptoms, and clinical applications.",
-"psychology": "Include psychological theories, research findings, practical applications, and case studies.",
-"sociology": "Include social theories, research methods, cultural contexts, and contemporary examples.",
-"art": "Include artistic techniques, historical periods, cultural significance, and visual analysis.",
-"music": "Include musical theory, historical context, technical aspects, and listening examples.",
-"other": "Provide clear explanations, practical examples, and structured learning content."
-"""
+DIFFICULTY_GUIDELINES = {
+    "easy": "Use simple language, basic concepts, and plenty of examples. Focus on fundamental understanding.",
+    "medium": "Use standard academic language, intermediate concepts, and balanced theory-practice approach.",
+    "hard": "Use advanced terminology, complex concepts, and detailed analysis. Include challenging examples."
+}
 
-    def get_difficulty_instruction(self):
-        return """
-"easy": "Use simple language, basic concepts, and plenty of examples. Focus on fundamental understanding.",
-"medium": "Use standard academic language, intermediate concepts, and balanced theory-practice approach.",
-"hard": "Use advanced terminology, complex concepts, and detailed analysis. Include challenging examples."
-"""
-
-    def generate_prompt(self):
-        domain_instructions = self.get_domain_instruction()
-        difficulty_instructions = self.get_difficulty_instruction()
-        return f"""
-You are an expert educational content creator. Create a comprehensive study fiche based on the user's request. 
+# Identical for every request, so Ollama can reuse the KV cache for this prefix
+SYSTEM_PROMPT = """You are an expert educational content creator. Create a comprehensive study fiche from the text given in the user's request.
 You MUST respond with a valid JSON object only, no additional text before or after.
 
-text used to genrate the fiche is {self.text}
-DOMAIN: {self.domain}
-DIFFICULTY: {self.difficulty} 
-DOMAIN GUIDELINES: {domain_instructions}
-DIFFICULTY GUIDELINES: {difficulty_instructions}
-
 Requirements:
-- Create educational content appropriate for {self.difficulty} level
-- Focus specifically on {self.domain} subject matter
+- Create educational content appropriate for the requested DIFFICULTY level
+- Focus specifically on the requested DOMAIN subject matter
+- Follow the DOMAIN GUIDELINES and DIFFICULTY GUIDELINES given with the request
 - Include practical examples and clear explanations
 - Structure content with headers, bullet points, and sections
 - Extract 3-5 relevant topic keywords
 - Estimate study time in minutes (5-120 minutes based on content length and difficulty)
 
 RESPOND WITH ONLY THIS JSON FORMAT:
-{{
+{
   "title": "Clear, descriptive title (max 200 characters)",
   "content": "Generate a well-structured educational study sheet with Markdown headings, bullet points, bold text, emojis, and code/formulas where applicable. with:\\n# Main Title\\n\\n## Key Concepts\\n- Concept 1: explanation\\n- Concept 2: explanation\\n\\n## Detailed Explanation\\nDetailed content here...\\n\\n## Examples\\n- Example 1\\n- Example 2\\n\\n## Summary\\nKey takeaways... key words in bold",
-  "classification": {{
-    "domain": "{self.domain}",
-    "difficulty": "{self.difficulty}",
+  "classification": {
+    "domain": "the requested DOMAIN",
+    "difficulty": "the requested DIFFICULTY",
     "topics": ["topic1", "topic2", "topic3"],
     "estimatedStudyTime": 25
-  }}
-}}
+  }
+}
+"""
+
+
+class LlamaFicheGenerator:
+    def __init__(self, domain, difficulty, text):
+        self.domain = domain
+        self.difficulty = difficulty
+        self.text=text
+        self.options = dict(GENERATION_OPTIONS)
+        # Longer texts are condensed before the final call, so that its prompt and output fit in num_ctx
+        self.text_limit = fiche_text_tokens(prompt_tokens(self.get_messages(text="")), FICHE_LONG_TEXT_TOKENS)
+        self.chunk_tokens = chunk_text_tokens(estimate_tokens(self.generate_chunk_prompt("", 99, 99)),
+                                              FICHE_CHUNK_TOKENS)
+        self.options["num_predict"] = fiche_num_predict(min(estimate_tokens(text), self.text_limit))
+        # JSON schema enforced at decode time in schema mode
+        self.format = fiche_schema(domain, difficulty) if LLM_SCHEMA_MODE else None
+        # Set by a caller that continues the conversation, e.g. to evaluate the fiche
+        self.affinity = None
+        # Messages and raw reply of the last generation, None when the fiche came from the cache
+        self.generation_messages = None
+        self.raw_response = None
+
+    def get_domain_instruction(self):
+        """Guideline for the requested domain only."""
+        return DOMAIN_GUIDELINES.get(self.domain.strip().lower(), DOMAIN_GUIDELINES["other"])
+
+    def get_difficulty_instruction(self):
+        """Guideline for the requested difficulty only."""
+        return DIFFICULTY_GUIDELINES.get(self.difficulty.strip().lower(), DIFFICULTY_GUIDELINES["medium"])
+
+    def generate_prompt(self, text=None):
+        """Per-request part of the prompt; the static instructions live in SYSTEM_PROMPT."""
+        text = self.text if text is None else text
+        return f"""DOMAIN: {self.domain}
+DIFFICULTY: {self.difficulty}
+DOMAIN GUIDELINES: {self.get_domain_instruction()}
+DIFFICULTY GUIDELINES: {self.get_difficulty_instruction()}
+
+TEXT USED TO GENERATE THE FICHE:
+{text}
+"""
+
+    def get_messages(self, text=None):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": self.generate_prompt(text)}
+        ]
+
+    def cache_key(self):
+        """Key identifying this request's prompt, model and options."""
+        return make_cache_key(MODEL_NAME, self.get_messages(), self.options, self.format)
+
+    def generate_chunk_prompt(self, chunk, index, total):
+        return f"""
+You are an expert educational content creator. You are reading part {index} of {total} of a longer {self.domain} course document.
+Extract the key information of this part as concise Markdown notes: definitions, formulas, key facts, dates, names and examples.
+Keep the original terminology. Do not add an introduction or a conclusion, and do not answer in JSON.
+
+PART {index}/{total}:
+{chunk}
 """
+
+    async def summarize_chunk(self, chunk, index, total):
+        """Map step: condense one chunk of the source text into notes."""
+        try:
+            result = await get_llm_client().chat(
+                model=MODEL_NAME,
+                messages=[{"role": "user", "content": self.generate_chunk_prompt(chunk, index, total)}],
+                options={**self.options, "num_predict": CHUNK_SUMMARY_TOKENS}
+            )
+            return result["message"]["content"].strip()
+        except Exception as e:
+            logger.warning("Chunk summary failed, keeping its beginning",
+                           extra={"chunk": index, "chunks": total, "error": str(e)})
+            return chunk[:self.chunk_tokens * CHARS_PER_TOKEN // 4]
+
+    async def condense_text(self, max_levels=3):
+        """
+        Summarize chunks concurrently until the merged notes fit in one prompt.
+        Notes still too long after max_levels, or that stop shrinking, are cut
+        to fit.
+        """
+        text = self.text
+        for level in range(max_levels):
+            if estimate_tokens(text) <= self.text_limit:
+                break
+            chunks = split_into_chunks(text, self.chunk_tokens)
+            logger.info("Long text: summarizing chunks", extra={"chunks": len(chunks), "level": level + 1})
+            stats.incr("fiche.chunks", len(chunks))
+            notes = await asyncio.gather(*(
+                self.summarize_chunk(chunk, i + 1, len(chunks))
+                for i, chunk in enumerate(chunks)
+            ))
+            condensed = "\n\n".join(notes)
+            if estimate_tokens(condensed) >= estimate_tokens(text):
+                text = condensed
+                break
+            text = condensed
+        if estimate_tokens(text) > self.text_limit:
+            logger.warning("Notes still too long after summarizing, cutting them",
+                           extra={"tokens": estimate_tokens(text), "limit": self.text_limit})
+            stats.incr("fiche.notes_cut")
+            text = text[:self.text_limit * CHARS_PER_TOKEN]
+        return text
+
+    async def get_generation_messages(self):
+        """Messages for the final fiche call; long texts are condensed first."""
+        if estimate_tokens(self.text) <= self.text_limit:
+            return self.get_messages()
+        stats.incr("fiche.long_text_requests")
+        with timed("condense"):
+            notes = await self.condense_text()
+        return self.get_messages(text=notes)
+
+    @staticmethod
+    def validate_fiche(parsed_json):
+        """Error message for an incomplete fiche, None when it is valid."""
+        if not isinstance(parsed_json, dict):
+            return "Response is not a JSON object"
+        for key in ["title", "content"]:
+            if not isinstance(parsed_json.get(key), str) or not parsed_json[key].strip():
+                return f"Missing required key: {key}"
+        classification = parsed_json.get("classification")
+        if not isinstance(classification, dict):
+            return "Missing required key: classification"
+        for key in ["domain", "difficulty", "topics", "estimatedStudyTime"]:
+            if key not in classification:
+                return f"Missing classification key: {key}"
+        return None
+
     def create_fallback_response(self, error_message):
         """Create a fallback response when parsing fails"""
+        stats.incr("fiche.fallbacks")
         return {
             "title": "Evaluation Failed",
             "classification": {
@@ -141,49 +239,175 @@ RESPOND WITH ONLY THIS JSON FORMAT:
             }
         }
 
-    def generate_fiche(self, max_retries=3):
-        """Evaluate the fiche with robust error handling and JSON parsing"""
-        prompt = self.generate_prompt()
+    async def generate_fiche(self, max_retries=3, use_cache=True, num_predict=None):
+        """
+        Evaluate the fiche with robust error handling and JSON parsing.
+        num_predict overrides the output budget of the first attempt; an
+        attempt cut off at its budget is retried with a larger one.
+        """
+        with timed("prompt"):
+            messages = self.get_messages()
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(MODEL_NAME, messages, self.options, self.format)
+            with timed("cache"):
+                cached = await cache.get(key)
+            if cached is not None:
+                return cached
+        generation_messages = await self.get_generation_messages()
         
+        attempt_options = self.options if num_predict is None else {**self.options, "num_predict": num_predict}
+        retry_policy.on_request()
+        last_error = None
         for attempt in range(max_retries):
+            if attempt > 0 and not await retry_policy.before_retry("fiche", attempt, last_error):
+                break
+            record_attempt("fiche", self.format is not None)
             try:
                 # Get response from Ollama
-                result = ollama.chat(
-                    model="llama3.1:latest",
-                    messages=[{"role": "user", "content": prompt}],
-                    options={
-                        "temperature": 0.1,  # Even lower for more consistent JSON
-                        "top_p": 0.8,
-                        "repeat_penalty": 1.1,
-                        "num_predict": 2000  # Limit response length
-                    }
+                result = await get_llm_client().chat(
+                    model=MODEL_NAME,
+                    messages=generation_messages,
+                    options=attempt_options,
+                    format=self.format,
+                    stop_at_json_end=True,
+                    affinity=self.affinity
                 )
                 
                 raw_response = result["message"]["content"]
-                print(f"Raw response (attempt {attempt + 1}): {raw_response[:200]}...")
+                record_response("fiche", raw_response, self.format is not None)
+                log_payload(logger, logging.DEBUG, "Raw response", raw_response, attempt=attempt + 1)
+                if truncated(result):
+                    # Repairing the JSON would only close a partial fiche
+                    budget = retry_num_predict(attempt_options["num_predict"], prompt_tokens(generation_messages))
+                    logger.warning("Fiche cut off at its output budget",
+                                   extra={"attempt": attempt + 1, "num_predict": attempt_options["num_predict"],
+                                          "retry_num_predict": budget})
+                    stats.incr("fiche.truncated_retries")
+                    last_error = ValidationError(f"output cut off at {attempt_options['num_predict']} tokens")
+                    attempt_options = {**attempt_options, "num_predict": budget}
+                    continue
                 
                 # Clean the response
-                cleaned_response = self.clean_json_response(raw_response)
-                print(f"Cleaned response: {cleaned_response[:200]}...")
+                with timed("clean"):
+                    cleaned_response = clean_json_response(raw_response)
+                log_payload(logger, logging.DEBUG, "Cleaned response", cleaned_response, attempt=attempt + 1)
                 
                 # Try to parse JSON
-                parsed_json = json.loads(cleaned_response)
+                with timed("parse"):
+                    parsed_json = json.loads(cleaned_response)
                 
-                # Validate structure 
-                print("Successfully parsed and validated JSON response")
+                # Validate structure
+                validation_message = self.validate_fiche(parsed_json)
+                if validation_message:
+                    logger.warning("Structure validation failed",
+                                   extra={"attempt": attempt + 1, "error": validation_message})
+                    last_error = ValidationError(validation_message)
+                    continue
+                logger.debug("Successfully parsed and validated JSON response", extra={"attempt": attempt + 1})
+                self.generation_messages, self.raw_response = generation_messages, raw_response
+                if cache is not None:
+                    await cache.set(key, parsed_json)
                 return parsed_json
                         
             except json.JSONDecodeError as e:
-                print(f"JSON decode error on attempt {attempt + 1}: {e}")
-                print(f"Problematic JSON: {cleaned_response}")
-                if attempt == max_retries - 1:
-                    return self.create_fallback_response(f"JSON parsing failed: {e}")
+                log_payload(logger, logging.WARNING, "JSON decode error", cleaned_response,
+                            attempt=attempt + 1, error=str(e))
+                last_error = ParseError(str(e))
+                    
+            except TransportError as e:
+                logger.warning("Model server error", extra={"attempt": attempt + 1, "error": str(e)})
+                last_error = e
                     
             except Exception as e:
-                print(f"Unexpected error on attempt {attempt + 1}: {e}")
-                if attempt == max_retries - 1:
-                    return self.create_fallback_response(f"Unexpected error: {e}")
+                logger.warning("Unexpected error", extra={"attempt": attempt + 1, "error": str(e)})
+                last_error = e
         
-        return self.create_fallback_response("Max retries exceeded")
+        return self.create_fallback_response(describe_error(last_error))
     
-    
\ No newline at end of file
+    
+
+    async def stream_fiche(self, use_cache=True):
+        """
+        Stream the fiche as it is generated.
+
+        Yields {"event": "title"}, then {"event": "content"} Markdown deltas,
+        then {"event": "classification"}, and finally {"event": "done"} with the
+        complete fiche, which is the authoritative result.
+        """
+        with timed("prompt"):
+            messages = self.get_messages()
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(MODEL_NAME, messages, self.options, self.format)
+            with timed("cache"):
+                cached = await cache.get(key)
+            if cached is not None:
+                for field in ("title", "content", "classification"):
+                    if field in cached:
+                        yield {"event": field, "data": cached[field]}
+                yield {"event": "done", "fiche": cached}
+                return
+
+        parser = IncrementalObjectParser(stream_keys=["content"])
+        raw_parts = []
+        parse_seconds = 0.0
+        stream_error = None
+        retry_budget = None
+        try:
+            generation_messages = await self.get_generation_messages()
+            stream = get_llm_client().stream_chat(
+                model=MODEL_NAME,
+                messages=generation_messages,
+                options=self.options,
+                format=self.format,
+                affinity=self.affinity
+            )
+            record_attempt("fiche", self.format is not None)
+            async for part in stream:
+                chunk = part["message"]["content"]
+                raw_parts.append(chunk)
+                if part.get("done") and truncated(part):
+                    retry_budget = retry_num_predict(self.options["num_predict"], prompt_tokens(generation_messages))
+                    stats.incr("fiche.truncated_retries")
+                started = time.perf_counter()
+                events = parser.feed(chunk)
+                parse_seconds += time.perf_counter() - started
+                for kind, field, value in events:
+                    if kind == "delta":
+                        yield {"event": field, "data": value}
+                    elif field != "content":
+                        yield {"event": field, "data": value}
+                if parser.done and LLM_STOP_AT_JSON_END:
+                    # Anything after the closing brace would be discarded anyway
+                    stats.incr("llm.stopped_at_json_end")
+                    await stream.aclose()
+                    break
+        except Exception as e:
+            logger.warning("Streaming generation failed", extra={"error": str(e)})
+            stream_error = e
+        # One observation for the whole stream rather than one per chunk
+        record_stage("parse", parse_seconds)
+
+        record_response("fiche", "".join(raw_parts), self.format is not None)
+        if stream_error is not None:
+            validation_message = f"stream failed: {describe_error(stream_error)}"
+        elif not parser.done:
+            # Cut off or not JSON: repairing it would only close a partial fiche
+            validation_message = "stream ended before the JSON object was complete"
+        else:
+            validation_message = self.validate_fiche(parser.fields)
+        if validation_message:
+            logger.warning("Streamed fiche unusable, regenerating without streaming",
+                           extra={"error": validation_message})
+            stats.incr("fiche.stream_fallbacks")
+            fiche = await self.generate_fiche(max_retries=2, use_cache=use_cache, num_predict=retry_budget)
+            yield {"event": "done", "fiche": fiche}
+            return
+
+        fiche = parser.fields
+        logger.debug("Successfully streamed and parsed JSON response")
+        self.generation_messages, self.raw_response = generation_messages, "".join(raw_parts)
+        if cache is not None:
+            await cache.set(key, fiche)
+        yield {"event": "done", "fiche": fiche}
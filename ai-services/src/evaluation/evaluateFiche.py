@@ -1,92 +1,38 @@
-import ollama 
+import asyncio
 import json
-import re
-
-
-class LLamaEvaluateFiche:
-    def __init__(self, fiche_content):
-        self.fiche_content = fiche_content
-        
-
-    def clean_json_response(self, response) -> str:
-        """Clean the model response to extract valid JSON."""
-        
-        # Handle non-string types first
-        if isinstance(response, dict):
-            return json.dumps(response)
-        if not isinstance(response, str):
-            response = str(response)
-
-        # Remove markdown code block indicators like ```json or ```
-        response = re.sub(r"```json\s*", "", response, flags=re.IGNORECASE)
-        response = re.sub(r"```", "", response)
-
-        # Remove any text before the first {
-        start_idx = response.find("{")
-        if start_idx != -1:
-            response = response[start_idx:]
-
-        # Remove any text after the last }
-        end_idx = response.rfind("}")
-        if end_idx != -1:
-            response = response[:end_idx + 1]
-
-        # CRITICAL: Remove JSON comments (// style comments)
-        # Remove single-line comments
-        response = re.sub(r'//.*?(?=\n|$)', '', response)
-        # Remove multi-line comments
-        response = re.sub(r'/\*.*?\*/', '', response, flags=re.DOTALL)
-
-        # Clean up common formatting issues
-        response = response.strip()
-
-        # Remove trailing commas before closing braces/brackets
-        response = re.sub(r',\s*}', '}', response)
-        response = re.sub(r',\s*]', ']', response)
-        
-        # Fix common JSON issues
-        # Replace single quotes with double quotes (but be careful with apostrophes)
-        response = re.sub(r"(?<!\w)'(\w)", r'"\1', response)  # 'word -> "word
-        response = re.sub(r"(\w)'(?!\w)", r'\1"', response)   # word' -> word"
-        
-        return response
-
-    def validate_response_structure(self, parsed_json):
-        """Validate that the parsed JSON has the expected structure."""
-        required_keys = ["title", "classification", "qualityScore"]
-        
-        for key in required_keys:
-            if key not in parsed_json:
-                return False, f"Missing required key: {key}"
-        
-        # Validate classification structure
-        classification = parsed_json.get("classification", {})
-        classification_keys = ["domain", "difficulty", "topics", "estimatedStudyTime"]
-        for key in classification_keys:
-            if key not in classification:
-                return False, f"Missing classification key: {key}"
-        
-        # Validate qualityScore structure
-        quality_score = parsed_json.get("qualityScore", {})
-        quality_keys = ["score", "criteria", "feedback"]
-        for key in quality_keys:
-            if key not in quality_score:
-                return False, f"Missing qualityScore key: {key}"
-        
-        # Validate criteria structure
-        criteria = quality_score.get("criteria", {})
-        criteria_keys = ["clarity", "coherence", "completeness", "structure"]
-        for key in criteria_keys:
-            if key not in criteria:
-                return False, f"Missing criteria key: {key}"
-        
-        return True, "Valid structure"
-
-    def generate_evaluation_prompt(self):
-        return f"""You are an expert educational content evaluator with expertise across multiple academic domains. Your task is to comprehensively assess a study fiche (learning card), generate appropriate metadata, provide detailed quality feedback.
-
-FICHE CONTENT TO EVALUATE:
-{self.fiche_content}
+import logging
+
+from src.evaluation.sections import CRITERIA, aggregate_scores, outline, split_sections
+from src.llm.config import (
+    MODEL_NAME,
+    GENERATION_OPTIONS,
+    LLM_SCHEMA_MODE,
+    EVALUATION_INCREMENTAL,
+    EVALUATION_CONTENT_TOKENS,
+    SEMANTIC_CACHE_MODEL
+)
+from src.llm.extractiveSummary import condense
+from src.llm.jsonRepair import clean_json_response
+from src.llm.metrics import timed
+from src.llm.ollamaClient import get_llm_client
+from src.llm.resilience import ParseError, TransportError, ValidationError, describe_error, retry_policy
+from src.llm.responseCache import get_response_cache, make_cache_key
+from src.llm.schemas import (
+    evaluation_schema,
+    evaluation_metadata_schema,
+    section_evaluation_schema,
+    record_attempt,
+    record_response
+)
+from src.llm.semanticCache import get_semantic_cache, namespace_for
+from src.llm.stats import stats
+from src.llm.structuredLog import get_logger, log_payload
+from src.llm.tokenBudget import evaluation_num_predict, evaluation_metadata_num_predict, section_evaluation_num_predict
+
+logger = get_logger("evaluation")
+
+# Identical for every request, so Ollama can reuse the KV cache for this prefix
+SYSTEM_PROMPT = """You are an expert educational content evaluator with expertise across multiple academic domains. Your task is to comprehensively assess the study fiche (learning card) given in the user's message, generate appropriate metadata, provide detailed quality feedback.
 
 EVALUATION TASK:
 1. Generate appropriate title, domain classification, difficulty level, and topic keywords for this content
@@ -157,7 +103,7 @@ CRITICAL INSTRUCTIONS:
 - Numbers should be bare integers/floats, not strings
 
 RESPONSE FORMAT (must match exactly):
-{{"title": "Generated title here", "classification": {{"domain": "selected_domain", "difficulty": "assessed_difficulty", "topics": ["topic1", "topic2", "topic3"], "estimatedStudyTime": 25}}, "qualityScore": {{"score": 85, "criteria": {{"clarity": 22, "coherence": 21, "completeness": 20, "structure": 22}}, "feedback": "Detailed feedback explaining strengths, weaknesses, and improvements made}}}}
+{"title": "Generated title here", "classification": {"domain": "selected_domain", "difficulty": "assessed_difficulty", "topics": ["topic1", "topic2", "topic3"], "estimatedStudyTime": 25}, "qualityScore": {"score": 85, "criteria": {"clarity": 22, "coherence": 21, "completeness": 20, "structure": 22}, "feedback": "Detailed feedback explaining strengths, weaknesses, and improvements made"}}
 
 
 SPECIAL INSTRUCTIONS FOR MINIMAL CONTENT:
@@ -165,11 +111,236 @@ SPECIAL INSTRUCTIONS FOR MINIMAL CONTENT:
 - For unclear domain, use "other"
 - For minimal content, focus feedback on what's missing
 - Always generate valid JSON regardless of content quality
+"""
+
+
+# Incremental evaluation: one section at a time, so unchanged sections keep their cached scores
+SECTION_SYSTEM_PROMPT = """You are an expert educational content evaluator. You are given ONE section of a study fiche (learning card) and its heading. Score this section only, on its own merits.
+
+SCORING CRITERIA (0-25 points each):
+1. CLARITY: appropriate language, clear definitions and explanations, no ambiguity
+2. COHERENCE: internal consistency and logical connections within the section
+3. COMPLETENESS: covers what its heading promises, with adequate depth and relevant examples
+4. STRUCTURE: effective formatting (lists, emphasis, paragraphs) and readability
+
+SCORING GUIDELINES:
+- A section with no educational substance should score below 8 per criterion
+- A single sentence cannot exceed 10 points per criterion
+
+CRITICAL INSTRUCTIONS:
+- Respond ONLY with valid JSON, without markdown code blocks or comments
+- Numbers should be bare integers
+- Keep the feedback to one or two sentences without line breaks
+
+RESPONSE FORMAT (must match exactly):
+{"criteria": {"clarity": 22, "coherence": 21, "completeness": 20, "structure": 22}, "feedback": "What works in this section and what to improve"}
+"""
+
+METADATA_SYSTEM_PROMPT = """You are an expert educational content evaluator. You are given the OUTLINE of a study fiche (learning card): its title, its section headings and the beginning of each section. Generate its metadata.
+
+- title: a clear, descriptive title (max 200 characters) reflecting the main subject
+- domain (select one): mathematics, physics, chemistry, biology, history, geography, literature, philosophy, computer_science, economics, law, medicine, psychology, sociology, art, music, other
+- difficulty: "easy" (introductory), "medium" (intermediate, some technical terms) or "hard" (advanced, specialized)
+- topics: 3-5 precise, searchable keywords for the main subjects covered
+- estimatedStudyTime: minutes needed to study the whole fiche
 
+Respond ONLY with valid JSON, without markdown code blocks or comments, in this format:
+{"title": "Generated title here", "classification": {"domain": "selected_domain", "difficulty": "assessed_difficulty", "topics": ["topic1", "topic2", "topic3"], "estimatedStudyTime": 25}}
 """
 
+
+class LLamaEvaluateFiche:
+    def __init__(self, fiche_content):
+        self.fiche_content = fiche_content
+        # Long fiches are reduced to their key sentences for the whole-fiche prompt
+        self.prompt_content = condense(fiche_content, EVALUATION_CONTENT_TOKENS, "evaluation")
+        self.options = dict(GENERATION_OPTIONS)
+        self.options["num_predict"] = evaluation_num_predict()
+        # JSON schema enforced at decode time in schema mode
+        self.format = evaluation_schema() if LLM_SCHEMA_MODE else None
+        
+
+    def get_semantic_cache(self):
+        """Near-duplicate cache shared by evaluations made with this model, prompt and options."""
+        return get_semantic_cache("evaluation", namespace_for(MODEL_NAME, SYSTEM_PROMPT, self.options, self.format))
+
+    async def embed_content(self):
+        """Embedding of the fiche for the semantic cache; None when it cannot be computed."""
+        try:
+            embeddings = await get_llm_client().embed(model=SEMANTIC_CACHE_MODEL, input=self.fiche_content)
+        except Exception as e:
+            logger.warning("Embedding failed, skipping the semantic cache", extra={"error": str(e)})
+            stats.incr("semantic_cache.evaluation.embed_errors")
+            return None
+        return embeddings[0]
+
+    def validate_response_structure(self, parsed_json):
+        """Validate that the parsed JSON has the expected structure."""
+        required_keys = ["title", "classification", "qualityScore"]
+        
+        for key in required_keys:
+            if key not in parsed_json:
+                return False, f"Missing required key: {key}"
+        
+        # Validate classification structure
+        classification = parsed_json.get("classification", {})
+        classification_keys = ["domain", "difficulty", "topics", "estimatedStudyTime"]
+        for key in classification_keys:
+            if key not in classification:
+                return False, f"Missing classification key: {key}"
+        
+        # Validate qualityScore structure
+        quality_score = parsed_json.get("qualityScore", {})
+        quality_keys = ["score", "criteria", "feedback"]
+        for key in quality_keys:
+            if key not in quality_score:
+                return False, f"Missing qualityScore key: {key}"
+        
+        # Validate criteria structure
+        criteria = quality_score.get("criteria", {})
+        criteria_keys = ["clarity", "coherence", "completeness", "structure"]
+        for key in criteria_keys:
+            if key not in criteria:
+                return False, f"Missing criteria key: {key}"
+        
+        return True, "Valid structure"
+
+    def generate_evaluation_prompt(self):
+        """Per-request part of the prompt; the static instructions live in SYSTEM_PROMPT."""
+        if self.prompt_content != self.fiche_content:
+            return f"""FICHE CONTENT TO EVALUATE (excerpts: the most informative sentences of a longer fiche, in order; do not penalize what was left out):
+{self.prompt_content}
+"""
+        return f"""FICHE CONTENT TO EVALUATE:
+{self.fiche_content}
+"""
+
+    def get_messages(self):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": self.generate_evaluation_prompt()}
+        ]
+
+    def cache_key(self):
+        """Key identifying this request's prompt, model and options."""
+        return make_cache_key(MODEL_NAME, self.get_messages(), self.options, self.format)
+
+    def get_section_messages(self, section):
+        return [
+            {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+            {"role": "user", "content": f"SECTION HEADING: {section.heading or 'Introduction'}\n\nSECTION TO EVALUATE:\n{section.body}\n"}
+        ]
+
+    def get_metadata_messages(self, title, sections):
+        return [
+            {"role": "system", "content": METADATA_SYSTEM_PROMPT},
+            {"role": "user", "content": f"FICHE OUTLINE:\n{outline(title, sections)}\n"}
+        ]
+
+    @staticmethod
+    def validate_section(parsed_json):
+        """Error message for an invalid section evaluation, None when it is valid."""
+        criteria = parsed_json.get("criteria") if isinstance(parsed_json, dict) else None
+        if not isinstance(criteria, dict):
+            return "Missing required key: criteria"
+        for key in CRITERIA:
+            if not isinstance(criteria.get(key), (int, float)):
+                return f"Missing criteria key: {key}"
+        if "feedback" not in parsed_json:
+            return "Missing required key: feedback"
+        return None
+
+    @staticmethod
+    def validate_metadata(parsed_json):
+        """Error message for invalid metadata, None when it is valid."""
+        if not isinstance(parsed_json, dict) or "title" not in parsed_json:
+            return "Missing required key: title"
+        classification = parsed_json.get("classification")
+        if not isinstance(classification, dict):
+            return "Missing required key: classification"
+        for key in ["domain", "difficulty", "topics", "estimatedStudyTime"]:
+            if key not in classification:
+                return f"Missing classification key: {key}"
+        return None
+
+    async def ask_json(self, kind, messages, options, format, validate, cache, max_retries=2):
+        """
+        JSON answer for one part of an incremental evaluation, from the response
+        cache when the same part was evaluated before; None when every attempt failed.
+        """
+        key = make_cache_key(MODEL_NAME, messages, options, format)
+        cached = await cache.get(key)
+        if cached is not None:
+            stats.incr(f"{kind}.reused")
+            return cached
+        stats.incr(f"{kind}.evaluated")
+
+        last_error = None
+        for attempt in range(max_retries):
+            if attempt > 0 and not await retry_policy.before_retry(kind, attempt, last_error):
+                break
+            record_attempt(kind, format is not None)
+            try:
+                result = await get_llm_client().chat(
+                    model=MODEL_NAME,
+                    messages=messages,
+                    options=options,
+                    format=format,
+                    stop_at_json_end=True
+                )
+                raw_response = result["message"]["content"]
+                record_response(kind, raw_response, format is not None)
+                with timed("clean"):
+                    cleaned_response = clean_json_response(raw_response)
+                with timed("parse"):
+                    parsed_json = json.loads(cleaned_response)
+                validation_message = validate(parsed_json)
+                if validation_message:
+                    last_error = ValidationError(validation_message)
+                    continue
+                await cache.set(key, parsed_json)
+                return parsed_json
+            except json.JSONDecodeError as e:
+                last_error = ParseError(str(e))
+            except Exception as e:
+                last_error = e
+        logger.warning("Incremental evaluation step failed", extra={"kind": kind, "error": describe_error(last_error)})
+        return None
+
+    async def evaluate_sections(self, title, sections, cache):
+        """
+        Evaluate the fiche section by section. Unchanged sections reuse their
+        cached scores; the changed ones and the outline (for the title and
+        classification) are evaluated concurrently. None when a part failed.
+        """
+        schema_mode = self.format is not None
+        section_options = {**self.options, "num_predict": section_evaluation_num_predict()}
+        metadata_options = {**self.options, "num_predict": evaluation_metadata_num_predict()}
+        results = await asyncio.gather(
+            self.ask_json(
+                "evaluation_metadata", self.get_metadata_messages(title, sections), metadata_options,
+                evaluation_metadata_schema() if schema_mode else None, self.validate_metadata, cache
+            ),
+            *(
+                self.ask_json(
+                    "evaluation_section", self.get_section_messages(section), section_options,
+                    section_evaluation_schema() if schema_mode else None, self.validate_section, cache
+                )
+                for section in sections
+            )
+        )
+        if any(result is None for result in results):
+            return None
+        metadata, *evaluations = results
+        return {
+            "title": metadata["title"],
+            "classification": metadata["classification"],
+            "qualityScore": aggregate_scores(sections, evaluations)
+        }
+
     def create_fallback_response(self, error_message):
         """Create a fallback response when parsing fails"""
+        stats.incr("evaluation.fallbacks")
         return {
             "title": "Evaluation Failed",
             "classification": {
@@ -190,54 +361,93 @@ SPECIAL INSTRUCTIONS FOR MINIMAL CONTENT:
             }
         }
 
-    def evaluateFiche(self, max_retries=3):
+    async def evaluateFiche(self, max_retries=3, use_cache=True):
         """Evaluate the fiche with robust error handling and JSON parsing"""
-        prompt = self.generate_evaluation_prompt()
+        with timed("prompt"):
+            messages = self.get_messages()
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(MODEL_NAME, messages, self.options, self.format)
+            with timed("cache"):
+                cached = await cache.get(key)
+            if cached is not None:
+                return cached
+        semantic_cache = self.get_semantic_cache() if use_cache else None
+        embedding = None
+        if semantic_cache is not None:
+            with timed("semantic_cache"):
+                embedding = await self.embed_content()
+                cached = semantic_cache.lookup(embedding) if embedding is not None else None
+            if cached is not None:
+                return cached
         
+        retry_policy.on_request()
+        if EVALUATION_INCREMENTAL and cache is not None:
+            title, sections = split_sections(self.fiche_content)
+            if len(sections) >= 2:
+                evaluation = await self.evaluate_sections(title, sections, cache)
+                if evaluation is not None:
+                    await cache.set(key, evaluation)
+                    if embedding is not None:
+                        await semantic_cache.put(embedding, evaluation)
+                    return evaluation
+                stats.incr("evaluation.incremental_fallbacks")
+                logger.warning("Section evaluation failed, evaluating the whole fiche")
+
+        last_error = None
         for attempt in range(max_retries):
+            if attempt > 0 and not await retry_policy.before_retry("evaluation", attempt, last_error):
+                break
+            record_attempt("evaluation", self.format is not None)
             try:
                 # Get response from Ollama
-                result = ollama.chat(
-                    model="llama3.1:latest",
-                    messages=[{"role": "user", "content": prompt}],
-                    options={
-                        "temperature": 0.1,  # Even lower for more consistent JSON
-                        "top_p": 0.8,
-                        "repeat_penalty": 1.1,
-                        "num_predict": 2000  # Limit response length
-                    }
+                result = await get_llm_client().chat(
+                    model=MODEL_NAME,
+                    messages=messages,
+                    options=self.options,
+                    format=self.format,
+                    stop_at_json_end=True
                 )
                 
                 raw_response = result["message"]["content"]
-                print(f"Raw response (attempt {attempt + 1}): {raw_response[:200]}...")
+                record_response("evaluation", raw_response, self.format is not None)
+                log_payload(logger, logging.DEBUG, "Raw response", raw_response, attempt=attempt + 1)
                 
                 # Clean the response
-                cleaned_response = self.clean_json_response(raw_response)
-                print(f"Cleaned response: {cleaned_response[:200]}...")
+                with timed("clean"):
+                    cleaned_response = clean_json_response(raw_response)
+                log_payload(logger, logging.DEBUG, "Cleaned response", cleaned_response, attempt=attempt + 1)
                 
                 # Try to parse JSON
-                parsed_json = json.loads(cleaned_response)
+                with timed("parse"):
+                    parsed_json = json.loads(cleaned_response)
                 
                 # Validate structure
                 is_valid, validation_message = self.validate_response_structure(parsed_json)
                 if not is_valid:
-                    print(f"Structure validation failed: {validation_message}")
-                    if attempt == max_retries - 1:
-                        return self.create_fallback_response(f"Invalid structure: {validation_message}")
+                    logger.warning("Structure validation failed",
+                                   extra={"attempt": attempt + 1, "error": validation_message})
+                    last_error = ValidationError(validation_message)
                     continue
                 
-                print("Successfully parsed and validated JSON response")
+                logger.debug("Successfully parsed and validated JSON response", extra={"attempt": attempt + 1})
+                if cache is not None:
+                    await cache.set(key, parsed_json)
+                if embedding is not None:
+                    await semantic_cache.put(embedding, parsed_json)
                 return parsed_json
                         
             except json.JSONDecodeError as e:
-                print(f"JSON decode error on attempt {attempt + 1}: {e}")
-                print(f"Problematic JSON: {cleaned_response}")
-                if attempt == max_retries - 1:
-                    return self.create_fallback_response(f"JSON parsing failed: {e}")
+                log_payload(logger, logging.WARNING, "JSON decode error", cleaned_response,
+                            attempt=attempt + 1, error=str(e))
+                last_error = ParseError(str(e))
+                    
+            except TransportError as e:
+                logger.warning("Model server error", extra={"attempt": attempt + 1, "error": str(e)})
+                last_error = e
                     
             except Exception as e:
-                print(f"Unexpected error on attempt {attempt + 1}: {e}")
-                if attempt == max_retries - 1:
-                    return self.create_fallback_response(f"Unexpected error: {e}")
+                logger.warning("Unexpected error", extra={"attempt": attempt + 1, "error": str(e)})
+                last_error = e
         
-        return self.create_fallback_response("Max retries exceeded")
\ No newline at end of file
+        return self.create_fallback_response(describe_error(last_error))
\ No newline at end of file
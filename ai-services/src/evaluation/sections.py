@@ -0,0 +1,94 @@
+import re
+
+from src.llm.textChunker import estimate_tokens
+
+CRITERIA = ("clarity", "coherence", "completeness", "structure")
+MAX_CRITERION = 25
+
+_TITLE = re.compile(r"^#\s+(.+?)\s*#*\s*$")
+_HEADING = re.compile(r"^##\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+# Opening of each section shown in the outline used for the title and classification
+OUTLINE_SECTION_CHARS = 300
+
+
+class Section:
+    """One `## ` section of a fiche; `heading` is None for the text before the first heading."""
+
+    def __init__(self, heading, body):
+        self.heading = heading
+        self.body = body
+
+    @property
+    def weight(self) -> int:
+        return max(1, estimate_tokens(self.body))
+
+
+def normalize(text: str) -> str:
+    """Drop trailing spaces and repeated blank lines, so whitespace-only edits keep a section's hash."""
+    lines = [line.rstrip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def split_sections(content: str):
+    """
+    Split a Markdown fiche at its level-2 headings, ignoring headings inside
+    code fences. Returns (title, sections): the text of a leading `# ` heading,
+    or None, and the non-empty sections in document order.
+    """
+    title = None
+    sections = []
+    heading, lines = None, []
+    in_fence = False
+    for line in content.splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = _HEADING.match(line)
+            if match:
+                sections.append(Section(heading, normalize("\n".join(lines))))
+                heading, lines = match.group(1), []
+                continue
+            match = _TITLE.match(line)
+            if match and title is None and heading is None and not any(l.strip() for l in lines):
+                title = match.group(1)
+                continue
+        lines.append(line)
+    sections.append(Section(heading, normalize("\n".join(lines))))
+    return title, [s for s in sections if s.body or s.heading]
+
+
+def outline(title, sections) -> str:
+    """Title, headings and the opening of each section: enough to classify the fiche."""
+    parts = [f"# {title}" if title else "# (untitled)"]
+    for section in sections:
+        if section.heading:
+            parts.append(f"## {section.heading}")
+        if section.body:
+            opening = section.body[:OUTLINE_SECTION_CHARS]
+            parts.append(opening + ("..." if len(section.body) > OUTLINE_SECTION_CHARS else ""))
+    return "\n".join(parts)
+
+
+def aggregate_scores(sections, evaluations) -> dict:
+    """
+    Combine per-section evaluations into the whole-fiche qualityScore: each
+    criterion is the section scores' mean weighted by section length, and the
+    feedback comes from the weakest sections.
+    """
+    total_weight = sum(section.weight for section in sections)
+    criteria = {}
+    for criterion in CRITERIA:
+        weighted = sum(
+            section.weight * min(MAX_CRITERION, max(0, evaluation["criteria"][criterion]))
+            for section, evaluation in zip(sections, evaluations)
+        )
+        criteria[criterion] = round(weighted / total_weight)
+
+    ranked = sorted(zip(sections, evaluations), key=lambda pair: sum(pair[1]["criteria"].values()))
+    feedback = " ".join(
+        f"{section.heading or 'Introduction'}: {evaluation['feedback'].strip()}"
+        for section, evaluation in ranked[:3]
+        if evaluation.get("feedback", "").strip()
+    )
+    return {"score": sum(criteria.values()), "criteria": criteria, "feedback": feedback}
@@ -0,0 +1,393 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+import uuid
+
+from src.llm.config import (
+    JOB_DB,
+    JOB_WORKERS,
+    JOB_RESULT_TTL,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_GC_INTERVAL,
+    JOB_POLL_INTERVAL,
+    LLM_QUEUE_LIMIT,
+    LLM_TENANT_WEIGHTS
+)
+from src.llm.admission import DURATION_SMOOTHING, OverloadedError
+from src.llm.metrics import begin_request
+from src.llm.ollamaClient import get_llm_client
+from src.llm.scheduler import ANONYMOUS_TENANT, DEFAULT_PRIORITY, PRIORITIES, parse_priority, set_request_context
+from src.llm.stats import stats
+from src.llm.structuredLog import get_logger, set_request_id
+
+logger = get_logger("jobs")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+TERMINAL = (DONE, FAILED)
+
+# How often GET /jobs/{id}/events re-reads the job
+WATCH_INTERVAL = 0.5
+
+
+def payload_hash(kind: str, payload: dict, use_cache: bool, user=None) -> str:
+    """Jobs with the same hash would produce the same result and are merged."""
+    data = {"kind": kind, "payload": payload, "use_cache": use_cache}
+    if user is not None:
+        data["user"] = user
+    data = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """
+    The jobs table. Every method blocks on SQLite, so async code calls them
+    through asyncio.to_thread. Several uvicorn workers can share the file.
+    """
+
+    def __init__(self, path: str, result_ttl=JOB_RESULT_TTL, lease_seconds=JOB_LEASE_SECONDS,
+                 max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.result_ttl = result_ttl
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload_hash TEXT NOT NULL, "
+                "payload TEXT NOT NULL, use_cache INTEGER NOT NULL, status TEXT NOT NULL, "
+                "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "lease_until REAL, expires_at REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("tenant", "priority"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_payload_hash ON jobs (payload_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def submit(self, kind: str, payload: dict, use_cache: bool, tenant=None, priority=None, max_queued=None,
+               per_user=False):
+        """
+        Queue a job, or return the queued or running job with the same payload.
+        Returns (job_id, created, queued); job_id is None when max_queued jobs
+        already wait. A per_user job is only merged with the same tenant's job.
+        Finished jobs are never reused: a failed generation's fallback would be
+        served again, and a no-cache request wants a new result.
+        """
+        digest = payload_hash(kind, payload, use_cache, tenant if per_user else None)
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE payload_hash = ? AND status IN (?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (digest, QUEUED, RUNNING)
+            ).fetchone()
+            if row is not None:
+                return row[0], False, None
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if max_queued is not None and queued >= max_queued:
+                return None, False, queued
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload_hash, payload, use_cache, status, created_at, updated_at, "
+                "tenant, priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, digest, json.dumps(payload), int(use_cache), QUEUED, now, now, tenant, priority)
+            )
+            return job_id, True, queued + 1
+
+    def next_job_id(self, conn):
+        """
+        The queued job to run next, in the FairScheduler's order: priority
+        class first, then the tenant with the fewest running jobs for its
+        weight (across every process sharing the file), then arrival order.
+        """
+        # SQLite returns the id of the row holding MIN(created_at)
+        heads = conn.execute(
+            "SELECT id, tenant, priority, MIN(created_at) FROM jobs WHERE status = ? GROUP BY tenant, priority",
+            (QUEUED,)
+        ).fetchall()
+        if not heads:
+            return None
+        running = dict(conn.execute(
+            "SELECT tenant, COUNT(*) FROM jobs WHERE status = ? GROUP BY tenant", (RUNNING,)
+        ).fetchall())
+
+        def order(head):
+            _, tenant, priority, created_at = head
+            weight = max(LLM_TENANT_WEIGHTS.get(tenant or ANONYMOUS_TENANT, 1.0), 1e-6)
+            return PRIORITIES.index(parse_priority(priority)), running.get(tenant, 0) / weight, created_at
+
+        return min(heads, key=order)[0]
+
+    def claim(self):
+        """Take the next queued job and lease it; returns (id, kind, payload, use_cache, tenant, priority) or None."""
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            job_id = self.next_job_id(conn)
+            if job_id is None:
+                return None
+            row = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?, lease_until = ? "
+                "WHERE id = ? RETURNING id, kind, payload, use_cache, tenant, priority",
+                (RUNNING, now, now + self.lease_seconds, job_id)
+            ).fetchone()
+        return row[0], row[1], json.loads(row[2]), bool(row[3]), row[4], row[5]
+
+    def renew(self, job_id: str):
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING)
+            )
+
+    def finish(self, job_id: str, status: str, result=None, error=None):
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, "
+                "lease_until = NULL, expires_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 now, now + self.result_ttl, job_id)
+            )
+
+    def requeue(self, job_id: str):
+        """Put a job back in the queue, e.g. when its worker shuts down mid-run."""
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), updated_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), job_id, RUNNING)
+            )
+
+    def recover(self) -> int:
+        """Re-queue running jobs whose lease ran out (their process died); fail those out of attempts."""
+        now = time.time()
+        with self.connect() as conn:
+            failed = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, lease_until = NULL, expires_at = ? "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, f"Abandoned after {self.max_attempts} attempts", now, now + self.result_ttl,
+                 RUNNING, now, self.max_attempts)
+            ).rowcount
+            requeued = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, lease_until = NULL "
+                "WHERE status = ? AND lease_until < ?",
+                (QUEUED, now, RUNNING, now)
+            ).rowcount
+        if failed:
+            stats.incr("jobs.abandoned", failed)
+        return requeued
+
+    def purge_expired(self) -> int:
+        with self.connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND expires_at < ?",
+                (*TERMINAL, time.time())
+            ).rowcount
+
+    def get(self, job_id: str):
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, result, error, attempts, created_at, updated_at, expires_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None or (row[8] is not None and row[8] < time.time()):
+            return None
+        job = {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "attempts": row[5],
+            "created_at": row[6],
+            "updated_at": row[7]
+        }
+        if row[3] is not None:
+            job["result"] = json.loads(row[3])
+        if row[4] is not None:
+            job["error"] = row[4]
+        return job
+
+    def counts(self) -> dict:
+        with self.connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobQueue:
+    """
+    Runs long generations in the background. `handlers` maps each job kind to
+    (endpoint, handler): handler(payload, use_cache) returns the same body the
+    endpoint would, and endpoint labels the job's metrics. Results of
+    `per_user_kinds` are drawn for the submitting user and never reused.
+
+    Up to `workers` jobs run at once; 0 follows the LLM scheduler's slots, so
+    adding backends or raising LLM_MAX_CONCURRENCY also runs more jobs.
+    """
+
+    def __init__(self, handlers: dict, path=JOB_DB, workers=JOB_WORKERS, per_user_kinds=()):
+        self.handlers = handlers
+        self.per_user_kinds = set(per_user_kinds)
+        self.path = path
+        self.workers = workers
+        self.store = None
+        self.mean_seconds = None
+        self._wakeup = None
+        self._tasks = []
+        self._running = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    def concurrency(self) -> int:
+        """Jobs run at once."""
+        return self.workers or get_llm_client().scheduler.max_concurrency
+
+    def start(self):
+        """Open the store and start the dispatcher; needs a running event loop."""
+        if not self.path or self.store is not None:
+            return
+        self.store = JobStore(self.path)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._maintain()), asyncio.create_task(self._dispatch())]
+
+    async def close(self):
+        tasks = self._tasks + list(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._running.clear()
+        self.store = None
+
+    async def submit(self, kind: str, payload: dict, use_cache: bool, tenant=None, priority=None):
+        """
+        Queue a job; it runs later under the submitter's tenant and priority.
+        Raises OverloadedError when the queue is full, like synchronous requests.
+        """
+        max_queued = LLM_QUEUE_LIMIT if (priority or DEFAULT_PRIORITY) == DEFAULT_PRIORITY else LLM_QUEUE_LIMIT // 2
+        job_id, created, queued = await asyncio.to_thread(
+            self.store.submit, kind, payload, use_cache, tenant, priority, max_queued, kind in self.per_user_kinds
+        )
+        if job_id is None:
+            stats.incr("jobs.rejected")
+            mean = self.mean_seconds or 1.0
+            raise OverloadedError(max(1, math.ceil(mean * (queued + 1) / self.concurrency())))
+        if created:
+            stats.incr(f"jobs.submitted.{kind}")
+            self._wakeup.set()
+        else:
+            stats.incr("jobs.deduplicated")
+        return job_id, created
+
+    async def get(self, job_id: str):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def watch(self, job_id: str):
+        """Yield an event whenever the job's status changes, ending once it is done or failed."""
+        last_status = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                yield {"event": "error", "job_id": job_id, "error": "Job not found"}
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield {"event": job["status"], **job}
+                if last_status in TERMINAL:
+                    return
+            await asyncio.sleep(WATCH_INTERVAL)
+
+    async def counts(self) -> dict:
+        return await asyncio.to_thread(self.store.counts)
+
+    def _finished(self, task):
+        self._running.discard(task)
+        # A slot is free: claim the next job
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        """Claim queued jobs and run each in its own task, up to concurrency() at once."""
+        while True:
+            # Clear first: a job submitted or finished while we look still wakes us up
+            self._wakeup.clear()
+            try:
+                while len(self._running) < self.concurrency():
+                    job = await asyncio.to_thread(self.store.claim)
+                    if job is None:
+                        break
+                    task = asyncio.create_task(self._run(*job))
+                    self._running.add(task)
+                    task.add_done_callback(self._finished)
+            except sqlite3.Error:
+                logger.exception("Job store error")
+            try:
+                # Also polls for jobs queued by other processes or recovered
+                await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job_id, kind, payload, use_cache, tenant, priority):
+        endpoint, handler = self.handlers[kind]
+        set_request_id(job_id)
+        set_request_context(tenant, priority)
+        begin_request(endpoint)
+        lease = asyncio.create_task(self._renew(job_id))
+        started = time.perf_counter()
+        try:
+            result = await handler(payload, use_cache)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job to the next process to start
+            await asyncio.to_thread(self.store.requeue, job_id)
+            raise
+        except Exception as e:
+            logger.exception("Job failed", extra={"job_id": job_id, "kind": kind})
+            stats.incr(f"jobs.failed.{kind}")
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, None, str(e) or type(e).__name__)
+        else:
+            stats.incr(f"jobs.done.{kind}")
+            await asyncio.to_thread(self.store.finish, job_id, DONE, result)
+        finally:
+            lease.cancel()
+        seconds = time.perf_counter() - started
+        if self.mean_seconds is None:
+            self.mean_seconds = seconds
+        else:
+            self.mean_seconds += DURATION_SMOOTHING * (seconds - self.mean_seconds)
+
+    async def _renew(self, job_id):
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            await asyncio.to_thread(self.store.renew, job_id)
+
+    async def _maintain(self):
+        """Recover abandoned jobs at start-up and once per lease, and purge expired results."""
+        last_purge = 0.0
+        while True:
+            try:
+                requeued = await asyncio.to_thread(self.store.recover)
+                if requeued:
+                    logger.info("Re-queued interrupted jobs", extra={"count": requeued})
+                    stats.incr("jobs.recovered", requeued)
+                    self._wakeup.set()
+                if time.monotonic() - last_purge >= JOB_GC_INTERVAL:
+                    last_purge = time.monotonic()
+                    purged = await asyncio.to_thread(self.store.purge_expired)
+                    if purged:
+                        stats.incr("jobs.purged", purged)
+            except sqlite3.Error:
+                logger.exception("Job store error")
+            await asyncio.sleep(min(JOB_GC_INTERVAL, self.store.lease_seconds))
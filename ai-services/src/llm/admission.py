@@ -0,0 +1,68 @@
+import math
+import time
+from contextlib import contextmanager
+
+from src.llm.config import LLM_QUEUE_LIMIT
+from src.llm.scheduler import DEFAULT_PRIORITY, current_priority
+from src.llm.stats import stats
+
+# Weight of the latest request in the mean duration behind Retry-After
+DURATION_SMOOTHING = 0.2
+
+
+class OverloadedError(Exception):
+    """The generation queue is full; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many queued requests, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded queue in front of the generators. Up to `slots()` requests run and
+    `queue_limit` more may wait; the rest are turned away at once instead of
+    queueing without bound. Non-interactive requests may only use half of the
+    queue, so they cannot crowd out interactive ones.
+    """
+
+    def __init__(self, slots, queue_limit=LLM_QUEUE_LIMIT):
+        self.slots = slots
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.mean_seconds = None
+
+    def capacity(self, priority: str) -> int:
+        queue = self.queue_limit if priority == DEFAULT_PRIORITY else self.queue_limit // 2
+        return self.slots() + queue
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead has likely drained, from the mean request duration."""
+        mean = self.mean_seconds or 1.0
+        waiting = max(0, self.in_flight - self.slots())
+        return max(1, math.ceil(mean * (waiting + 1) / self.slots()))
+
+    def acquire(self, priority=None):
+        priority = priority or current_priority()
+        if self.in_flight >= self.capacity(priority):
+            stats.incr(f"admission.rejected.{priority}")
+            raise OverloadedError(self.retry_after())
+        self.in_flight += 1
+        stats.incr(f"admission.admitted.{priority}")
+        return time.perf_counter()
+
+    def release(self, admitted_at: float):
+        self.in_flight -= 1
+        seconds = time.perf_counter() - admitted_at
+        if self.mean_seconds is None:
+            self.mean_seconds = seconds
+        else:
+            self.mean_seconds += DURATION_SMOOTHING * (seconds - self.mean_seconds)
+
+    @contextmanager
+    def admit(self, priority=None):
+        admitted_at = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
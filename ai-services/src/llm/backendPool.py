@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+
+import ollama
+
+from src.llm.config import OLLAMA_HOST, OLLAMA_HOSTS, LLM_HEALTH_INTERVAL, LLM_HEALTH_TIMEOUT
+from src.llm.resilience import CircuitBreaker, CircuitOpenError, CLOSED
+from src.llm.stats import stats
+from src.llm.structuredLog import get_logger
+
+logger = get_logger("backends")
+
+
+def parse_hosts(spec: str):
+    """
+    Parse OLLAMA_HOSTS: comma-separated URLs, each optionally followed by
+    `|model|model...` to pin the models that backend serves.
+    """
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, *models = [part.strip() for part in entry.split("|")]
+        backends.append((url, [m for m in models if m] or None))
+    return backends
+
+
+class Backend:
+    """One Ollama server: its client, the calls in flight and its health."""
+
+    def __init__(self, url, models=None):
+        self.url = url
+        self.models = set(models) if models else None
+        self.client = ollama.AsyncClient(host=url)
+        self.probe_client = ollama.AsyncClient(host=url, timeout=LLM_HEALTH_TIMEOUT)
+        self.breaker = CircuitBreaker()
+        self.outstanding = 0
+
+    def serves(self, model) -> bool:
+        return self.models is None or model in self.models
+
+    @property
+    def healthy(self) -> bool:
+        return self.breaker.state == CLOSED
+
+    def info(self) -> dict:
+        return {
+            "url": self.url,
+            "models": sorted(self.models) if self.models else None,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding
+        }
+
+    async def close(self):
+        await self.client.close()
+        await self.probe_client.close()
+
+
+class BackendPool:
+    """
+    Routes each call to the least busy backend that serves the model.
+
+    A backend is ejected when its circuit breaker opens, either after
+    consecutive transport failures or after a failed health probe. It is
+    re-admitted after a successful probe, or when a half-open trial call
+    succeeds.
+    """
+
+    def __init__(self, hosts=None):
+        hosts = hosts if hosts is not None else (parse_hosts(OLLAMA_HOSTS) or [(OLLAMA_HOST, None)])
+        self.backends = [Backend(url, models) for url, models in hosts]
+        self._turn = itertools.count()
+        self._health_task = None
+
+    def candidates(self, model, exclude=None):
+        return [b for b in self.backends if b.serves(model) and b.breaker.can_call() and b is not exclude]
+
+    def healthy_count(self) -> int:
+        return sum(1 for b in self.backends if b.healthy)
+
+    def check_available(self, model):
+        """Fail fast, before queueing, when no backend can take a call for this model."""
+        if not any(b.serves(model) for b in self.backends):
+            raise ValueError(f"No Ollama backend serves model {model!r}")
+        if not self.candidates(model):
+            stats.incr("llm.circuit_rejected")
+            raise CircuitOpenError("circuit open on every backend")
+
+    def acquire(self, model, exclude=None, prefer=None) -> Backend:
+        """
+        Pick a backend (other than `exclude`) and count the call as outstanding on it.
+        `prefer` (the URL of a backend holding the prompt's prefix in its KV cache)
+        wins ties with the least busy backend.
+        """
+        candidates = self.candidates(model, exclude)
+        if not candidates:
+            stats.incr("llm.circuit_rejected")
+            raise CircuitOpenError("circuit open on every backend")
+        # Healthy backends first, then the fewest calls in flight; rotate between ties
+        turn = next(self._turn)
+        size = len(candidates)
+        _, backend = min(
+            enumerate(candidates),
+            key=lambda item: (
+                not item[1].healthy, item[1].outstanding, item[1].url != prefer, (item[0] - turn) % size
+            )
+        )
+        if prefer is not None:
+            stats.incr("llm.affinity_hits" if backend.url == prefer else "llm.affinity_misses")
+        backend.breaker.before_call()
+        backend.outstanding += 1
+        stats.incr(f"llm.backend_calls.{backend.url}")
+        return backend
+
+    def release(self, backend: Backend):
+        backend.outstanding -= 1
+
+    async def probe(self, backend: Backend):
+        """Health probe: list the models. Ejects on failure, re-admits on success."""
+        try:
+            response = await backend.probe_client.list()
+        except Exception as e:
+            if backend.healthy:
+                logger.warning("Backend failed its health probe, ejecting",
+                               extra={"backend": backend.url, "error": str(e) or type(e).__name__})
+            stats.incr("llm.backend_probe_failures")
+            backend.breaker.trip()
+            return
+        if backend.breaker.state != CLOSED:
+            logger.info("Backend passed its health probe, re-admitting", extra={"backend": backend.url})
+            backend.breaker.record_success()
+        if backend.models:
+            available = {m.model for m in response.models}
+            missing = backend.models - available
+            if missing:
+                logger.warning("Backend does not have its pinned models",
+                               extra={"backend": backend.url, "missing": sorted(missing)})
+
+    async def probe_all(self):
+        await asyncio.gather(*(self.probe(b) for b in self.backends))
+
+    async def _health_loop(self, on_change):
+        while True:
+            await asyncio.sleep(LLM_HEALTH_INTERVAL)
+            await self.probe_all()
+            on_change()
+
+    def start_health_checks(self, on_change):
+        if self._health_task is None and LLM_HEALTH_INTERVAL > 0:
+            self._health_task = asyncio.create_task(self._health_loop(on_change))
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for backend in self.backends:
+            await backend.close()
+
+    def info(self) -> list:
+        return [b.info() for b in self.backends]
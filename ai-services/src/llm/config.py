@@ -0,0 +1,166 @@
+import os
+
+# Ollama server and model shared by every generator
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+MODEL_NAME = os.getenv("LLM_MODEL", "llama3.1:latest")
+
+# Pool of Ollama servers, e.g. "http://gpu1:11434,http://gpu2:11434|llama3.1:latest";
+# `|model` pins the models a server hosts. Empty means OLLAMA_HOST alone.
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS", "")
+
+# How many LLM calls may run at once per healthy server; the rest wait in FIFO order
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+
+# Admission: generation requests beyond the LLM slots plus LLM_QUEUE_LIMIT, and
+# jobs beyond LLM_QUEUE_LIMIT queued, get a 429 with Retry-After; batch and
+# background work may only fill half the queue.
+# Queued calls are shared between users (X-User-Id) by weight, e.g. "u1=2,u2=0.5".
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "32"))
+LLM_TENANT_WEIGHTS = {
+    tenant.strip(): float(weight)
+    for tenant, weight in (
+        pair.split("=") for pair in os.getenv("LLM_TENANT_WEIGHTS", "").split(",")
+        if "=" in pair
+    )
+}
+
+# Health probes (GET /api/tags) that eject and re-admit pool servers; 0 disables them
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+LLM_HEALTH_TIMEOUT = float(os.getenv("LLM_HEALTH_TIMEOUT", "2"))
+
+# Context window requested for every call. Ollama's default (2048 or 4096 tokens,
+# depending on the version) silently drops the start of longer prompts; prompts
+# and output budgets are sized to fit in this one. The same value everywhere
+# keeps Ollama from reloading the model between calls.
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "8192"))
+
+# Sampling options sent with every generation
+GENERATION_OPTIONS = {
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "repeat_penalty": 1.1,
+    "num_predict": 2000,
+    "num_ctx": LLM_NUM_CTX
+}
+
+# Output budget: num_predict is sized per request from the expected output
+# (question count, input length) times LLM_NUM_PREDICT_MARGIN, within the
+# bounds; off means the fixed num_predict above. JSON calls are streamed
+# internally and stopped as soon as the top-level JSON value closes.
+LLM_ADAPTIVE_NUM_PREDICT = os.getenv("LLM_ADAPTIVE_NUM_PREDICT", "true").lower() == "true"
+LLM_NUM_PREDICT_MARGIN = float(os.getenv("LLM_NUM_PREDICT_MARGIN", "1.3"))
+LLM_NUM_PREDICT_MIN = int(os.getenv("LLM_NUM_PREDICT_MIN", "256"))
+LLM_NUM_PREDICT_MAX = int(os.getenv("LLM_NUM_PREDICT_MAX", "8192"))
+LLM_STOP_AT_JSON_END = os.getenv("LLM_STOP_AT_JSON_END", "true").lower() == "true"
+
+# Response cache: in-memory LRU, plus an optional SQLite file shared by workers
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+
+# Incremental evaluation: fiches with two or more `## ` sections are scored section
+# by section, and sections unchanged since an earlier evaluation reuse their
+# scores from the response cache, so re-evaluating an edit costs about the edit
+EVALUATION_INCREMENTAL = os.getenv("EVALUATION_INCREMENTAL", "false").lower() == "true"
+
+# Semantic cache for /evaluate-fiche (needs NumPy): a fiche whose embedding, from
+# SEMANTIC_CACHE_MODEL on Ollama, has a cosine similarity of at least THRESHOLD
+# with an evaluated one reuses its evaluation. PATH persists the index
+# (PATH.<name>.npz); empty keeps it in memory only.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "nomic-embed-text")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.98"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "4096"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "604800"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "")
+
+# Extractive pre-summarization (needs NumPy for the ranking): fiche content longer
+# than these budgets is cut down, on the CPU, to its most informative sentences
+# (TextRank over TF-IDF similarity, repeated paragraphs dropped) before it goes
+# into the quiz and whole-fiche evaluation prompts. A budget of 0 turns it off
+# for that prompt.
+EXTRACTIVE_SUMMARY_ENABLED = os.getenv("EXTRACTIVE_SUMMARY_ENABLED", "true").lower() == "true"
+QUIZ_CONTENT_TOKENS = int(os.getenv("QUIZ_CONTENT_TOKENS", "1500"))
+EVALUATION_CONTENT_TOKENS = int(os.getenv("EVALUATION_CONTENT_TOKENS", "3000"))
+
+# Constrain decoding with a JSON schema (Ollama `format`) instead of prose-only JSON
+LLM_SCHEMA_MODE = os.getenv("LLM_SCHEMA_MODE", "false").lower() == "true"
+
+# Keep the valid questions of a rejected quiz and only regenerate the missing ones
+QUIZ_PARTIAL_ACCEPTANCE = os.getenv("QUIZ_PARTIAL_ACCEPTANCE", "true").lower() == "true"
+
+# SQLite files given a relative path (QUESTION_BANK_DB, JOB_DB) are kept in this
+# directory, ai-services/data unless set, whatever the working directory
+AI_DATA_DIR = os.getenv("AI_DATA_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data"
+)
+
+# Question bank: validated quiz questions are kept per fiche and difficulty in
+# this SQLite file (empty disables it) and /create-quiz draws from it, asking the
+# model only for the shortfall. Questions a user (X-User-Id) was served in the
+# last QUESTION_BANK_SEEN_SECONDS are avoided; a fiche's questions are dropped
+# when its content changes.
+QUESTION_BANK_DB = os.getenv("QUESTION_BANK_DB", "question_bank.db")
+QUESTION_BANK_DB = QUESTION_BANK_DB and os.path.join(AI_DATA_DIR, QUESTION_BANK_DB)
+QUESTION_BANK_SEEN_SECONDS = float(os.getenv("QUESTION_BANK_SEEN_SECONDS", "604800"))
+
+# Long-document mode: texts above FICHE_LONG_TEXT_TOKENS are summarised chunk by
+# chunk (map) before the fiche is written from the merged notes (reduce).
+# 0 means the largest text whose prompt and fiche fit in LLM_NUM_CTX; both
+# settings are capped so that their calls fit in it.
+FICHE_LONG_TEXT_TOKENS = int(os.getenv("FICHE_LONG_TEXT_TOKENS", "0"))
+FICHE_CHUNK_TOKENS = int(os.getenv("FICHE_CHUNK_TOKENS", "1500"))
+
+# Retries: transport failures back off exponentially with full jitter; a shared
+# budget allows RATIO retries per request (plus MIN_PER_SECOND) so retries
+# cannot multiply load during an outage
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("LLM_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+
+# Circuit breaker: fail fast after this many consecutive transport failures,
+# then let one probe through every LLM_BREAKER_RESET_SECONDS
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Hedging: a call still running after the endpoint's recent p95 (at least
+# MIN_DELAY seconds, once MIN_SAMPLES calls were seen) is sent again to another
+# server and the first answer wins; at most MAX_RATIO of the calls are hedged
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05"))
+
+# Quizzes of one /create-quiz/batch call generated at the same time; 0 keeps it
+# at the LLM slots, which leaves queue room for interactive requests
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("QUIZ_BATCH_CONCURRENCY", "0"))
+
+# Job mode (`Prefer: respond-async`): jobs persist in the JOB_DB SQLite file
+# (empty turns job mode off), up to JOB_WORKERS run at once (0 follows the LLM
+# slots across the healthy backends) and their results are kept for
+# JOB_RESULT_TTL seconds. A job whose worker stops renewing its lease is
+# re-queued, up to JOB_MAX_ATTEMPTS runs.
+JOB_DB = os.getenv("JOB_DB", "jobs.db")
+JOB_DB = JOB_DB and os.path.join(AI_DATA_DIR, JOB_DB)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "86400"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_GC_INTERVAL = float(os.getenv("JOB_GC_INTERVAL", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+# Structured logging: "json" or "text" lines written by a background thread.
+# LLM payload dumps are sampled per level (LEVEL=rate pairs) and truncated.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))
+LOG_PAYLOAD_SAMPLING = {
+    level.strip().upper(): float(rate)
+    for level, rate in (
+        pair.split("=") for pair in os.getenv("LOG_PAYLOAD_SAMPLING", "DEBUG=0.1,INFO=0.5,WARNING=1,ERROR=1").split(",")
+        if "=" in pair
+    )
+}
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+from contextvars import ContextVar
+
+from src.llm.stats import stats
+
+DEADLINE_HEADER = b"x-request-deadline"
+
+# Unix time (seconds) after which the caller stops waiting; None when it sent no deadline
+_deadline = ContextVar("request_deadline", default=None)
+
+
+def parse_deadline(value):
+    """X-Request-Deadline is a Unix timestamp in milliseconds; None when absent or malformed."""
+    try:
+        return float(value) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def time_left():
+    """Seconds until the current request's deadline, or None when it has none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.time()
+
+
+class RequestCancellation:
+    """
+    ASGI middleware that cancels the handler once its result can no longer be
+    delivered: the client disconnected, or the X-Request-Deadline it sent has
+    passed. Cancellation closes the handler's Ollama connections, which stops
+    generation, and skips its remaining retries. A deadline that passes before
+    the response has started is answered with 504.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = parse_deadline(dict(scope["headers"]).get(DEADLINE_HEADER))
+        # Copied into the handler task's context below
+        _deadline.set(deadline)
+        messages = asyncio.Queue()
+        response_started = False
+        response_complete = False
+        disconnected = False
+
+        async def tracked_send(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        handler = asyncio.ensure_future(self.app(scope, messages.get, tracked_send))
+
+        async def watch_client():
+            """Read the request ahead of the handler so a disconnect is seen while it works."""
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    if not response_complete and not handler.done():
+                        disconnected = True
+                        handler.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch_client())
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            await asyncio.wait({handler}, timeout=timeout)
+            if not handler.done():
+                stats.incr("requests.deadline_exceeded")
+                handler.cancel()
+                await asyncio.gather(handler, return_exceptions=True)
+                if not response_started:
+                    await send_json(send, 504, {"error": "Request deadline exceeded"})
+                return
+            if disconnected and handler.cancelled():
+                stats.incr("requests.client_disconnects")
+                return
+            handler.result()
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                # The server itself is cancelling this request
+                handler.cancel()
+
+
+async def send_json(send, status, content):
+    body = json.dumps(content).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,244 @@
+import re
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # optional: without it long fiches are only de-duplicated
+    np = None
+
+from src.llm.config import EXTRACTIVE_SUMMARY_ENABLED
+from src.llm.metrics import timed
+from src.llm.stats import stats
+from src.llm.structuredLog import get_logger
+from src.llm.textChunker import CHARS_PER_TOKEN, estimate_tokens
+
+logger = get_logger("extractive_summary")
+
+_HEADING = re.compile(r"^#{1,6}\s+\S")
+_ITEM = re.compile(r"^\s*([-*+]|\d+[.)])\s+\S")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w\w+")
+
+# Largest vocabulary of the TF-IDF matrix; rarer terms beyond it are ignored
+MAX_TERMS = 4096
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+# Units at least this cosine-similar to one already kept add nothing
+REDUNDANCY_THRESHOLD = 0.7
+
+
+class Unit:
+    """A sentence, list item, table or code block of a fiche, or a heading."""
+
+    def __init__(self, kind, text, block, section):
+        self.kind = kind
+        self.text = text
+        self.block = block
+        self.section = section
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def paragraph_key(paragraph: str) -> str:
+    return " ".join(paragraph.lower().split())
+
+
+def split_blocks(text: str):
+    """Blank-line separated blocks; a fenced code block is one block even with blank lines inside."""
+    blocks, lines = [], []
+    in_fence = False
+    for line in text.splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        if not line.strip() and not in_fence:
+            if lines:
+                blocks.append("\n".join(lines))
+                lines = []
+            continue
+        lines.append(line)
+    if lines:
+        blocks.append("\n".join(lines))
+    return blocks
+
+
+def deduplicate(blocks):
+    """Drop blocks repeating an earlier one (ignoring case and spacing); headings may repeat."""
+    seen = set()
+    kept = []
+    for block in blocks:
+        key = paragraph_key(block)
+        if not _HEADING.match(block) and key in seen:
+            stats.incr("extractive_summary.duplicate_paragraphs")
+            continue
+        seen.add(key)
+        kept.append(block)
+    return kept
+
+
+def split_units(blocks):
+    """Break blocks into the units that are ranked and kept or dropped as a whole."""
+    units = []
+    section = 0
+    for index, block in enumerate(blocks):
+        lines = block.splitlines()
+        if _FENCE.match(lines[0]) or lines[0].lstrip().startswith("|"):
+            units.append(Unit("block", block, index, section))
+            continue
+        prose = []
+
+        def flush_prose():
+            units.extend(Unit("sentence", s, index, section) for s in _SENTENCE_END.split(" ".join(prose)) if s)
+            prose.clear()
+
+        for line in lines:
+            if _HEADING.match(line):
+                flush_prose()
+                section += 1
+                units.append(Unit("heading", line.strip(), index, section))
+            elif _ITEM.match(line):
+                flush_prose()
+                units.append(Unit("item", line.rstrip(), index, section))
+            elif line[:1].isspace() and not prose and units and units[-1].kind == "item" and units[-1].block == index:
+                # Continuation of a list item
+                units[-1].text += "\n" + line.rstrip()
+            else:
+                prose.append(line.strip())
+        flush_prose()
+    return units
+
+
+def tfidf_matrix(units):
+    """Row-normalized TF-IDF vectors of the units (sublinear term frequency, smoothed IDF)."""
+    documents = [_WORD.findall(unit.text.lower()) for unit in units]
+    frequency = {}
+    for words in documents:
+        for word in set(words):
+            frequency[word] = frequency.get(word, 0) + 1
+    vocabulary = sorted(frequency, key=lambda word: -frequency[word])[:MAX_TERMS]
+    index = {word: i for i, word in enumerate(vocabulary)}
+
+    flat = [row * len(vocabulary) + index[word]
+            for row, words in enumerate(documents) for word in words if word in index]
+    counts = np.bincount(np.array(flat, dtype=np.int64), minlength=len(units) * len(vocabulary))
+    matrix = counts.reshape(len(units), len(vocabulary)).astype(np.float32)
+
+    document_frequency = np.array([frequency[word] for word in vocabulary], dtype=np.float32)
+    idf = np.log((1 + len(units)) / (1 + document_frequency)) + 1
+    present = matrix > 0
+    matrix[present] = 1 + np.log(matrix[present])
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def textrank(similarity):
+    """PageRank over the sentence similarity graph: how central each unit is to the fiche."""
+    count = len(similarity)
+    weights = similarity.copy()
+    np.fill_diagonal(weights, 0)
+    totals = weights.sum(axis=1, keepdims=True)
+    # A unit sharing no term with the others links to every unit evenly
+    transition = np.where(totals > 0, weights / np.where(totals > 0, totals, 1), 1.0 / count).T.astype(np.float32)
+    transition = np.ascontiguousarray(transition)
+    scores = np.full(count, 1.0 / count, dtype=np.float32)
+    for _ in range(MAX_ITERATIONS):
+        updated = (1 - DAMPING) / count + DAMPING * (transition @ scores)
+        converged = np.abs(updated - scores).sum() < 1e-6
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def select_units(units, max_tokens):
+    """Indices of the highest ranked, non-redundant units whose text fits in max_tokens."""
+    ranked = [i for i, unit in enumerate(units) if unit.kind != "heading"]
+    if not ranked:
+        return set()
+    vectors = tfidf_matrix([units[i] for i in ranked])
+    similarity = vectors @ vectors.T
+    scores = textrank(similarity)
+
+    headings = {unit.section: i for i, unit in enumerate(units) if unit.kind == "heading"}
+    chosen, chosen_rows = set(), []
+    budget = max_tokens
+    for row in np.argsort(-scores, kind="stable"):
+        unit_index = ranked[row]
+        if chosen_rows and similarity[row, chosen_rows].max() >= REDUNDANCY_THRESHOLD:
+            continue
+        heading = headings.get(units[unit_index].section)
+        cost = units[unit_index].tokens
+        if heading is not None and heading not in chosen:
+            cost += units[heading].tokens
+        if cost > budget:
+            continue
+        budget -= cost
+        chosen.add(unit_index)
+        chosen_rows.append(row)
+        if heading is not None:
+            chosen.add(heading)
+    return chosen
+
+
+def assemble(units, chosen):
+    """The chosen units in document order, sentences of one paragraph joined again."""
+    blocks = []
+    previous = None
+    for i, unit in enumerate(units):
+        if i not in chosen:
+            continue
+        if previous is not None and unit.kind == "sentence" == previous.kind and unit.block == previous.block:
+            blocks[-1] += " " + unit.text
+        elif previous is not None and unit.kind == "item" == previous.kind and unit.block == previous.block:
+            blocks[-1] += "\n" + unit.text
+        else:
+            blocks.append(unit.text)
+        previous = unit
+    return "\n\n".join(blocks)
+
+
+@lru_cache(maxsize=32)
+def summarize(text: str, max_tokens: int) -> str:
+    """
+    Reduce text to about max_tokens: repeated paragraphs are dropped, then the
+    sentences, list items and blocks ranked highest by TextRank over their
+    TF-IDF similarity are kept in document order, under the headings of their
+    sections. The result is cut at max_tokens if nothing else fits.
+    """
+    blocks = deduplicate(split_blocks(text))
+    deduplicated = "\n\n".join(blocks)
+    if estimate_tokens(deduplicated) <= max_tokens:
+        return deduplicated
+    summary = deduplicated
+    if np is not None:
+        units = split_units(blocks)
+        chosen = select_units(units, max_tokens)
+        if chosen:
+            summary = assemble(units, chosen)
+    return summary[:max_tokens * CHARS_PER_TOKEN]
+
+
+_numpy_warned = False
+
+
+def condense(text: str, max_tokens: int, kind: str) -> str:
+    """
+    The fiche content to put in a `kind` prompt: text itself when it fits in
+    max_tokens (or when EXTRACTIVE_SUMMARY_ENABLED is off or max_tokens is 0),
+    its extractive summary otherwise.
+    """
+    global _numpy_warned
+    if not EXTRACTIVE_SUMMARY_ENABLED or max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    if np is None and not _numpy_warned:
+        logger.warning("NumPy is not installed; long fiches are only de-duplicated and cut, not summarized")
+        _numpy_warned = True
+    with timed("extract"):
+        summary = summarize(text, max_tokens)
+    stats.incr(f"extractive_summary.{kind}.condensed")
+    stats.incr(f"extractive_summary.{kind}.tokens_in", estimate_tokens(text))
+    stats.incr(f"extractive_summary.{kind}.tokens_out", estimate_tokens(summary))
+    return summary
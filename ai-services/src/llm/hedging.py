@@ -0,0 +1,77 @@
+import threading
+from collections import deque
+
+from src.llm.config import (
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_MAX_RATIO
+)
+from src.llm.resilience import RetryBudget
+
+# Recent call durations kept per endpoint
+WINDOW_SIZE = 256
+
+
+class LatencyTracker:
+    """Sliding window of recent LLM call durations per endpoint."""
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.window_size = window_size
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, seconds: float):
+        with self._lock:
+            window = self._windows.get(endpoint)
+            if window is None:
+                window = self._windows[endpoint] = deque(maxlen=self.window_size)
+            window.append(seconds)
+
+    def percentile(self, endpoint: str, q: float, min_samples=1):
+        """The q-th percentile of the window, or None with fewer than min_samples calls."""
+        with self._lock:
+            window = self._windows.get(endpoint)
+            if window is None or len(window) < max(1, min_samples):
+                return None
+            ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def endpoints(self):
+        with self._lock:
+            return list(self._windows)
+
+
+class HedgePolicy:
+    """
+    Decides when a slow call is hedged. The delay is the endpoint's recent
+    percentile; a token bucket earning `max_ratio` per call caps the hedge rate.
+    """
+
+    def __init__(self, enabled=LLM_HEDGE_ENABLED, percentile=LLM_HEDGE_PERCENTILE, min_delay=LLM_HEDGE_MIN_DELAY,
+                 min_samples=LLM_HEDGE_MIN_SAMPLES, max_ratio=LLM_HEDGE_MAX_RATIO):
+        self.enabled = enabled
+        self.q = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.budget = RetryBudget(ratio=max_ratio, min_per_second=0, max_tokens=max_ratio * 20)
+
+    def on_call(self):
+        self.budget.deposit()
+
+    def observe(self, endpoint: str, seconds: float):
+        self.latencies.observe(endpoint, seconds)
+
+    def delay(self, endpoint: str):
+        """Seconds to wait before hedging a call of this endpoint, or None to never hedge it."""
+        if not self.enabled:
+            return None
+        threshold = self.latencies.percentile(endpoint, self.q, self.min_samples)
+        if threshold is None:
+            return None
+        return max(self.min_delay, threshold)
+
+    def allow(self) -> bool:
+        return self.budget.withdraw()
@@ -0,0 +1,308 @@
+import json
+import re
+
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+_OPENERS = {"}": "{", "]": "["}
+
+# Characters that need attention; everything between them is copied as one slice
+_DOUBLE_STRING_SPECIAL = re.compile(r'["\\\x00-\x1f]')
+_SINGLE_STRING_SPECIAL = re.compile(r'[\'"\\\x00-\x1f]')
+_STRUCTURAL = re.compile(r'["\'/{}\[\],:`A-Za-z_]')
+
+# Well-formed string tokens whose closing quote is unambiguous are copied whole
+_STRING_BODY = r'"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"'
+_KEY_TOKEN = re.compile(_STRING_BODY + r'\s*:\s*')
+_VALUE_TOKEN = re.compile(
+    _STRING_BODY + r'(?=\s*(?:[}\]]|,\s*(?:["{\[\]}\-\d]|true\b|false\b|null\b|//|/\*)|//|/\*|$))'
+)
+
+
+def clean_json_response(response) -> str:
+    """
+    Return the JSON object contained in a model response.
+
+    Well-formed responses are returned as-is after a single json.loads check;
+    anything else goes through repair_json, which fixes it in one pass.
+    """
+    if isinstance(response, dict):
+        return json.dumps(response)
+    if not isinstance(response, str):
+        response = str(response)
+
+    # Fast path: the outermost braces already hold valid JSON (fences, prose around it)
+    start = response.find("{")
+    end = response.rfind("}")
+    if start != -1 and end > start:
+        candidate = response[start:end + 1]
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            pass
+    return repair_json(response)
+
+
+def repair_json(text: str) -> str:
+    """
+    Rewrite the first JSON object in text so that json.loads accepts it.
+
+    A single left-to-right scan that knows whether it is inside a string:
+      - drops prose and code fences around the object, and // or /* */ comments
+      - removes trailing commas and quotes bare keys
+      - maps True/False/None and single-quoted strings to JSON
+      - escapes raw control characters and stray quotes inside strings
+      - closes strings, arrays and objects left open by a truncated output
+    Quotes inside strings are only treated as closing when the next token
+    fits the JSON grammar, so apostrophes and quoted words in content survive.
+    """
+    start = text.find("{")
+    if start == -1:
+        return text.strip()
+
+    out = []
+    stack = []
+    expect_key = False   # next string in the current object is a key
+    after_key = False    # a key was read, its colon has not been seen yet
+    in_string = False
+    string_quote = '"'
+    string_is_key = False
+    n = len(text)
+    i = start
+
+    while i < n:
+        char = text[i]
+
+        if in_string:
+            special = (_DOUBLE_STRING_SPECIAL if string_quote == '"' else _SINGLE_STRING_SPECIAL).search(text, i)
+            if special is None:
+                out.append(text[i:])
+                break
+            if special.start() > i:
+                out.append(text[i:special.start()])
+                i = special.start()
+            char = text[i]
+            if char == "\\":
+                nxt = text[i + 1] if i + 1 < n else ""
+                if nxt == "'" and string_quote == "'":
+                    out.append("'")
+                elif nxt in _VALID_ESCAPES and (nxt != "u" or _is_hex(text[i + 2:i + 6])):
+                    out.append("\\" + nxt)
+                else:
+                    out.append("\\\\")
+                    i += 1
+                    continue
+                i += 2
+                continue
+            if char == string_quote:
+                if _closes_string(text, i + 1, string_is_key, stack):
+                    out.append('"')
+                    in_string = False
+                    if string_is_key:
+                        after_key = True
+                elif char == '"':
+                    out.append('\\"')
+                else:
+                    out.append(char)
+                i += 1
+                continue
+            if char == '"':
+                # Double quote inside a single-quoted string
+                out.append('\\"')
+            elif char in _CONTROL_ESCAPES:
+                out.append(_CONTROL_ESCAPES[char])
+            elif char < " ":
+                out.append("\\u%04x" % ord(char))
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        if char == '"':
+            token = (_KEY_TOKEN if expect_key else _VALUE_TOKEN).match(text, i)
+            if token is not None:
+                # A key token also swallows its colon
+                out.append(token.group(0))
+                expect_key = False
+                i = token.end()
+                continue
+
+        if char == '"' or char == "'":
+            in_string = True
+            string_quote = char
+            string_is_key = expect_key
+            expect_key = False
+            out.append('"')
+            i += 1
+        elif char == "/" and i + 1 < n and text[i + 1] == "/":
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+        elif char == "/" and i + 1 < n and text[i + 1] == "*":
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif char == "{" or char == "[":
+            stack.append(char)
+            expect_key = char == "{"
+            out.append(char)
+            i += 1
+        elif char == "}" or char == "]":
+            _strip_trailing_comma(out)
+            if _OPENERS[char] in stack:
+                while stack:
+                    opener = stack.pop()
+                    out.append(_CLOSERS[opener])
+                    if _CLOSERS[opener] == char:
+                        break
+            i += 1
+            if not stack:
+                break
+            expect_key = False
+        elif char == ",":
+            out.append(char)
+            expect_key = bool(stack) and stack[-1] == "{"
+            i += 1
+        elif char == ":":
+            out.append(char)
+            after_key = False
+            i += 1
+        elif char.isalpha() or char == "_":
+            j = i + 1
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            if expect_key:
+                out.append('"' + word + '"')
+                expect_key = False
+                after_key = True
+            else:
+                out.append(_PYTHON_LITERALS.get(word, word))
+            i = j
+        elif char == "`":
+            i += 1
+        else:
+            # Whitespace, numbers and stray characters up to the next token of interest
+            structural = _STRUCTURAL.search(text, i + 1)
+            j = n if structural is None else structural.start()
+            out.append(text[i:j])
+            i = j
+
+    if in_string:
+        if out and out[-1] == "\\\\":
+            out.pop()
+        out.append('"')
+        if string_is_key:
+            after_key = True
+    if stack:
+        # Truncated output: make the tail a valid value, then close everything
+        _strip_trailing_whitespace(out)
+        if after_key:
+            out.append(": null")
+        elif out and out[-1] == ":":
+            out.append(" null")
+        _strip_trailing_comma(out)
+        while stack:
+            out.append(_CLOSERS[stack.pop()])
+
+    return "".join(out).strip()
+
+
+def _closes_string(text, i, is_key, stack) -> bool:
+    """Decide whether the quote just before position i ends the current string."""
+    n = len(text)
+    while i < n and text[i] in " \t\r\n":
+        i += 1
+    if i >= n:
+        return True
+    char = text[i]
+    if is_key:
+        return char == ":"
+    if char in "}]" or _is_comment(text, i):
+        return True
+    if char == ",":
+        i += 1
+        while i < n and text[i] in " \t\r\n":
+            i += 1
+        if i >= n:
+            return True
+        nxt = text[i]
+        if nxt in "}]\"'{[-0123456789" or _is_comment(text, i):
+            return True
+        for literal in ("true", "false", "null"):
+            if text.startswith(literal, i):
+                return True
+        # A bare key after the comma (`, title: ...`) also closes the value
+        if stack and stack[-1] == "{" and (nxt.isalpha() or nxt == "_"):
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            while j < n and text[j] in " \t":
+                j += 1
+            return j < n and text[j] == ":"
+        return False
+    return False
+
+
+def _is_comment(text, i) -> bool:
+    return text.startswith("//", i) or text.startswith("/*", i)
+
+
+def _is_hex(chars) -> bool:
+    return len(chars) == 4 and all(c in "0123456789abcdefABCDEF" for c in chars)
+
+
+def _strip_trailing_whitespace(out):
+    while out and out[-1].isspace():
+        out.pop()
+
+
+def _strip_trailing_comma(out):
+    _strip_trailing_whitespace(out)
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def extract_array_objects(text: str, key: str):
+    """
+    Return the raw text of each object in the `key` array of a broken response.
+
+    Used to salvage items when the document as a whole cannot be repaired; the
+    scan is string-aware so braces inside values do not split objects.
+    """
+    marker = text.find(f'"{key}"')
+    if marker == -1:
+        return []
+    start = text.find("[", marker)
+    if start == -1:
+        return []
+
+    objects = []
+    depth = 0
+    in_string = False
+    escape = False
+    object_start = None
+    for i in range(start + 1, len(text)):
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            if depth == 0:
+                object_start = i
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0 and object_start is not None:
+                objects.append(text[object_start:i + 1])
+                object_start = None
+            depth = max(depth, 0)
+        elif char == "]" and depth == 0:
+            break
+    return objects
@@ -0,0 +1,147 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; covers cleaning (sub-millisecond) up to long generations
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_COUNT_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500)
+
+# Set per request by the HTTP middleware; work outside a request is "background"
+_endpoint = ContextVar("metrics_endpoint", default="background")
+_timings = ContextVar("metrics_timings", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Thread-safe histograms and gauges, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._help = {}
+        self._gauges = {}
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, help)
+            histogram.observe(value)
+
+    def gauge(self, name, func, help=""):
+        """
+        Register a gauge whose value is read from func() at scrape time. func may
+        return a dict of {label tuple: value} for one series per label set.
+        """
+        self._gauges[name] = (func, help)
+
+    def render(self, counters=None) -> str:
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                by_name.setdefault(name, []).append((labels, histogram))
+            for name, series in by_name.items():
+                lines.append(f"# HELP {name} {self._help.get(name) or name}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series:
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        for name, (func, help) in sorted(self._gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help or name}")
+            lines.append(f"# TYPE {name} gauge")
+            series = value.items() if isinstance(value, dict) else [((), value)]
+            for labels, series_value in series:
+                lines.append(f"{name}{format_labels(labels)} {format_value(series_value)}")
+
+        if counters:
+            lines.append("# HELP ai_services_events_total Service event counters, also listed on GET /stats")
+            lines.append("# TYPE ai_services_events_total counter")
+            for event, value in sorted(counters.items()):
+                lines.append(f"ai_services_events_total{format_labels((('event', event),))} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
+
+
+def begin_request(endpoint: str) -> dict:
+    """Start collecting stage timings for the current request; returns the dict they go to."""
+    timings = {}
+    _endpoint.set(endpoint)
+    _timings.set(timings)
+    return timings
+
+
+def current_endpoint() -> str:
+    return _endpoint.get()
+
+
+def record_stage(stage: str, seconds: float):
+    """Add time spent in a stage to the current request and the stage histogram."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    metrics.observe(
+        "ai_services_stage_duration_seconds", seconds,
+        help="Time spent per request stage",
+        endpoint=_endpoint.get(), stage=stage
+    )
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def server_timing(timings: dict, total: float) -> str:
+    """Server-Timing header value, durations in milliseconds."""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,346 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from src.llm.backendPool import BackendPool
+from src.llm.config import LLM_MAX_CONCURRENCY, LLM_STOP_AT_JSON_END
+from src.llm.hedging import HedgePolicy
+from src.llm.metrics import metrics, current_endpoint, record_stage, TOKEN_COUNT_BUCKETS, TOKEN_RATE_BUCKETS
+from src.llm.resilience import TransportError, is_transport_error
+from src.llm.scheduler import FairScheduler
+from src.llm.stats import stats
+from src.llm.streamingJson import JsonEndDetector
+
+# Conversations whose backend is remembered for their follow-up calls
+AFFINITY_ENTRIES = 1024
+
+
+def record_usage(result):
+    """Record the token counts and durations Ollama reports in a final response."""
+    for field, counter in (
+        ("prompt_eval_count", "llm.prompt_eval_count"),
+        ("prompt_eval_duration", "llm.prompt_eval_duration_ns"),
+        ("eval_count", "llm.eval_count"),
+        ("eval_duration", "llm.eval_duration_ns"),
+    ):
+        value = result.get(field)
+        if value:
+            stats.incr(counter, value)
+    if result.get("done_reason") == "length":
+        # Hit num_predict: the output is cut off, usually mid-JSON
+        stats.incr("llm.truncated")
+
+    prompt_eval_duration = result.get("prompt_eval_duration") or 0
+    eval_duration = result.get("eval_duration") or 0
+    eval_count = result.get("eval_count") or 0
+    endpoint = current_endpoint()
+    if prompt_eval_duration:
+        record_stage("prompt_eval", prompt_eval_duration / 1e9)
+    if eval_duration:
+        record_stage("generation", eval_duration / 1e9)
+    if result.get("prompt_eval_count"):
+        metrics.observe("ai_services_llm_prompt_tokens", result["prompt_eval_count"],
+                        buckets=TOKEN_COUNT_BUCKETS, help="Prompt tokens evaluated per LLM call", endpoint=endpoint)
+    if eval_count:
+        metrics.observe("ai_services_llm_eval_tokens", eval_count,
+                        buckets=TOKEN_COUNT_BUCKETS, help="Tokens generated per LLM call", endpoint=endpoint)
+    if eval_count and eval_duration:
+        metrics.observe("ai_services_llm_tokens_per_second", eval_count / (eval_duration / 1e9),
+                        buckets=TOKEN_RATE_BUCKETS, help="Generation speed per LLM call", endpoint=endpoint)
+
+
+class LLMClient:
+    """
+    Async Ollama client shared by all requests. A FairScheduler bounds the calls
+    in flight (LLM_MAX_CONCURRENCY per healthy backend), the BackendPool
+    routes each one and the HedgePolicy decides when a slow call is hedged.
+    Transport failures are raised as TransportError.
+    """
+
+    def __init__(self, hosts=None, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.pool = BackendPool(hosts)
+        self.per_backend_concurrency = max_concurrency
+        self.scheduler = FairScheduler(max_concurrency * len(self.pool.backends))
+        self.hedging = HedgePolicy()
+        # affinity key -> URL of the backend that served the conversation's last call
+        self.affinity = OrderedDict()
+
+    def update_capacity(self):
+        """Match the scheduler's slots to the backends that can take calls."""
+        usable = sum(1 for b in self.pool.backends if b.breaker.can_call())
+        self.scheduler.resize(self.per_backend_concurrency * max(1, usable))
+
+    def start(self):
+        """Start the periodic health probes; needs a running event loop."""
+        self.pool.start_health_checks(self.update_capacity)
+
+    def record_success(self, backend):
+        readmitted = not backend.healthy
+        backend.breaker.record_success()
+        if readmitted:
+            self.update_capacity()
+
+    def remember_backend(self, affinity, backend):
+        """Route the next call with this affinity key to backend, where its prefix is cached."""
+        if affinity is None:
+            return
+        self.affinity[affinity] = backend.url
+        self.affinity.move_to_end(affinity)
+        while len(self.affinity) > AFFINITY_ENTRIES:
+            self.affinity.popitem(last=False)
+
+    def record_error(self, backend, error) -> bool:
+        """Update the backend's breaker for a failed call; True when it was a transport failure."""
+        if is_transport_error(error):
+            backend.breaker.record_failure()
+            self.update_capacity()
+            return True
+        # The server answered, so it is up
+        self.record_success(backend)
+        return False
+
+    async def chat(self, model, messages, options=None, stop_at_json_end=False, affinity=None, **kwargs):
+        """
+        Run one chat completion on the least busy backend once a scheduler slot
+        is free. With hedging on, a call slower than the endpoint's recent p95 is
+        also sent to another backend and the first answer wins.
+
+        With stop_at_json_end (and LLM_STOP_AT_JSON_END), the completion is
+        streamed internally and cut as soon as its top-level JSON value closes,
+        instead of letting the model run on after it.
+
+        Calls sharing an `affinity` key (the turns of one conversation) prefer the
+        backend that served the previous one, whose KV cache holds their prefix.
+        """
+        kwargs["stop_at_json_end"] = stop_at_json_end and LLM_STOP_AT_JSON_END
+        kwargs["affinity"] = affinity
+        self.pool.check_available(model)
+        endpoint = current_endpoint()
+        queued = time.perf_counter()
+        async with self.scheduler.slot():
+            started = time.perf_counter()
+            record_stage("queue", started - queued)
+            self.hedging.on_call()
+            backend = self.pool.acquire(model, prefer=self.affinity.get(affinity))
+            primary = asyncio.ensure_future(self._call(backend, model, messages, options, kwargs))
+            try:
+                delay = self.hedging.delay(endpoint)
+                if delay is None:
+                    # Hedging off, or too few calls seen to know what is slow
+                    result = await primary
+                else:
+                    await asyncio.wait({primary}, timeout=delay)
+                    if primary.done():
+                        result = primary.result()
+                    else:
+                        result = await self._hedge(primary, backend, model, messages, options, kwargs)
+            finally:
+                primary.cancel()
+                elapsed = time.perf_counter() - started
+                record_stage("llm", elapsed)
+        self.hedging.observe(endpoint, elapsed)
+        record_usage(result)
+        return result
+
+    async def _call(self, backend, model, messages, options, kwargs):
+        """One chat call on an acquired backend; updates its breaker and releases it."""
+        kwargs = dict(kwargs)
+        stop_at_json_end = kwargs.pop("stop_at_json_end", False)
+        affinity = kwargs.pop("affinity", None)
+        try:
+            if stop_at_json_end:
+                result = await self._chat_until_json_end(backend, model, messages, options, kwargs)
+            else:
+                result = await backend.client.chat(
+                    model=model,
+                    messages=messages,
+                    options=options,
+                    **kwargs
+                )
+        except asyncio.CancelledError:
+            # The caller went away (disconnect, deadline) or, for a lost hedge, _hedge
+            # already judged the backend: either way the slot goes back unrecorded
+            backend.breaker.release_probe()
+            raise
+        except Exception as e:
+            if self.record_error(backend, e):
+                raise TransportError(f"{backend.url}: {str(e) or type(e).__name__}") from e
+            raise
+        finally:
+            self.pool.release(backend)
+        self.record_success(backend)
+        self.remember_backend(affinity, backend)
+        return result
+
+    async def _chat_until_json_end(self, backend, model, messages, options, kwargs):
+        """
+        Stream a completion and close the stream once the JSON value is complete,
+        which makes Ollama stop decoding. Returns a response shaped like chat()'s.
+        """
+        stream = await backend.client.chat(
+            model=model,
+            messages=messages,
+            options=options,
+            stream=True,
+            **kwargs
+        )
+        detector = JsonEndDetector()
+        parts = []
+        final = None
+        chunks = 0
+        first_chunk = None
+        try:
+            async for part in stream:
+                chunk = part["message"]["content"]
+                if chunk:
+                    chunks += 1
+                    first_chunk = first_chunk or time.perf_counter()
+                end = detector.feed(chunk)
+                if end is not None:
+                    parts.append(chunk[:end])
+                    break
+                parts.append(chunk)
+                if part.get("done"):
+                    final = part
+        finally:
+            await stream.aclose()
+
+        content = "".join(parts)
+        if final is not None:
+            # The model ended on its own; its final chunk carries the real usage.
+            # ollama's ChatResponse is a pydantic model, which ** cannot unpack
+            return {**dict(final), "message": {"role": "assistant", "content": content}}
+        stats.incr("llm.stopped_at_json_end")
+        # Stopped early: no usage report, but every streamed chunk is one token
+        return {
+            "model": model,
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "done_reason": "json_end",
+            "eval_count": chunks,
+            "eval_duration": int((time.perf_counter() - first_chunk) * 1e9) if first_chunk else 0
+        }
+
+    async def _hedge(self, primary, backend, model, messages, options, kwargs):
+        """
+        Send a slow call again to another backend and return the first answer;
+        the loser is cancelled. The hedge never waits for a scheduler slot, so it
+        only uses spare capacity.
+        """
+        if not self.pool.candidates(model, exclude=backend):
+            stats.incr("llm.hedges_skipped.no_backend")
+            return await primary
+        if not self.scheduler.try_acquire():
+            stats.incr("llm.hedges_skipped.no_slot")
+            return await primary
+        try:
+            if not self.hedging.allow():
+                stats.incr("llm.hedges_skipped.budget")
+                return await primary
+            stats.incr("llm.hedges")
+            hedge_backend = self.pool.acquire(model, exclude=backend)
+            hedge = asyncio.ensure_future(self._call(hedge_backend, model, messages, options, kwargs))
+            backends = {primary: backend, hedge: hedge_backend}
+            try:
+                pending = {primary, hedge}
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is hedge:
+                                stats.incr("llm.hedges_won")
+                            for loser in pending:
+                                # A half-open backend's probe call lost the race: still not recovered
+                                backends[loser].breaker.fail_probe()
+                            return task.result()
+                # Both failed: report the original call's error
+                return primary.result()
+            finally:
+                hedge.cancel()
+        finally:
+            self.scheduler.release()
+
+    async def stream_chat(self, model, messages, options=None, affinity=None, **kwargs):
+        """Yield streamed chat chunks, holding a scheduler slot until the stream ends."""
+        self.pool.check_available(model)
+        queued = time.perf_counter()
+        async with self.scheduler.slot():
+            started = time.perf_counter()
+            record_stage("queue", started - queued)
+            backend = self.pool.acquire(model, prefer=self.affinity.get(affinity))
+            self.remember_backend(affinity, backend)
+            answered = False
+            try:
+                stream = await backend.client.chat(
+                    model=model,
+                    messages=messages,
+                    options=options,
+                    stream=True,
+                    **kwargs
+                )
+                try:
+                    async for part in stream:
+                        if not answered:
+                            # The server is up, even if the caller stops reading early
+                            answered = True
+                            self.record_success(backend)
+                        if part.get("done"):
+                            record_usage(part)
+                        yield part
+                finally:
+                    # Closes the HTTP response when the caller stops early
+                    await stream.aclose()
+            except Exception as e:
+                if self.record_error(backend, e):
+                    raise TransportError(f"{backend.url}: {str(e) or type(e).__name__}") from e
+                raise
+            finally:
+                # A stream abandoned before its first chunk says nothing about the backend
+                backend.breaker.release_probe()
+                self.pool.release(backend)
+                record_stage("llm", time.perf_counter() - started)
+
+    async def embed(self, model, input):
+        """
+        Embed input (a string or a list of them) on the least busy backend that
+        serves model. Embeddings are short calls, so they do not queue behind
+        generations for a scheduler slot.
+        """
+        self.pool.check_available(model)
+        backend = self.pool.acquire(model)
+        started = time.perf_counter()
+        try:
+            result = await backend.client.embed(model=model, input=input)
+        except asyncio.CancelledError:
+            backend.breaker.release_probe()
+            raise
+        except Exception as e:
+            if self.record_error(backend, e):
+                raise TransportError(f"{backend.url}: {str(e) or type(e).__name__}") from e
+            raise
+        finally:
+            self.pool.release(backend)
+            record_stage("embed", time.perf_counter() - started)
+        self.record_success(backend)
+        return result["embeddings"]
+
+    async def close(self):
+        await self.pool.close()
+
+
+_llm_client = None
+
+
+def get_llm_client() -> LLMClient:
+    """Return the process-wide client, creating it on first use."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+import httpx
+import ollama
+
+from src.llm.config import (
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_RETRY_BUDGET_RATIO,
+    LLM_RETRY_BUDGET_MIN_PER_SECOND,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS
+)
+from src.llm.deadline import time_left
+from src.llm.metrics import timed
+from src.llm.stats import stats
+
+
+class LLMError(Exception):
+    """A failed generation attempt, classified by what went wrong."""
+    kind = "unexpected"
+
+
+class TransportError(LLMError):
+    """The model server could not be reached or answered with a server error."""
+    kind = "transport"
+
+
+class CircuitOpenError(TransportError):
+    """The model server is considered down; the call was not attempted."""
+    kind = "circuit_open"
+
+
+class ParseError(LLMError):
+    """The model answered, but its output could not be parsed as JSON."""
+    kind = "parse"
+
+
+class ValidationError(LLMError):
+    """The output parsed, but does not have the expected structure."""
+    kind = "validation"
+
+
+def classify_error(error) -> str:
+    if isinstance(error, LLMError):
+        return error.kind
+    if isinstance(error, json.JSONDecodeError):
+        return "parse"
+    if is_transport_error(error):
+        return "transport"
+    return "unexpected"
+
+
+def is_transport_error(error) -> bool:
+    """Connection problems, timeouts and 5xx/429 answers; a 4xx is the request's fault."""
+    if isinstance(error, (httpx.TransportError, ConnectionError, asyncio.TimeoutError, TimeoutError)):
+        return True
+    if isinstance(error, ollama.ResponseError):
+        # -1 is an error reported inside a stream
+        return error.status_code in (-1, 429) or error.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt: int, base=LLM_RETRY_BASE_DELAY, cap=LLM_RETRY_MAX_DELAY) -> float:
+    """Exponential backoff with full jitter for the given retry number (1 = first retry)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """
+    Token bucket shared by all requests: each request earns `ratio` of a retry
+    and each retry spends one, plus a small floor of retries per second. While
+    the model server struggles, retries can then add at most ~ratio extra load.
+    """
+
+    def __init__(self, ratio=LLM_RETRY_BUDGET_RATIO, min_per_second=LLM_RETRY_BUDGET_MIN_PER_SECOND, max_tokens=None):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens if max_tokens is not None else max(10.0, min_per_second * 10)
+        self.tokens = self.max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transport failures. While open,
+    calls fail at once; after `reset_timeout` one probe call is let through and
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def can_call(self) -> bool:
+        """Whether before_call() would let a call through, without claiming the probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not self._probing
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        stats.incr("llm.circuit_rejected")
+        raise CircuitOpenError("circuit open")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                stats.incr("llm.circuit_closed")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    stats.incr("llm.circuit_opened")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def trip(self):
+        """Open the circuit at once, e.g. after a failed health probe."""
+        with self._lock:
+            if self.state != OPEN:
+                stats.incr("llm.circuit_opened")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """A probe that ended without telling us anything (e.g. its caller went away) frees the slot."""
+        with self._lock:
+            self._probing = False
+
+    def fail_probe(self):
+        """A probe another backend answered first was too slow to show recovery: open again."""
+        with self._lock:
+            if self.state != HALF_OPEN or not self._probing:
+                return
+            stats.incr("llm.circuit_opened")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class RetryPolicy:
+    """Decides whether and when the generators retry a failed attempt."""
+
+    def __init__(self, budget=None):
+        self.budget = budget or RetryBudget()
+
+    def on_request(self):
+        """Call once per generation request, before its first attempt."""
+        self.budget.deposit()
+
+    async def before_retry(self, kind: str, attempt: int, error) -> bool:
+        """
+        Return True once it is time for retry number `attempt`, False when the
+        request should give up now. Transport failures back off with jitter;
+        parse and validation failures retry at once, since only a new sample helps.
+        No retry starts once the request's deadline would pass first.
+        """
+        error_kind = classify_error(error)
+        if error_kind == "circuit_open":
+            stats.incr(f"{kind}.retries_skipped.circuit_open")
+            return False
+        delay = backoff_delay(attempt) if error_kind == "transport" else 0.0
+        left = time_left()
+        if left is not None and left <= delay:
+            # The caller will have stopped waiting before the retry even starts
+            stats.incr(f"{kind}.retries_skipped.deadline")
+            return False
+        if not self.budget.withdraw():
+            stats.incr(f"{kind}.retries_skipped.budget")
+            return False
+        stats.incr(f"{kind}.retries")
+        stats.incr(f"{kind}.retries.{error_kind}")
+        if delay:
+            with timed("retry_wait"):
+                await asyncio.sleep(delay)
+        return True
+
+
+def describe_error(error) -> str:
+    """Fallback message in the generators' historical wording."""
+    error_kind = classify_error(error)
+    if error_kind == "parse":
+        return f"JSON parsing failed: {error}"
+    if error_kind == "validation":
+        return f"Invalid structure: {error}"
+    if error_kind in ("transport", "circuit_open"):
+        return f"Model server unavailable: {error}"
+    return f"Unexpected error: {error}"
+
+
+retry_policy = RetryPolicy()
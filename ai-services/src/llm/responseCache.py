@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.llm.config import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_TTL,
+    LLM_CACHE_DB
+)
+from src.llm.stats import stats
+
+
+def make_cache_key(model, messages, options, format=None) -> str:
+    """Hash everything that determines the model output."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "options": options, "format": format},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """LRU dictionary with a per-entry time to live."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SqliteTier:
+    """On-disk tier that survives restarts and is shared by uvicorn workers."""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl)
+            )
+
+    def purge_expired(self):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+
+
+class ResponseCache:
+    """Two-tier cache of validated generator results, keyed by make_cache_key."""
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL, db_path=LLM_CACHE_DB):
+        self.memory = MemoryTier(max_entries, ttl)
+        self.disk = SqliteTier(db_path, ttl) if db_path else None
+
+    async def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            stats.incr("cache_hits_memory")
+            return value
+
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                stats.incr("cache_hits_disk")
+                self.memory.set(key, value)
+                return value
+
+        stats.incr("cache_misses")
+        return None
+
+    async def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def info(self) -> dict:
+        return {
+            "memory_entries": len(self.memory),
+            "max_entries": self.memory.max_entries,
+            "ttl": self.memory.ttl,
+            "disk": self.disk.path if self.disk else None
+        }
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """Return the process-wide cache, or None when caching is disabled."""
+    global _response_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
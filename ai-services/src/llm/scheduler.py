@@ -0,0 +1,136 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from src.llm.config import LLM_TENANT_WEIGHTS
+
+# Served strictly in this order; interactive requests overtake queued batch work
+PRIORITIES = ("interactive", "batch", "background")
+DEFAULT_PRIORITY = "interactive"
+ANONYMOUS_TENANT = "anonymous"
+
+# Set per request by the HTTP middleware (X-User-Id, X-Priority) and per job by its worker
+_tenant = ContextVar("llm_tenant", default=ANONYMOUS_TENANT)
+_priority = ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+
+
+def parse_priority(value) -> str:
+    value = (value or "").strip().lower()
+    return value if value in PRIORITIES else DEFAULT_PRIORITY
+
+
+def set_request_context(tenant=None, priority=None):
+    _tenant.set(tenant or ANONYMOUS_TENANT)
+    _priority.set(parse_priority(priority))
+
+
+def current_tenant() -> str:
+    return _tenant.get()
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class FairScheduler:
+    """
+    Bounds the number of concurrent LLM calls. Waiters are served by priority
+    class first, then by weighted fair queuing between tenants (start-time
+    fair queuing: each call costs a tenant 1/weight of virtual time), then in
+    arrival order. One tenant with many queued calls cannot starve the others.
+    """
+
+    def __init__(self, max_concurrency: int, weights=None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.weights = weights if weights is not None else LLM_TENANT_WEIGHTS
+        self.active = 0
+        self.waiters = {priority: [] for priority in PRIORITIES}
+        self._waiting = 0
+        self._arrivals = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags = {}
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def depth_by_priority(self) -> dict:
+        return {priority: sum(1 for *_, w in heap if not w.done()) for priority, heap in self.waiters.items()}
+
+    def _enqueue(self, tenant, priority):
+        start = max(self._virtual_time, self._finish_tags.get(tenant, 0.0))
+        self._finish_tags[tenant] = start + 1.0 / max(self.weights.get(tenant, 1.0), 1e-6)
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters[priority], (self._finish_tags[tenant], next(self._arrivals), start, waiter))
+        self._waiting += 1
+        return waiter
+
+    def _wake_next(self) -> bool:
+        """Hand a slot to the next waiter; False when nobody is waiting."""
+        for priority in PRIORITIES:
+            heap = self.waiters[priority]
+            while heap:
+                _, _, start, waiter = heapq.heappop(heap)
+                if waiter.done():
+                    # Cancelled while queued; already uncounted
+                    continue
+                self._waiting -= 1
+                self._virtual_time = start
+                waiter.set_result(None)
+                return True
+        # Idle: virtual time can start over
+        self._virtual_time = 0.0
+        self._finish_tags.clear()
+        return False
+
+    async def acquire(self, tenant=None, priority=None):
+        """Wait for a free slot. Newcomers never overtake queued waiters."""
+        if self.active < self.max_concurrency and not self._waiting:
+            self.active += 1
+            return
+
+        waiter = self._enqueue(tenant or current_tenant(), parse_priority(priority or current_priority()))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we got cancelled: pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiting -= 1
+            raise
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free now and nobody is waiting for it."""
+        if self.active < self.max_concurrency and not self._waiting:
+            self.active += 1
+            return True
+        return False
+
+    def resize(self, max_concurrency: int):
+        """Change the number of slots; new slots go to the next waiters at once."""
+        self.max_concurrency = max(1, max_concurrency)
+        while self.active < self.max_concurrency and self._wake_next():
+            self.active += 1
+
+    def release(self):
+        """Hand the slot to the next waiter, or free it if nobody is waiting."""
+        if self.active > self.max_concurrency:
+            # The scheduler shrank: retire this slot instead of handing it over
+            self.active -= 1
+            return
+        if not self._wake_next():
+            self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, tenant=None, priority=None):
+        await self.acquire(tenant, priority)
+        try:
+            yield
+        finally:
+            self.release()
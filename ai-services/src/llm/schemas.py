@@ -0,0 +1,178 @@
+import json
+
+from src.llm.stats import stats
+
+DOMAINS = [
+    "mathematics", "physics", "chemistry", "biology", "history", "geography",
+    "literature", "philosophy", "computer_science", "economics", "law",
+    "medicine", "psychology", "sociology", "art", "music", "other"
+]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+def classification_schema(domain=None, difficulty=None):
+    """Classification block; pins domain/difficulty when the caller already knows them."""
+    return {
+        "type": "object",
+        "properties": {
+            "domain": {"type": "string", "enum": [domain] if domain else DOMAINS},
+            "difficulty": {"type": "string", "enum": [difficulty] if difficulty else DIFFICULTIES},
+            "topics": {
+                "type": "array",
+                "items": {"type": "string"},
+                "minItems": 1,
+                "maxItems": 5
+            },
+            "estimatedStudyTime": {"type": "integer", "minimum": 0, "maximum": 120}
+        },
+        "required": ["domain", "difficulty", "topics", "estimatedStudyTime"]
+    }
+
+
+def fiche_schema(domain=None, difficulty=None):
+    return {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string", "maxLength": 200},
+            "content": {"type": "string"},
+            "classification": classification_schema(domain, difficulty)
+        },
+        "required": ["title", "content", "classification"]
+    }
+
+
+def criteria_schema():
+    criterion = {"type": "integer", "minimum": 0, "maximum": 25}
+    return {
+        "type": "object",
+        "properties": {
+            "clarity": criterion,
+            "coherence": criterion,
+            "completeness": criterion,
+            "structure": criterion
+        },
+        "required": ["clarity", "coherence", "completeness", "structure"]
+    }
+
+
+def quality_score_schema():
+    return {
+        "type": "object",
+        "properties": {
+            "score": {"type": "integer", "minimum": 0, "maximum": 100},
+            "criteria": criteria_schema(),
+            "feedback": {"type": "string"}
+        },
+        "required": ["score", "criteria", "feedback"]
+    }
+
+
+def evaluation_schema():
+    return {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string", "maxLength": 200},
+            "classification": classification_schema(),
+            "qualityScore": quality_score_schema()
+        },
+        "required": ["title", "classification", "qualityScore"]
+    }
+
+
+def fiche_review_schema():
+    """Scores of a fiche the model has just generated; its classification came with it."""
+    return {
+        "type": "object",
+        "properties": {"qualityScore": quality_score_schema()},
+        "required": ["qualityScore"]
+    }
+
+
+def evaluation_metadata_schema():
+    """Title and classification of a fiche, evaluated from its outline."""
+    return {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string", "maxLength": 200},
+            "classification": classification_schema()
+        },
+        "required": ["title", "classification"]
+    }
+
+
+def section_evaluation_schema():
+    """Scores of one fiche section."""
+    return {
+        "type": "object",
+        "properties": {
+            "criteria": criteria_schema(),
+            "feedback": {"type": "string"}
+        },
+        "required": ["criteria", "feedback"]
+    }
+
+
+def question_schema(difficulty=None):
+    return {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "options": {
+                "type": "array",
+                "items": {"type": "string"},
+                "minItems": 4,
+                "maxItems": 4
+            },
+            "correctAnswer": {"type": "string"},
+            "explanation": {"type": "string"},
+            "difficulty": {"type": "string", "enum": [difficulty] if difficulty else DIFFICULTIES},
+            "points": {"type": "integer", "minimum": 1}
+        },
+        "required": ["question", "options", "correctAnswer", "explanation", "difficulty", "points"]
+    }
+
+
+def quiz_schema(question_count, difficulty=None):
+    """Quiz shape with exactly question_count questions of 4 options each."""
+    return {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "fiche": {"type": "string"},
+            "questions": {
+                "type": "array",
+                "items": question_schema(difficulty),
+                "minItems": question_count,
+                "maxItems": question_count
+            },
+            "config": {
+                "type": "object",
+                "properties": {
+                    "timeLimit": {"type": "integer"},
+                    "passingScore": {"type": "integer"},
+                    "shuffleQuestions": {"type": "boolean"},
+                    "showCorrectAnswers": {"type": "boolean"},
+                    "allowRetries": {"type": "boolean"}
+                }
+            }
+        },
+        "required": ["title", "fiche", "questions"]
+    }
+
+
+def _mode(constrained):
+    return "schema" if constrained else "prompt"
+
+
+def record_attempt(kind, constrained):
+    stats.incr(f"{kind}.{_mode(constrained)}.attempts")
+
+
+def record_response(kind, raw_response, constrained):
+    """Count responses and how many of them would need the JSON repair path."""
+    mode = _mode(constrained)
+    stats.incr(f"{kind}.{mode}.responses")
+    try:
+        json.loads(raw_response)
+    except (json.JSONDecodeError, TypeError):
+        stats.incr(f"{kind}.{mode}.repair_needed")
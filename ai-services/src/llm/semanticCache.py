@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional: the semantic cache stays off without it
+    np = None
+
+from src.llm.config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_MODEL,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL,
+    SEMANTIC_CACHE_PATH
+)
+from src.llm.metrics import metrics
+from src.llm.stats import stats
+from src.llm.structuredLog import get_logger
+
+logger = get_logger("semantic_cache")
+
+SIMILARITY_BUCKETS = (0.5, 0.8, 0.9, 0.95, 0.97, 0.98, 0.99, 0.995, 0.999, 1.0)
+# Inserts between two saves of the persisted index
+SAVE_EVERY = 32
+
+
+class SemanticCache:
+    """
+    Near-duplicate cache: results are stored next to the unit-length embedding
+    of their input, in one float32 matrix. A lookup is a single matrix-vector
+    product over every entry; the best match is returned when its cosine
+    similarity reaches `threshold`. Expired entries are never returned, and a
+    full cache overwrites its expired or least recently used row.
+
+    `namespace` identifies what produced the results (model, prompt, options);
+    a persisted index written under another namespace is discarded on load.
+    """
+
+    def __init__(self, namespace, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl=SEMANTIC_CACHE_TTL, path=SEMANTIC_CACHE_PATH, name="semantic_cache"):
+        self.namespace = namespace
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.name = name
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.expires_at = None
+        self.last_used = None
+        self.values = []
+        self.size = 0
+        self.unsaved = 0
+        if path:
+            self.load()
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, dimensions, capacity):
+        vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        expires_at = np.zeros(capacity, dtype=np.float64)
+        last_used = np.zeros(capacity, dtype=np.float64)
+        if self.size:
+            vectors[:self.size] = self.vectors[:self.size]
+            expires_at[:self.size] = self.expires_at[:self.size]
+            last_used[:self.size] = self.last_used[:self.size]
+        self.vectors, self.expires_at, self.last_used = vectors, expires_at, last_used
+
+    @staticmethod
+    def normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector):
+        """Return the cached value of the most similar live entry, or None below the threshold."""
+        query = self.normalize(vector)
+        with self.lock:
+            if not self.size or self.vectors.shape[1] != query.shape[0]:
+                stats.incr(f"{self.name}.misses")
+                return None
+            similarities = self.vectors[:self.size] @ query
+            now = time.time()
+            similarities[self.expires_at[:self.size] < now] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity >= 0:
+                metrics.observe("ai_services_semantic_cache_similarity", similarity, buckets=SIMILARITY_BUCKETS,
+                                help="Cosine similarity of the closest cached entry per lookup", cache=self.name)
+            if similarity < self.threshold:
+                stats.incr(f"{self.name}.misses")
+                return None
+            self.last_used[best] = now
+            stats.incr(f"{self.name}.hits")
+            return self.values[best]
+
+    async def put(self, vector, value):
+        """Store value under vector; every SAVE_EVERY inserts the index is saved in a thread."""
+        if self.add(vector, value):
+            await asyncio.to_thread(self.save)
+
+    def add(self, vector, value) -> bool:
+        """Store value under vector; True when enough inserts are unsaved to persist the index."""
+        vector = self.normalize(vector)
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+                # First entry, or the embedding model changed: start over
+                self.size = 0
+                self.values = []
+                self._allocate(vector.shape[0], min(64, self.max_entries))
+            if self.size < self.max_entries:
+                if self.size == len(self.vectors):
+                    self._allocate(vector.shape[0], min(2 * self.size, self.max_entries))
+                row = self.size
+                self.size += 1
+                self.values.append(value)
+            else:
+                # Expired entries first (their last use is pushed back), then the least recently used
+                now = time.time()
+                age = np.where(self.expires_at[:self.size] < now, -np.inf, self.last_used[:self.size])
+                row = int(np.argmin(age))
+                self.values[row] = value
+                stats.incr(f"{self.name}.evictions")
+            now = time.time()
+            self.vectors[row] = vector
+            self.expires_at[row] = now + self.ttl
+            self.last_used[row] = now
+            self.unsaved += 1
+            return bool(self.path) and self.unsaved >= SAVE_EVERY
+
+    def save(self):
+        """Write the index to `path` (atomically, through a temporary file)."""
+        if not self.path:
+            return
+        with self.lock:
+            if self.vectors is None:
+                return
+            vectors = self.vectors[:self.size].copy()
+            expires_at = self.expires_at[:self.size].copy()
+            last_used = self.last_used[:self.size].copy()
+            meta = json.dumps({"namespace": self.namespace, "values": self.values})
+            self.unsaved = 0
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, vectors=vectors, expires_at=expires_at, last_used=last_used, meta=np.array(meta))
+        os.replace(temporary, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                vectors = data["vectors"]
+                expires_at = data["expires_at"]
+                last_used = data["last_used"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Could not load the semantic cache", extra={"path": self.path, "error": str(e)})
+            return
+        if meta.get("namespace") != self.namespace:
+            logger.info("Semantic cache written by another model or prompt, starting empty", extra={"path": self.path})
+            return
+        # The most recently used live entries that fit
+        keep = np.flatnonzero(expires_at >= time.time())
+        keep = keep[np.argsort(last_used[keep])[::-1][:self.max_entries]]
+        if len(keep):
+            self._allocate(vectors.shape[1], len(keep))
+            self.vectors[:] = vectors[keep]
+            self.expires_at[:] = expires_at[keep]
+            self.last_used[:] = last_used[keep]
+            self.values = [meta["values"][i] for i in keep]
+            self.size = len(keep)
+        logger.info("Semantic cache loaded", extra={"path": self.path, "entries": self.size})
+
+    def info(self) -> dict:
+        return {
+            "entries": self.size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "model": SEMANTIC_CACHE_MODEL,
+            "path": self.path or None
+        }
+
+
+def namespace_for(*parts) -> str:
+    """Identify the model, prompt and options whose outputs a cache holds."""
+    payload = json.dumps([SEMANTIC_CACHE_MODEL, *parts], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_semantic_caches = {}
+_numpy_warned = False
+
+
+def get_semantic_cache(name, namespace):
+    """Return the process-wide semantic cache `name`, or None when it is disabled or NumPy is missing."""
+    global _numpy_warned
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if np is None:
+        if not _numpy_warned:
+            logger.warning("SEMANTIC_CACHE_ENABLED is set but NumPy is not installed; semantic cache disabled")
+            _numpy_warned = True
+        return None
+    cache = _semantic_caches.get(name)
+    if cache is None:
+        path = f"{SEMANTIC_CACHE_PATH}.{name}.npz" if SEMANTIC_CACHE_PATH else ""
+        cache = _semantic_caches[name] = SemanticCache(namespace, path=path, name=f"semantic_cache.{name}")
+    return cache
+
+
+def save_semantic_caches():
+    for cache in _semantic_caches.values():
+        cache.save()
+
+
+def semantic_cache_info() -> dict:
+    return {name: cache.info() for name, cache in _semantic_caches.items()}
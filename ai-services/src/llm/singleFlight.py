@@ -0,0 +1,51 @@
+import asyncio
+
+from src.llm.stats import stats
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs concurrent calls that share a key only once and hands every caller
+    the result. The call is cancelled once every caller has gone away.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+
+    async def do(self, key, func, name="llm"):
+        """Await func() unless an identical call is already running, then await that one."""
+        flight = self.inflight.get(key)
+        if flight is not None:
+            stats.incr(f"singleflight.{name}.coalesced")
+        else:
+            stats.incr(f"singleflight.{name}.executed")
+            flight = _Flight(asyncio.ensure_future(func()))
+            self.inflight[key] = flight
+            flight.task.add_done_callback(lambda done: self._forget(key, done))
+        flight.waiters += 1
+        try:
+            # Shielded so one caller going away does not cancel the call for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to read the result
+                stats.incr(f"singleflight.{name}.abandoned")
+                flight.task.cancel()
+
+    def _forget(self, key, task):
+        flight = self.inflight.get(key)
+        if flight is not None and flight.task is task:
+            del self.inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller has gone
+            task.exception()
+
+
+single_flight = SingleFlight()
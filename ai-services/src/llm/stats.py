@@ -0,0 +1,25 @@
+import threading
+from collections import defaultdict
+
+
+class Stats:
+    """Thread-safe named counters shared across the service."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+
+    def incr(self, name: str, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, name: str):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+stats = Stats()
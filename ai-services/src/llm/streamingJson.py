@@ -0,0 +1,211 @@
+import json
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+# Parser states
+BEFORE_OBJECT = 0
+EXPECT_KEY = 1
+IN_KEY = 2
+EXPECT_COLON = 3
+EXPECT_VALUE = 4
+IN_STRING_VALUE = 5
+IN_RAW_VALUE = 6
+DONE = 7
+
+
+class IncrementalObjectParser:
+    """
+    Incrementally parses the top-level JSON object of a streamed completion.
+
+    feed() returns a list of events as soon as they can be decided:
+      ("delta", key, text)  - decoded text of a string value listed in stream_keys
+      ("field", key, value) - a top-level field whose value is now complete
+    Anything before the first "{" (prose, code fences) is ignored.
+    """
+
+    def __init__(self, stream_keys=()):
+        self.stream_keys = set(stream_keys)
+        self.state = BEFORE_OBJECT
+        self.fields = {}
+        self.key = None
+        self.buffer = []
+        self.escape = None
+        self.raw_depth = 0
+        self.raw_in_string = False
+        self.raw_escape = False
+
+    @property
+    def done(self) -> bool:
+        return self.state == DONE
+
+    def feed(self, chunk: str):
+        events = []
+        pending_delta = []
+
+        for char in chunk:
+            state = self.state
+
+            if state == BEFORE_OBJECT:
+                if char == "{":
+                    self.state = EXPECT_KEY
+
+            elif state == EXPECT_KEY:
+                if char == '"':
+                    self.buffer = []
+                    self.escape = None
+                    self.state = IN_KEY
+                elif char == "}":
+                    self.state = DONE
+
+            elif state == IN_KEY:
+                text = self._read_string_char(char)
+                if text is None:
+                    self.key = "".join(self.buffer)
+                    self.state = EXPECT_COLON
+                else:
+                    self.buffer.append(text)
+
+            elif state == EXPECT_COLON:
+                if char == ":":
+                    self.state = EXPECT_VALUE
+
+            elif state == EXPECT_VALUE:
+                if char.isspace():
+                    continue
+                self.buffer = []
+                if char == '"':
+                    self.escape = None
+                    self.state = IN_STRING_VALUE
+                else:
+                    self.buffer.append(char)
+                    self.raw_depth = 1 if char in "{[" else 0
+                    self.raw_in_string = False
+                    self.raw_escape = False
+                    self.state = IN_RAW_VALUE
+
+            elif state == IN_STRING_VALUE:
+                text = self._read_string_char(char)
+                if text is None:
+                    if pending_delta:
+                        events.append(("delta", self.key, "".join(pending_delta)))
+                        pending_delta = []
+                    self._complete("".join(self.buffer), events)
+                elif text:
+                    self.buffer.append(text)
+                    if self.key in self.stream_keys:
+                        pending_delta.append(text)
+
+            elif state == IN_RAW_VALUE:
+                self._read_raw_char(char, events)
+
+            if self.state == DONE:
+                break
+
+        if pending_delta:
+            events.append(("delta", self.key, "".join(pending_delta)))
+        return events
+
+    def _read_string_char(self, char):
+        """Return decoded text for char, "" while inside an escape, None at the closing quote."""
+        if self.escape is not None:
+            if self.escape == "":
+                if char == "u":
+                    self.escape = "u"
+                    return ""
+                self.escape = None
+                return _ESCAPES.get(char, char)
+            # Collecting the four hex digits of a \uXXXX escape
+            self.escape += char
+            if len(self.escape) < 5:
+                return ""
+            code = self.escape[1:]
+            self.escape = None
+            try:
+                return chr(int(code, 16))
+            except ValueError:
+                return ""
+        if char == "\\":
+            self.escape = ""
+            return ""
+        if char == '"':
+            return None
+        return char
+
+    def _read_raw_char(self, char, events):
+        """Accumulate a number, literal, object or array value until it ends."""
+        if self.raw_depth == 0:
+            # Scalar literal: ends at the next delimiter
+            if char in ",}" or char.isspace():
+                self._complete_raw(events)
+                if char == "}":
+                    self.state = DONE
+                return
+            self.buffer.append(char)
+            return
+
+        self.buffer.append(char)
+        if self.raw_in_string:
+            if self.raw_escape:
+                self.raw_escape = False
+            elif char == "\\":
+                self.raw_escape = True
+            elif char == '"':
+                self.raw_in_string = False
+        elif char == '"':
+            self.raw_in_string = True
+        elif char in "{[":
+            self.raw_depth += 1
+        elif char in "}]":
+            self.raw_depth -= 1
+            if self.raw_depth == 0:
+                self._complete_raw(events)
+
+    def _complete_raw(self, events):
+        raw = "".join(self.buffer)
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        self._complete(value, events)
+
+    def _complete(self, value, events):
+        self.fields[self.key] = value
+        events.append(("field", self.key, value))
+        self.buffer = []
+        self.state = EXPECT_KEY
+
+
+class JsonEndDetector:
+    """
+    Finds where the first top-level JSON object or array of a streamed
+    completion ends, so generation can stop there. Text before it is skipped.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.done = False
+
+    def feed(self, chunk: str):
+        """Return the index in chunk just past the end of the value, or None while it continues."""
+        for index, char in enumerate(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char in "{[":
+                self.depth += 1
+            elif self.depth == 0:
+                continue
+            elif char == '"':
+                self.in_string = True
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.done = True
+                    return index + 1
+        return None
@@ -0,0 +1,134 @@
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from src.llm.config import LOG_LEVEL, LOG_FORMAT, LOG_PAYLOAD_MAX_CHARS, LOG_PAYLOAD_SAMPLING
+
+# Set per request by the HTTP middleware
+_request_id = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener = None
+
+
+def set_request_id(request_id):
+    _request_id.set(request_id)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request ID while still on the request's task."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname:7} {record.name}"
+        if getattr(record, "request_id", None):
+            line += f" [{record.request_id}]"
+        line += f" {record.getMessage()}"
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS}
+        payload = fields.pop("payload", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if payload is not None:
+            line += f"\n{payload}"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Formatting happens on the listener thread; only make the record safe to hand over
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging():
+    """
+    Route the service's loggers through a queue to a background writer thread,
+    so request handlers never block on stdout.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger("ai_services")
+    root.setLevel(LOG_LEVEL)
+    root.handlers[:] = [handler]
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"ai_services.{name}")
+
+
+def log_payload(logger, level, msg, payload, **fields):
+    """
+    Log an LLM payload, sampled per level (LOG_PAYLOAD_SAMPLING) and cut to
+    LOG_PAYLOAD_MAX_CHARS. The message is still logged when the payload is
+    sampled out, so failures stay visible.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    text = payload if isinstance(payload, str) else str(payload)
+    fields["payload_chars"] = len(text)
+    rate = LOG_PAYLOAD_SAMPLING.get(logging.getLevelName(level), 1.0)
+    if rate >= 1.0 or random.random() < rate:
+        if len(text) > LOG_PAYLOAD_MAX_CHARS:
+            text = text[:LOG_PAYLOAD_MAX_CHARS] + f"... [{len(text) - LOG_PAYLOAD_MAX_CHARS} more chars]"
+        fields["payload"] = text
+    logger.log(level, msg, extra=fields)
@@ -0,0 +1,74 @@
+import re
+
+# Rough llama tokenizer ratio for English/French prose
+CHARS_PER_TOKEN = 4
+
+_HEADING = re.compile(r"^(#{1,6}\s+\S.*|[0-9]+(\.[0-9]+)*[.)]\s+\S.*|[A-Z][A-Z0-9 ,'&:-]{3,80})$")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def split_sections(text: str):
+    """Split text into heading-led sections, falling back to blank-line paragraphs."""
+    sections = []
+    current = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and _HEADING.match(stripped) and current:
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current).strip())
+    sections = [s for s in sections if s]
+
+    if len(sections) <= 1:
+        sections = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    return sections
+
+
+def _split_oversized(block: str, max_tokens: int):
+    """Break a block that is too big on its own: paragraphs, then sentences, then characters."""
+    pieces = [p.strip() for p in re.split(r"\n\s*\n", block) if p.strip()]
+    if len(pieces) <= 1:
+        pieces = [s for s in _SENTENCE_END.split(block) if s.strip()]
+
+    result = []
+    for piece in pieces:
+        if estimate_tokens(piece) <= max_tokens:
+            result.append(piece)
+            continue
+        if len(pieces) > 1:
+            result.extend(_split_oversized(piece, max_tokens))
+            continue
+        width = max_tokens * CHARS_PER_TOKEN
+        result.extend(piece[i:i + width] for i in range(0, len(piece), width))
+    return result
+
+
+def split_into_chunks(text: str, max_tokens: int):
+    """Greedily pack sections into chunks of at most max_tokens estimated tokens."""
+    blocks = []
+    for section in split_sections(text):
+        if estimate_tokens(section) > max_tokens:
+            blocks.extend(_split_oversized(section, max_tokens))
+        else:
+            blocks.append(section)
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_chars = 0
+    for block in blocks:
+        if current and current_chars + 2 + len(block) > max_chars:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_chars = 0
+        current_chars += len(block) + (2 if current else 0)
+        current.append(block)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
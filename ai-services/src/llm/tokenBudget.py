@@ -0,0 +1,93 @@
+import math
+
+from src.llm.config import (
+    GENERATION_OPTIONS,
+    LLM_ADAPTIVE_NUM_PREDICT,
+    LLM_NUM_CTX,
+    LLM_NUM_PREDICT_MARGIN,
+    LLM_NUM_PREDICT_MIN,
+    LLM_NUM_PREDICT_MAX
+)
+
+# Approximate size in tokens of well-formed responses for each schema
+QUIZ_OVERHEAD_TOKENS = 120          # title, fiche id and config block
+QUIZ_TOKENS_PER_QUESTION = 160      # question, 4 options, answer, explanation
+FICHE_BASE_TOKENS = 1000            # title, classification and the four-section fiche skeleton
+FICHE_TOKENS_PER_INPUT_TOKEN = 0.5  # the Markdown content grows with the source text
+EVALUATION_TOKENS = 300             # fixed-size scores and a feedback paragraph
+EVALUATION_METADATA_TOKENS = 100    # title and classification
+SECTION_EVALUATION_TOKENS = 100     # four scores and a sentence or two of feedback
+FICHE_REVIEW_TOKENS = 200           # scores and a feedback paragraph, without metadata
+CHUNK_SUMMARY_TOKENS = 700          # notes of one chunk of a long text
+
+# Share of LLM_NUM_CTX prompts and outputs are sized to: estimate_tokens is approximate
+CONTEXT_SAFETY = 0.9
+
+
+def num_predict(expected_tokens: float) -> int:
+    """Token cap for a response of about expected_tokens, with headroom for verbose answers."""
+    if not LLM_ADAPTIVE_NUM_PREDICT:
+        return GENERATION_OPTIONS["num_predict"]
+    budget = math.ceil(expected_tokens * LLM_NUM_PREDICT_MARGIN)
+    return max(LLM_NUM_PREDICT_MIN, min(LLM_NUM_PREDICT_MAX, budget))
+
+
+def quiz_num_predict(question_count: int) -> int:
+    return num_predict(QUIZ_OVERHEAD_TOKENS + QUIZ_TOKENS_PER_QUESTION * max(1, question_count))
+
+
+def fiche_num_predict(input_tokens: int) -> int:
+    return num_predict(FICHE_BASE_TOKENS + FICHE_TOKENS_PER_INPUT_TOKEN * input_tokens)
+
+
+def evaluation_num_predict() -> int:
+    return num_predict(EVALUATION_TOKENS)
+
+
+def evaluation_metadata_num_predict() -> int:
+    return num_predict(EVALUATION_METADATA_TOKENS)
+
+
+def section_evaluation_num_predict() -> int:
+    return num_predict(SECTION_EVALUATION_TOKENS)
+
+
+def fiche_review_num_predict() -> int:
+    return num_predict(FICHE_REVIEW_TOKENS)
+
+
+def truncated(result) -> bool:
+    """Whether a chat result stopped at num_predict, i.e. its output is cut off."""
+    return result.get("done_reason") == "length"
+
+
+def context_tokens() -> int:
+    """Tokens of LLM_NUM_CTX a prompt and its output may use together."""
+    return int(LLM_NUM_CTX * CONTEXT_SAFETY)
+
+
+def fiche_text_tokens(prompt_tokens: int, limit: int = 0) -> int:
+    """
+    Largest source text, in tokens, whose fiche prompt (prompt_tokens without
+    the text) and output budget fit in the context; at most limit when set.
+    """
+    room = context_tokens() - prompt_tokens
+    low, high = 0, max(0, room)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if middle + fiche_num_predict(middle) <= room:
+            low = middle
+        else:
+            high = middle - 1
+    return min(low, limit) if limit > 0 else low
+
+
+def chunk_text_tokens(prompt_tokens: int, limit: int) -> int:
+    """Chunk size for the map step of a long text: limit, if its summary call fits in the context."""
+    return max(1, min(limit, context_tokens() - prompt_tokens - CHUNK_SUMMARY_TOKENS))
+
+
+def retry_num_predict(previous: int, prompt_tokens: int) -> int:
+    """Larger budget for retrying a response cut off at previous tokens, within the context."""
+    budget = min(max(LLM_NUM_PREDICT_MAX, previous), max(previous * 2, GENERATION_OPTIONS["num_predict"]))
+    return max(previous, min(budget, context_tokens() - prompt_tokens))
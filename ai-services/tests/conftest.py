@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Configuration is read at import time: keep the tests off real servers and files
+os.environ.setdefault("OLLAMA_HOSTS", "http://127.0.0.1:9")
+os.environ.setdefault("LLM_HEALTH_INTERVAL", "0")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+os.environ.setdefault("QUESTION_BANK_DB", "")
+os.environ.setdefault("JOB_DB", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,15 @@
+from src.llm import extractiveSummary
+from src.llm.textChunker import CHARS_PER_TOKEN
+
+TEXT = "\n\n".join(f"Paragraph {i} explains a different step of cell division in detail." for i in range(200))
+
+
+def test_summary_without_numpy_is_cut_to_its_budget(monkeypatch):
+    monkeypatch.setattr(extractiveSummary, "np", None)
+    extractiveSummary.summarize.cache_clear()
+    try:
+        summary = extractiveSummary.summarize(TEXT, 100)
+    finally:
+        extractiveSummary.summarize.cache_clear()
+    assert len(summary) == 100 * CHARS_PER_TOKEN
+    assert TEXT.startswith(summary)
@@ -0,0 +1,44 @@
+import asyncio
+
+from src.jobs.jobQueue import DONE, QUEUED, JobQueue, JobStore
+
+PAYLOAD = {"fiche_content": "# Cells\n## Mitosis\nCells divide."}
+
+
+def test_identical_jobs_merge_while_queued_or_running(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    first, created, _ = store.submit("evaluation", PAYLOAD, True)
+    assert created
+    assert store.submit("evaluation", PAYLOAD, True)[:2] == (first, False)
+    store.claim()
+    assert store.submit("evaluation", PAYLOAD, True)[:2] == (first, False)
+
+
+def test_finished_jobs_are_not_reused(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    first, _, _ = store.submit("evaluation", PAYLOAD, True)
+    store.claim()
+    store.finish(first, DONE, {"qualityScore": {"score": 0, "feedback": "Evaluation failed"}})
+    second, created, _ = store.submit("evaluation", PAYLOAD, True)
+    assert created and second != first
+
+
+def test_closing_the_queue_requeues_running_jobs(tmp_path):
+    async def scenario():
+        running = asyncio.Event()
+
+        async def handler(payload, use_cache):
+            running.set()
+            await asyncio.sleep(10)
+
+        queue = JobQueue({"evaluation": ("/evaluate-fiche", handler)}, path=str(tmp_path / "jobs.db"), workers=1)
+        queue.start()
+        job_id, _ = await queue.submit("evaluation", PAYLOAD, True)
+        await asyncio.wait_for(running.wait(), 5)
+        store = queue.store
+        await queue.close()
+        return store.get(job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == QUEUED
+    assert job["attempts"] == 0
@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import main
+
+FICHE = {"domain": "biology", "difficulty": "easy", "text": "Cells divide by mitosis."}
+QUIZ_BATCH = [{"question_count": 2, "difficulty": "easy", "fiche_content": "Cells divide.",
+               "fiche_title": "Cells", "fiche_id": "f1"}]
+STREAMS = (
+    ("/generate-fiche/stream", FICHE),
+    ("/generate-evaluated-fiche/stream", FICHE),
+    ("/create-quiz/batch", QUIZ_BATCH),
+)
+
+
+def post(path, payload, sent, disconnect=None):
+    """
+    Run a POST through the ASGI app, recording what it sends. The client
+    disconnects once `disconnect` is set.
+    """
+    body = json.dumps(payload).encode()
+    requests = [{"type": "http.request", "body": body, "more_body": False}]
+    disconnect = disconnect or asyncio.Event()
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 8000),
+    }
+    return asyncio.create_task(main.app(scope, receive, send))
+
+
+async def settle():
+    """Give cancelled tasks the event loop turns they need to unwind."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_stream_disconnected_before_its_first_chunk_releases_its_admission_slot(monkeypatch):
+    acquire = main.admission.acquire
+
+    async def scenario():
+        try:
+            for path, payload in STREAMS:
+                sent = []
+                disconnect = asyncio.Event()
+
+                def acquire_then_disconnect(*args):
+                    # The client goes away as soon as the stream is admitted
+                    disconnect.set()
+                    return acquire(*args)
+
+                monkeypatch.setattr(main.admission, "acquire", acquire_then_disconnect)
+                await post(path, payload, sent, disconnect)
+                await settle()
+                assert not sent, path
+                assert main.admission.in_flight == 0, path
+        finally:
+            await main.close_llm_client()
+
+    asyncio.run(scenario())
+
+
+def test_stream_over_the_admission_limit_gets_429():
+    async def scenario():
+        queue_limit = main.admission.queue_limit
+        main.admission.queue_limit = 0
+        main.admission.in_flight = main.admission.slots()
+        try:
+            sent = []
+            request = post("/generate-fiche/stream", FICHE, sent)
+            while not sent and not request.done():
+                await asyncio.sleep(0.001)
+            request.cancel()
+            await asyncio.gather(request, return_exceptions=True)
+            return sent[0]
+        finally:
+            main.admission.queue_limit = queue_limit
+            main.admission.in_flight = 0
+            await main.close_llm_client()
+
+    start = asyncio.run(scenario())
+    assert start["status"] == 429
+    assert (b"retry-after", b"1") in start["headers"]
+
+
+def test_batch_item_that_fell_back_is_reported_as_failed():
+    async def scenario():
+        try:
+            sent = []
+            # No model server answers: the quiz falls back to its placeholder
+            await post("/create-quiz/batch", QUIZ_BATCH, sent)
+            return b"".join(message.get("body", b"") for message in sent)
+        finally:
+            await main.close_llm_client()
+
+    failed = main.stats.snapshot().get("quiz_batch.failed", 0)
+    body = asyncio.run(scenario())
+    events = [json.loads(line) for line in body.splitlines()]
+    assert [event["event"] for event in events] == ["error", "done"]
+    assert "Quiz" not in events[0]
+    assert events[1]["failed"] == 1
+    assert main.stats.snapshot()["quiz_batch.failed"] == failed + 1
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+from ollama import ChatResponse, Message
+
+from src.creation import generateFiche
+from src.llm.hedging import HedgePolicy
+from src.llm.ollamaClient import LLMClient
+from src.llm.resilience import CLOSED, HALF_OPEN, OPEN
+from src.llm.stats import stats
+
+MODEL = "test-model"
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class SlowClient:
+    """Stands in for ollama.AsyncClient: answers after `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def chat(self, model, messages, options=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return {"model": model, "message": {"role": "assistant", "content": "{}"}, "done": True}
+
+    async def close(self):
+        pass
+
+
+def half_open(backend):
+    """Eject the backend with an elapsed reset delay: its next call is the probe."""
+    backend.breaker.reset_timeout = 0
+    backend.breaker.trip()
+
+
+def make_client(*delays):
+    client = LLMClient(hosts=[(f"http://backend{i}:11434", None) for i in range(len(delays))])
+    for backend, delay in zip(client.pool.backends, delays):
+        backend.client = SlowClient(delay)
+    return client
+
+
+def test_probe_cancelled_by_its_caller_is_released_unrecorded():
+    async def scenario():
+        client = make_client(1.0)
+        backend = client.pool.backends[0]
+        half_open(backend)
+        call = asyncio.create_task(client.chat(model=MODEL, messages=MESSAGES))
+        await asyncio.sleep(0.05)
+        assert backend.breaker.state == HALF_OPEN and not backend.breaker.can_call()
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        return backend
+
+    backend = asyncio.run(scenario())
+    # Nothing was learned: still half-open, and the next call may probe
+    assert backend.breaker.state == HALF_OPEN
+    assert backend.breaker.can_call()
+    assert backend.outstanding == 0
+
+
+def test_probe_beaten_by_the_primary_call_reopens_the_circuit():
+    async def scenario():
+        client = make_client(0.1, 1.0)
+        healthy, probing = client.pool.backends
+        half_open(probing)
+        client.hedging = HedgePolicy(enabled=True, min_delay=0.01, min_samples=1, max_ratio=1)
+        client.hedging.observe("", 0.01)
+        result = await client.chat(model=MODEL, messages=MESSAGES)
+        await asyncio.sleep(0)
+        return result, healthy, probing
+
+    result, healthy, probing = asyncio.run(scenario())
+    assert result["done"]
+    assert healthy.breaker.state == CLOSED
+    assert probing.breaker.state == OPEN
+    assert probing.outstanding == 0
+
+
+class StreamingClient:
+    """Stands in for ollama.AsyncClient's streamed chat: one list of ChatResponse chunks per call."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.options = []
+
+    async def chat(self, model, messages, options=None, stream=False, **kwargs):
+        self.options.append(options)
+        chunks = self.replies.pop(0)
+
+        async def parts():
+            for content, done_reason in chunks:
+                yield ChatResponse(model=model, message=Message(role="assistant", content=content),
+                                   done=done_reason is not None, done_reason=done_reason, eval_count=len(chunks))
+
+        return parts()
+
+    async def close(self):
+        pass
+
+
+def test_fiche_cut_off_mid_stream_is_retried_with_a_larger_budget(monkeypatch):
+    fiche = {
+        "title": "Cells", "content": "# Cells\n\nCells divide by mitosis.",
+        "classification": {"domain": "biology", "difficulty": "easy", "topics": ["mitosis"],
+                           "estimatedStudyTime": "5 minutes"},
+    }
+    backend_client = StreamingClient(
+        # Stopped by num_predict in the middle of the object
+        [('{"title": "Cells", ', None), ('"content": "# Ce', "length")],
+        [(json.dumps(fiche), None), ("", "stop")],
+    )
+    client = make_client(0)
+    client.pool.backends[0].client = backend_client
+    monkeypatch.setattr(generateFiche, "get_llm_client", lambda: client)
+    monkeypatch.setattr(generateFiche, "LLM_SCHEMA_MODE", False)
+
+    generator = generateFiche.LlamaFicheGenerator("biology", "easy", "Cells divide by mitosis.")
+    before = stats.snapshot().get("fiche.truncated_retries", 0)
+    result = asyncio.run(generator.generate_fiche(use_cache=False))
+
+    assert stats.snapshot()["fiche.truncated_retries"] == before + 1
+    first, retry = backend_client.options
+    assert retry["num_predict"] > first["num_predict"]
+    assert result["title"] == "Cells"